@@ -24,7 +24,6 @@ admin.site.register(AcademicYear)
 admin.site.register(Term)
 admin.site.register(Course)
 admin.site.register(UserCourseGroupEnrollment)
-admin.site.register(Quest)
 admin.site.register(Question)
 admin.site.register(Answer)
 admin.site.register(UserAnswerAttempt)
@@ -36,3 +35,14 @@ admin.site.register(Image)
 admin.site.register(Document)
 
 
+@admin.action(description="Expire selected active quests and award their badges")
+def expire_quests(modeladmin, request, queryset):
+    quest_ids = queryset.expire()
+    modeladmin.message_user(request, f"{len(quest_ids)} quests expired")
+
+
+@admin.register(Quest)
+class QuestAdmin(admin.ModelAdmin):
+    actions = [expire_quests]
+
+
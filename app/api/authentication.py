@@ -1,15 +1,21 @@
 import jwt
-import requests
 import pytz
 from datetime import datetime
 from rest_framework_simplejwt.authentication import JWTAuthentication
 from rest_framework.authentication import SessionAuthentication
 from rest_framework.exceptions import AuthenticationFailed
 from django.conf import settings
+from django.core.cache import cache
+from .jwks import jwks_key_store, JWKSFetchError
+from .token_cache import verified_token_cache
 from .models import EduquestUser
 from .utils import split_full_name
 
 
+def auth_user_cache_key(email):
+    return f"auth_user:{email.upper()}"
+
+
 class CustomJWTAuthentication(JWTAuthentication):
 
     def authenticate(self, request):
@@ -33,6 +39,11 @@ class CustomJWTAuthentication(JWTAuthentication):
             raise AuthenticationFailed(f"Unexpected error: {str(e)}")
 
     def get_validated_token(self, raw_token):
+        # The same token is sent on every request of a session, skip the signature check if already validated
+        cached_token = verified_token_cache.get(raw_token)
+        if cached_token is not None:
+            return cached_token
+
         try:
             # Decode the token without verification to get the payload
             unverified_header = jwt.get_unverified_header(raw_token)
@@ -41,19 +52,17 @@ class CustomJWTAuthentication(JWTAuthentication):
             issuer = unverified_payload.get('iss')
             tenant_id = unverified_payload.get('tid')
 
-            # Fetch the public keys from the Azure AD endpoint
-            jwks_url = f"https://login.microsoftonline.com/{tenant_id}/discovery/v2.0/keys"
-            response = requests.get(jwks_url)
-            if response.status_code != 200:
+            # Get the public key from the cached Azure AD signing keys
+            try:
+                public_key = jwks_key_store.get_public_key(tenant_id, unverified_header.get('kid'))
+            except JWKSFetchError:
                 raise AuthenticationFailed('Failed to fetch public keys from Azure AD.')
-
-            # The keys are used to verify the token signature
-            keys = response.json().get('keys')
-            key = next(k for k in keys if k['kid'] == unverified_header['kid'])
-            public_key = jwt.algorithms.RSAAlgorithm.from_jwk(key)
+            if public_key is None:
+                raise AuthenticationFailed('No matching public key found for the token.')
 
             # Validate the token using the public key
             decoded_token = jwt.decode(raw_token, key=public_key, algorithms=["RS256"], audience=settings.AZURE_CLIENT_ID)
+            verified_token_cache.set(raw_token, decoded_token)
             return decoded_token
         except jwt.ExpiredSignatureError:
             raise AuthenticationFailed('Token has expired, please authenticate again.')
@@ -85,24 +94,29 @@ class CustomJWTAuthentication(JWTAuthentication):
             utc_timezone = pytz.utc
             last_login = sgt_datetime.astimezone(utc_timezone)
 
-            user, created = EduquestUser.objects.get_or_create(
-                email=email.upper(),
-                defaults={
-                    'email': email.upper(),
-                    'username': username,
-                    'nickname': username,
-                    'first_name': first_name,
-                    'last_name': last_name,
-                    'last_login': last_login,
-                    'is_staff': is_staff
-                }
-            )
-            if created:
-                # Here you can add any additional setup for the new user
-                pass
-            else:
+            # Serve the user from the cache, the users table is only read once per TTL
+            user = cache.get(auth_user_cache_key(email))
+            if user is None:
+                user, created = EduquestUser.objects.get_or_create(
+                    email=email.upper(),
+                    defaults={
+                        'email': email.upper(),
+                        'username': username,
+                        'nickname': username,
+                        'first_name': first_name,
+                        'last_name': last_name,
+                        'last_login': last_login,
+                        'is_staff': is_staff
+                    }
+                )
+                cache.set(auth_user_cache_key(email), user, settings.AUTH_USER_CACHE_TTL)
+
+            # last_login only changes when a new token is issued, so only write it when it moves forward.
+            # Use update() to avoid a full save, which would also bump updated_at.
+            if user.last_login is None or user.last_login < last_login:
+                EduquestUser.objects.filter(pk=user.pk).update(last_login=last_login)
                 user.last_login = last_login
-                user.save()
+                cache.set(auth_user_cache_key(email), user, settings.AUTH_USER_CACHE_TTL)
 
             return user
         except Exception as e:
@@ -0,0 +1,118 @@
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+from .models import Badge, UserCourseBadge, UserQuestBadge
+
+BATCH_SIZE = 1000
+
+
+class BadgeCatalogue:
+    """
+    In-process cache of all badges with their image, keyed by name and by id.
+    Badges rarely change, so the catalogue is loaded with one query and kept until a badge
+    or its image is saved or deleted in this process (see signals.py), or until BADGE_CATALOGUE_TTL has passed.
+    Looking up an unknown name reloads the catalogue once before giving up, so that badges created
+    by another process are found without waiting for the TTL.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_name = None
+        self._by_id = None
+        self._loaded_at = 0
+
+    def get(self, name):
+        """
+        Return the badge with the given name, raise Badge.DoesNotExist like Badge.objects.get(name=name)
+        """
+        badge = self._load()[0].get(name)
+        if badge is None:
+            badge = self._load(force=True)[0].get(name)
+        if badge is None:
+            raise Badge.DoesNotExist(f"Badge '{name}' does not exist.")
+        return badge
+
+    def get_by_id(self, badge_id):
+        badge = self._load()[1].get(badge_id)
+        if badge is None:
+            badge = self._load(force=True)[1].get(badge_id)
+        if badge is None:
+            raise Badge.DoesNotExist(f"Badge with id {badge_id} does not exist.")
+        return badge
+
+    def all(self):
+        return list(self._load()[1].values())
+
+    def uses_image(self, image_id):
+        """
+        Return whether a loaded badge shows the given image, without loading the catalogue
+        """
+        with self._lock:
+            return self._by_id is not None and any(badge.image_id == image_id for badge in self._by_id.values())
+
+    def clear(self):
+        with self._lock:
+            self._by_name = None
+            self._by_id = None
+
+    def _load(self, force=False):
+        with self._lock:
+            expired = time.monotonic() - self._loaded_at > getattr(settings, 'BADGE_CATALOGUE_TTL', 300)
+            if force or self._by_id is None or expired:
+                badges = list(Badge.objects.select_related('image').order_by('id'))
+                self._by_name = {badge.name: badge for badge in badges}
+                self._by_id = {badge.id: badge for badge in badges}
+                self._loaded_at = time.monotonic()
+            return self._by_name, self._by_id
+
+
+badge_catalogue = BadgeCatalogue()
+
+
+def award_quest_badge(badge, user_quest_attempt_ids):
+    """
+    Award a badge to many quest attempts with one INSERT ... ON CONFLICT DO NOTHING per batch.
+    Attempts that already have the badge are skipped by the unique constraint, which also makes
+    concurrent awards of the same badge safe.
+    Returns the ids of the attempts that were newly awarded the badge.
+    """
+    return _insert_awards(UserQuestBadge, 'user_quest_attempt', badge, user_quest_attempt_ids)
+
+
+def award_course_badge(badge, user_course_group_enrollment_ids):
+    """
+    Award a badge to many course group enrollments, see award_quest_badge.
+    Returns the ids of the enrollments that were newly awarded the badge.
+    """
+    return _insert_awards(UserCourseBadge, 'user_course_group_enrollment', badge, user_course_group_enrollment_ids)
+
+
+def _insert_awards(model, field_name, badge, ids):
+    # bulk_create(ignore_conflicts=True) cannot tell which rows were inserted, RETURNING does
+    ids = list(dict.fromkeys(ids))
+    quote_name = connection.ops.quote_name
+    table = quote_name(model._meta.db_table)
+    badge_column = quote_name(model._meta.get_field('badge').column)
+    target_column = quote_name(model._meta.get_field(field_name).column)
+    date_column = quote_name(model._meta.get_field('awarded_date').column)
+    awarded_date = timezone.now()
+
+    awarded_ids = []
+    with connection.cursor() as cursor:
+        for start in range(0, len(ids), BATCH_SIZE):
+            batch = ids[start:start + BATCH_SIZE]
+            params = []
+            for target_id in batch:
+                params.extend([badge.id, target_id, awarded_date])
+            values = ', '.join(['(%s, %s, %s)'] * len(batch))
+            cursor.execute(
+                f"INSERT INTO {table} ({badge_column}, {target_column}, {date_column}) VALUES {values} "
+                f"ON CONFLICT DO NOTHING RETURNING {target_column}",
+                params
+            )
+            awarded_ids.extend(row[0] for row in cursor.fetchall())
+    return awarded_ids
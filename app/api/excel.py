@@ -1,3 +1,4 @@
+import openpyxl
 import pandas as pd
 import re
 
@@ -5,61 +6,156 @@ import re
 class Excel():
     help = 'Import quiz results from Excel file'
 
+    # Columns of the main results sheet: #, Username, First name, Last name, Email, one column per question, Total
+    EMAIL_COLUMN = 4
+    FIRST_QUESTION_COLUMN = 5
+
     def __init__(self):
-        self.xls = None
         self.sheets = None
         self.main_results_sheet = None
+        self.question_sheets = []
         self.user_list = []
         self.question_list = []
         self.question_type_mapping_list = []
+        self.user_row_count = 0
+        self.email_index = {}
+        self.answer_matchers = []
 
     def read_excel_sheets(self, excel_file):
-        self.xls = pd.ExcelFile(excel_file, engine='openpyxl')
-        self.sheets = self.xls.sheet_names
-        self.main_results_sheet = pd.read_excel(self.xls, sheet_name=self.xls.sheet_names[0])
+        """
+        Read the workbook once in read-only mode, keeping the main results sheet as a DataFrame and only the
+        cells get_questions needs from each question sheet, see read_question_sheet.
+        """
+        workbook = openpyxl.load_workbook(excel_file, read_only=True, data_only=True)
+        try:
+            self.sheets = workbook.sheetnames
+            self.question_sheets = []
+            for index, worksheet in enumerate(workbook.worksheets):
+                # Question sheets only need their first two columns
+                rows = worksheet.iter_rows(max_col=None if index == 0 else 2, values_only=True)
+                # Empty strings are empty cells, as with pd.read_excel
+                rows = (tuple(None if cell == '' else cell for cell in row) for row in rows)
+                if index == 0:
+                    rows = list(rows)
+                    header = rows[0] if rows else ()
+                    self.main_results_sheet = pd.DataFrame(rows[1:], columns=header)
+                    rows = iter(rows)
+                # Skip 'Main results' and 'Wall' sheets
+                if worksheet.title not in ['Main results', 'Wall']:
+                    self.question_sheets.append(self.read_question_sheet(worksheet.title, rows))
+        finally:
+            workbook.close()
+        self.build_email_index()
+
+    @staticmethod
+    def read_question_sheet(sheet_name, rows):
+        """
+        Extract the question text (cell A1), whether it is a MCQ (cell A3 is 'Choice'), its answer options
+        (column A from row 4 to the first empty cell) and its 'Maximum score' (column B of that row).
+        Reading stops at the 'Maximum score' row, the rest of the sheet holds statistics only.
+        """
+        sheet = {'sheet_name': sheet_name, 'text': 'Unnamed: 0', 'is_mcq': False, 'max_score': None, 'answers': []}
+        options_ended = False
+        for row_number, row in enumerate(rows, start=1):
+            first_cell = row[0] if row else None
+            if row_number == 1:
+                if first_cell is not None:
+                    sheet['text'] = first_cell
+            elif row_number == 3:
+                if first_cell != 'Choice':
+                    break
+                sheet['is_mcq'] = True
+            elif row_number > 3:
+                if first_cell is None:
+                    options_ended = True
+                elif not options_ended:
+                    sheet['answers'].append(first_cell)
+                if first_cell == 'Maximum score':
+                    sheet['max_score'] = row[1] if len(row) > 1 else None
+                    break
+        return sheet
+
+    def build_email_index(self):
+        """
+        Map every upper-cased email to its rows in the main results sheet, so that the answers of a user
+        are found without scanning the sheet. User rows end at the first row without a number in the
+        first column, e.g. the 'Average' row.
+        """
+        self.email_index = {}
+        sheet = self.main_results_sheet
+        if sheet.shape[1] <= self.EMAIL_COLUMN:
+            self.user_row_count = 0
+            return
+        null_rows = sheet.iloc[:, 0].isnull().to_numpy()
+        self.user_row_count = int(null_rows.argmax()) if null_rows.any() else len(null_rows)
+        emails = sheet.iloc[:self.user_row_count, self.EMAIL_COLUMN]
+        for row, email in enumerate(emails):
+            if isinstance(email, str):
+                self.email_index.setdefault(email.upper(), []).append(row)
+
+    def build_answer_matchers(self):
+        """
+        Pair every MCQ column of the main results sheet with its question and a regex matching any of
+        its answer options, compiled once instead of for every user.
+        Longer answers come first in the alternation, so that an answer is not matched by one of its prefixes.
+        """
+        self.answer_matchers = []
+        # The last column holds the total score
+        last_question_column = len(self.main_results_sheet.columns) - 1
+        mcq_questions = iter(self.question_list)
+        for offset, question_type in enumerate(self.question_type_mapping_list):
+            if not question_type['is_mcq']:
+                continue
+            question = next(mcq_questions, None)
+            column = self.FIRST_QUESTION_COLUMN + offset
+            if question is None or column >= last_question_column:
+                break
+            escaped_possible_answers = [re.escape(str(answer['text'])) for answer in question['answers']]
+            escaped_possible_answers.sort(key=len, reverse=True)
+            pattern = re.compile(r'(' + '|'.join(escaped_possible_answers) + r')')
+            self.answer_matchers.append((column, question, pattern))
+
+    @staticmethod
+    def parse_selected_answers(cell, pattern):
+        """
+        Return the answer options selected in a cell of the main results sheet, without duplicates and in order.
+        '/' means the question was not attempted, 'V - ' and 'X - ' prefix the selection of a question with
+        correct answer(s).
+        """
+        if not isinstance(cell, str):
+            if pd.isnull(cell):
+                return []
+            cell = str(cell)
+        if cell[:1] == '/':
+            return []
+        if cell[:4] == 'V - ' or cell[:4] == 'X - ':
+            cell = cell[4:]
+        return list(dict.fromkeys(pattern.findall(cell.strip())))
 
     def get_questions(self):
         print("Getting Questions: Starting...")
         number = 1
-        for sheet_name in self.sheets:
-            # Skip 'Main results' and 'Wall' sheets
-            if sheet_name in ['Main results', 'Wall']:
-                continue
-
-            df = pd.read_excel(self.xls, sheet_name=sheet_name)
-            num_rows = df.shape[0]
-            print(f"Getting Questions: Sheet: {sheet_name}, Number of rows: {num_rows}")
+        for sheet in self.question_sheets:
+            sheet_name = sheet['sheet_name']
+            print(f"Getting Questions: Sheet: {sheet_name}, Number of answer options: {len(sheet['answers'])}")
 
             question = {
-                'text': df.columns[0],
+                'text': sheet['text'],
                 'number': number,
                 'answers': []
             }
-            is_mcq = False  # Assume that it is Open Question or Poll Type
 
-            # Check if the question is a MCQ by checking if row 3 is 'Choice'
-            if df.iloc[1, 0] == 'Choice':
-                # Scan for 'Maximum score' and get the value on the right cell
+            # The question is a MCQ if row 3 is 'Choice'
+            if sheet['is_mcq']:
                 # Some question are asking for 'opinions' and do not have 'Maximum score' field, so we just set to 0
-                for i in range(num_rows):
-                    if df.iloc[i, 0] == 'Maximum score':
-                        question['max_score'] = df.iloc[i, 1]
-                        print(f"Getting Questions: MCQ Type as max_score is found")
-                        break
-
-                if 'max_score' not in question:
+                if sheet['max_score'] is not None:
+                    question['max_score'] = sheet['max_score']
+                    print(f"Getting Questions: MCQ Type as max_score is found")
+                else:
                     question['max_score'] = 0
 
                 self.question_type_mapping_list.append({'sheet_name': sheet_name, 'is_mcq': True})
-                is_mcq = True
-
-            # Get the answer options if it is a MCQ
-            if is_mcq:
-                question['answers'] = []
-                for j in range(2, num_rows):
-                    if pd.isnull(df.iloc[j, 0]):
-                        break
-                    question['answers'].append({'text': df.iloc[j, 0], 'is_correct': False})
+                question['answers'] = [{'text': text, 'is_correct': False} for text in sheet['answers']]
                 self.question_list.append(question)
                 number += 1
                 print(f"Getting Questions: Max score: {question['max_score']}, Number of answer options: {len(question['answers'])}")
@@ -67,6 +163,7 @@ class Excel():
                 self.question_type_mapping_list.append({'sheet_name': sheet_name, 'is_mcq': False})
                 print("Getting Questions: Open Question or Poll Type, Skipping")
 
+        self.build_answer_matchers()
         print("Getting Questions: Completed!\n")
         return self.question_list
 
@@ -85,90 +182,40 @@ class Excel():
         print("Getting Users: Completed! \n")
         return self.user_list
 
+    def get_all_user_answer_attempts(self):
+        """
+        Return the selected answers of every user at once, as {email: {question number: [selected answers]}},
+        with one pass over each MCQ column of the main results sheet.
+        Rows sharing an email are merged.
+        """
+        print("Getting Answer Attempts: Starting...")
+        selections = {}
+        if not self.user_row_count:
+            return selections
+        user_rows = self.main_results_sheet.iloc[:self.user_row_count]
+        emails = [email.upper() if isinstance(email, str) else None for email in user_rows.iloc[:, self.EMAIL_COLUMN]]
+        for column, question, pattern in self.answer_matchers:
+            selected_column = user_rows.iloc[:, column].map(lambda cell: self.parse_selected_answers(cell, pattern))
+            for email, selected_answers in zip(emails, selected_column):
+                if email is None:
+                    continue
+                user_selections = selections.setdefault(email, {})
+                if question['number'] in user_selections:
+                    selected_answers = list(dict.fromkeys(user_selections[question['number']] + selected_answers))
+                user_selections[question['number']] = selected_answers
+        print(f"Getting Answer Attempts: Completed for {len(selections)} users!\n")
+        return selections
+
     def get_user_answer_attempts(self, email):
-        print(f"Getting Answer Attempts: {email}...")
+        """
+        Return the selected answers of one user, one entry per MCQ question and row of the user
+        """
         user_answer_attempt_list = []
-        i = 0
-
-        # Create a list of indices for columns that are MCQ
-        mcq_indices = [
-            idx for idx in range(5, len(self.main_results_sheet.columns) - 1)
-            if idx - 5 < len(self.question_type_mapping_list) and self.question_type_mapping_list[idx - 5]['is_mcq']
-        ]
-        print(f"Getting Answer Attempts: MCQ Indices (Columns): {mcq_indices}")
-
-        try:
-            # Scan each row in main result sheet
-            while not pd.isnull(self.main_results_sheet.iloc[i, 0]):
-                # If the email matches
-                if self.main_results_sheet.iloc[i, 4].upper() == email.upper():
-                    print(f"Getting Answer Attempts: Found {email}")
-
-                    # Iterate through each MCQ question to the end of the columns
-                    for j in mcq_indices:
-                        user_question_attempt = {}
-                        wooclap_selected_answer_string = self.main_results_sheet.iloc[i, j]
-
-                        # Check if the first character is '/'
-                        if wooclap_selected_answer_string[0] == '/':
-                            # User did not attempt the question
-                            print(f"Getting Question Attempts: {email} did not attempt question {j - 5 + 1}")
-                        elif wooclap_selected_answer_string[:4] == 'V - ' or wooclap_selected_answer_string[
-                                                                             :4] == 'X - ':
-                            # MCQ selection with correct answer(s)
-                            # Get characters after the first 4 characters
-                            wooclap_selected_answer_string = wooclap_selected_answer_string[4:]
-                            print(f"Getting Question Attempts: {email} attempted question {j - 5 + 1}, options "
-                                  f"selected: {wooclap_selected_answer_string}")
-                        else:
-                            # MCQ selection without any correct answer(s)
-                            # Get the entire string
-                            wooclap_selected_answer_string = wooclap_selected_answer_string
-                            print(f"Getting Question Attempts: {email} attempted question {j - 5 + 1}, options "
-                                  f"selected: {wooclap_selected_answer_string}")
-
-                        # Ensure the question index is within bounds
-                        if j - 5 < len(self.question_list):
-                            user_question_attempt['number'] = self.question_list[j - 5]['number']
-                            user_question_attempt['question'] = self.question_list[j - 5]['text']
-                            # Get the list of possible answer texts
-                            possible_answers = [answer['text'] for answer in self.question_list[j - 5]['answers']]
-
-                            # Initialize selected_answers as empty list
-                            selected_answer_string = wooclap_selected_answer_string.strip()
-
-                            # Escape possible answers for regex
-                            escaped_possible_answers = [re.escape(ans) for ans in possible_answers]
-                            # Sort by length descending to match longer answers first (avoids partial matches)
-                            escaped_possible_answers.sort(key=len, reverse=True)
-
-                            # Build a regex pattern without word boundaries
-                            pattern = r'(' + '|'.join(escaped_possible_answers) + r')'
-
-                            # Find all matches in the selected answer string
-                            matches = re.findall(pattern, selected_answer_string)
-
-                            # Remove duplicates and maintain order
-                            seen = set()
-                            selected_answers = []
-                            for match in matches:
-                                if match not in seen:
-                                    seen.add(match)
-                                    selected_answers.append(match)
-
-                            user_question_attempt['selected_answers'] = selected_answers
-
-                            # Log selected answers
-                            for answer in user_question_attempt['selected_answers']:
-                                print(f"Getting Question Attempts: {email} selected answer: {answer}")
-
-                            user_answer_attempt_list.append(user_question_attempt)
-                        else:
-                            print(f"Getting Answer Attempts: Question index {j - 5 + 1} out of bounds")
-                i += 1
-        except Exception as e:
-            print(f"Getting Answer Attempts: Error getting {email} Answer Attempts: {str(e)}")
-
-
-        print(f"Getting {email} Answer Attempts...Complete!\n")
+        for row in self.email_index.get(email.upper(), []):
+            for column, question, pattern in self.answer_matchers:
+                user_answer_attempt_list.append({
+                    'number': question['number'],
+                    'question': question['text'],
+                    'selected_answers': self.parse_selected_answers(self.main_results_sheet.iloc[row, column], pattern),
+                })
         return user_answer_attempt_list
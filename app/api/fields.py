@@ -0,0 +1,138 @@
+from collections.abc import Mapping
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db import models
+from rest_framework import serializers
+from rest_framework.relations import MANY_RELATION_KWARGS
+
+RELATED_INSTANCES_ATTRIBUTE = '_related_instances'
+
+
+class BatchedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    PrimaryKeyRelatedField that resolves related objects in batches instead of with one query per value.
+
+    - In a many=True payload, the values of the field in every item are loaded with one IN query
+      the first time the field is validated.
+    - Resolved objects are cached for the rest of the request (or of the root serializer without a request),
+      so an object referenced by several items or serializers is loaded once.
+    - On update, a value equal to the instance's current foreign key reuses the instance's related object.
+    Errors are the same as PrimaryKeyRelatedField's.
+    """
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        list_kwargs = {'child_relation': cls(*args, **kwargs)}
+        for key in kwargs:
+            if key in MANY_RELATION_KWARGS:
+                list_kwargs[key] = kwargs[key]
+        return BatchedManyRelatedField(**list_kwargs)
+
+    def to_internal_value(self, data):
+        if self.pk_field is not None:
+            data = self.pk_field.to_internal_value(data)
+        try:
+            pk = self.prepare_pk(data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+
+        instance = self.get_current_instance(pk)
+        if instance is not None:
+            return instance
+
+        instances = self.get_related_instances()
+        if pk not in instances:
+            self.resolve([pk] + sibling_values(self))
+        instance = instances[pk]
+        if instance is None:
+            self.fail('does_not_exist', pk_value=data)
+        return instance
+
+    def prepare_pk(self, value):
+        if isinstance(value, bool):
+            raise TypeError
+        return self.queryset.model._meta.pk.get_prep_value(value)
+
+    def resolve(self, values):
+        """
+        Load the objects with the given primary keys that are not cached yet with one query.
+        Primary keys that do not exist are cached as None.
+        """
+        instances = self.get_related_instances()
+        pks = set()
+        for value in values:
+            try:
+                pk = self.prepare_pk(value)
+            except (TypeError, ValueError):
+                continue
+            if pk is not None and pk not in instances:
+                pks.add(pk)
+        if not pks:
+            return
+        found = {instance.pk: instance for instance in self.get_queryset().filter(pk__in=pks)}
+        for pk in pks:
+            instances[pk] = found.get(pk)
+
+    def get_related_instances(self):
+        """
+        Return the {pk: instance} cache of this field's queryset, shared for the rest of the request.
+        """
+        if not hasattr(self, '_related_instances_key'):
+            # Fields with differently filtered querysets of the same model do not share their cache
+            queryset = self.get_queryset()
+            self._related_instances_key = (queryset.model, str(queryset.query))
+        request = self.context.get('request')
+        holder = request if request is not None else self.root
+        caches = getattr(holder, RELATED_INSTANCES_ATTRIBUTE, None)
+        if caches is None:
+            caches = {}
+            setattr(holder, RELATED_INSTANCES_ATTRIBUTE, caches)
+        return caches.setdefault(self._related_instances_key, {})
+
+    def get_current_instance(self, pk):
+        """
+        Return the related object of the instance being updated if its foreign key already has the given value.
+        """
+        instance = getattr(self.parent, 'instance', None)
+        if not isinstance(instance, models.Model) or len(self.source_attrs) != 1:
+            return None
+        try:
+            field = instance._meta.get_field(self.source_attrs[0])
+        except FieldDoesNotExist:
+            return None
+        if not field.many_to_one or getattr(instance, field.attname) != pk:
+            return None
+        related_instance = getattr(instance, field.name)
+        self.get_related_instances().setdefault(pk, related_instance)
+        return related_instance
+
+
+class BatchedManyRelatedField(serializers.ManyRelatedField):
+    """
+    ManyRelatedField that resolves the values of its list, and of the same field in the other items
+    of a many=True payload, with one query.
+    """
+
+    def to_internal_value(self, data):
+        if not isinstance(data, str) and hasattr(data, '__iter__'):
+            self.child_relation.resolve(list(data) + sibling_values(self))
+        return super().to_internal_value(data)
+
+
+def sibling_values(field):
+    """
+    Return the values of the field in every item of the many=True payload being validated, if any.
+    List values, of many related fields, are flattened.
+    """
+    root = field.root
+    if not isinstance(root, serializers.ListSerializer) or field.parent is not root.child:
+        return []
+    initial_data = getattr(root, 'initial_data', None)
+    if not isinstance(initial_data, list):
+        return []
+    values = []
+    for item in initial_data:
+        if isinstance(item, Mapping):
+            value = item.get(field.field_name)
+            values.extend(value if isinstance(value, list) else [value])
+    return values
@@ -0,0 +1,221 @@
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.db import transaction
+from rest_framework.exceptions import ValidationError
+
+from .models import (
+    Answer,
+    CourseGroup,
+    EduquestUser,
+    UserAnswerAttempt,
+    UserCourseGroupEnrollment,
+    UserQuestAttempt,
+)
+from .signals import adjust_enrollment_counters
+from .utils import insert_columns, split_full_name
+
+BATCH_SIZE = 5000
+IMPORT_STAGING_DIR = 'imports'
+
+
+class QuestImportError(Exception):
+    """
+    Raised by run_quest_import with the errors to report, e.g. {"Error processing excel file": "..."}
+    """
+
+    def __init__(self, errors):
+        super().__init__(errors)
+        self.errors = errors
+
+
+def stage_import_file(uploaded_file):
+    """
+    Store an uploaded quest file where the import task can read it and return its name.
+    Django already spools large uploads to disk, the default storage copies them in chunks.
+    """
+    return default_storage.save(f"{IMPORT_STAGING_DIR}/{uuid.uuid4().hex}.xlsx", uploaded_file)
+
+
+def import_job_owner_key(job_id):
+    return f"import_job_owner:{job_id}"
+
+
+def record_import_job_owner(job_id, user):
+    """
+    Remember the user who queued an import job, only they and staff users can read its status.
+    """
+    cache.set(import_job_owner_key(job_id), user.id, settings.IMPORT_JOB_OWNER_TTL)
+
+
+def can_read_import_job(job_id, user):
+    return user.is_staff or cache.get(import_job_owner_key(job_id)) == user.id
+
+
+def run_quest_import(excel_file, quest_data, report_progress=lambda stage, counts: None):
+    """
+    Import a quest with its questions and the attempts of its users from a Wooclap Excel export.
+    Parsing happens before the transaction, everything written to the database is rolled back on error.
+    report_progress(stage, counts) is called when the parse, quest, users and attempts stages start.
+    Returns the created quest, its serialized questions and the row counts.
+    """
+    from .excel import Excel
+    from .serializers import QuestSerializer, QuestionSerializer
+
+    counts = {}
+    report_progress('parse', counts)
+    try:
+        excel = Excel()
+        excel.read_excel_sheets(excel_file)
+        questions_data = excel.get_questions()
+        users_data = excel.get_users()
+        selections_by_email = excel.get_all_user_answer_attempts()
+    except Exception as e:
+        raise QuestImportError({"Error processing excel file": str(e)})
+    counts['questions'] = len(questions_data)
+    counts['users'] = len(users_data)
+
+    with transaction.atomic():
+        report_progress('quest', counts)
+        try:
+            # Create a Quest object
+            quest_serializer = QuestSerializer(data=quest_data)
+            quest_serializer.is_valid(raise_exception=True)
+            quest = quest_serializer.save()
+        except Exception as e:
+            raise QuestImportError({"Error creating quest": _error_detail(e)})
+
+        try:
+            for question_data in questions_data:
+                question_data['quest_id'] = quest.id
+            # All the questions and their answers are created together
+            question_serializer = QuestionSerializer(data=questions_data, many=True)
+            question_serializer.is_valid(raise_exception=True)
+            question_serializer.save()
+            questions_serializer = question_serializer.data
+        except Exception as e:
+            raise QuestImportError({"Error creating questions": _error_detail(e)})
+
+        report_progress('users', counts)
+        try:
+            # Enroll users and create UserQuestAttempt and UserAnswerAttempt objects in bulk
+            counts.update(import_quest_attempts(
+                quest, quest_data['course_group_id'], users_data, selections_by_email,
+                report_progress=lambda stage, stage_counts: report_progress(stage, {**counts, **stage_counts})
+            ))
+        except Exception as e:
+            raise QuestImportError({"Error importing user attempts": str(e)})
+
+    return quest, questions_serializer, counts
+
+
+def _error_detail(error):
+    return error.detail if isinstance(error, ValidationError) else str(error)
+
+
+def import_quest_attempts(quest, course_group_id, users_data, selections_by_email, report_progress=None):
+    """
+    Import the attempts of an imported quest (e.g. from a Wooclap export) for any number of users,
+    with a fixed number of queries instead of a few per user and per answer.
+    users_data is a list of {'email', 'username'}, selections_by_email maps an email to
+    {question number: [selected answer texts]}.
+    Users are matched by email and created when missing, users not enrolled in the course group are
+    enrolled, and every user gets one attempt with its answer attempts created with is_selected already set.
+    report_progress(stage, counts), if given, is called when the attempts start being created.
+    Returns the number of users, enrollments, attempts and answer attempts created.
+    """
+    # One attempt per user, even if the same email appears in several rows
+    usernames_by_email = {}
+    for user_data in users_data:
+        usernames_by_email.setdefault(user_data['email'], user_data['username'])
+
+    with transaction.atomic():
+        users, users_created = _get_or_create_users(usernames_by_email)
+        enrollments_created = _enroll(course_group_id, [user.id for user in users.values()])
+        if report_progress:
+            report_progress('attempts', {'users_created': users_created, 'enrollments_created': enrollments_created})
+
+        attempts = UserQuestAttempt.objects.bulk_create([
+            UserQuestAttempt(student=users[email], quest=quest) for email in usernames_by_email
+        ], batch_size=BATCH_SIZE)
+
+        answers = list(Answer.objects.filter(question__quest=quest).order_by('question_id', 'id').values_list(
+            'id', 'question_id', 'question__number', 'text'
+        ))
+        # Answer attempts are written column by column, tens of thousands of model instances are too slow to build
+        columns = {name: [] for name in ('user_quest_attempt', 'question', 'answer', 'is_selected', 'score_achieved')}
+        answer_attempts_created = 0
+        for email, attempt in zip(usernames_by_email, attempts):
+            selections = selections_by_email.get(email, {})
+            for answer_id, question_id, question_number, text in answers:
+                columns['user_quest_attempt'].append(attempt.id)
+                columns['question'].append(question_id)
+                columns['answer'].append(answer_id)
+                columns['is_selected'].append(text in selections.get(question_number, ()))
+                columns['score_achieved'].append(0)
+            if len(columns['answer']) >= BATCH_SIZE:
+                answer_attempts_created += insert_columns(UserAnswerAttempt, columns)
+                columns = {name: [] for name in columns}
+        if columns['answer']:
+            answer_attempts_created += insert_columns(UserAnswerAttempt, columns)
+
+    return {
+        'users_created': users_created,
+        'enrollments_created': enrollments_created,
+        'attempts_created': len(attempts),
+        'answer_attempts_created': answer_attempts_created,
+    }
+
+
+def _get_or_create_users(usernames_by_email):
+    """
+    Return {email: user} for the given emails and the number of users created.
+    New users get the nickname, names and private course group enrollment that EduquestUser.save gives them.
+    """
+    users = {}
+    # Like get_or_create, the oldest user wins if several share an email
+    for user in EduquestUser.objects.filter(email__in=list(usernames_by_email)).order_by('-id'):
+        users[user.email] = user
+
+    new_users = []
+    for email, username in usernames_by_email.items():
+        if email in users:
+            continue
+        nickname = username.replace("#", "")
+        first_name, last_name = split_full_name(nickname)
+        new_users.append(EduquestUser(
+            email=email,
+            username=username,
+            nickname=nickname,
+            first_name=first_name,
+            last_name=last_name,
+        ))
+    if new_users:
+        EduquestUser.objects.bulk_create(new_users, batch_size=BATCH_SIZE)
+        private_course_group = CourseGroup.objects.get(name="Private Course Group")
+        _enroll(private_course_group.id, [user.id for user in new_users], new_students=True)
+        users.update((user.email, user) for user in new_users)
+    return users, len(new_users)
+
+
+def _enroll(course_group_id, student_ids, new_students=False):
+    """
+    Enroll the students that are not enrolled in the course group yet, and return how many were enrolled.
+    bulk_create does not send the signals that maintain the enrollment counters, so they are adjusted here.
+    """
+    if not new_students:
+        enrolled = set(UserCourseGroupEnrollment.objects.filter(
+            course_group_id=course_group_id,
+            student_id__in=student_ids
+        ).values_list('student_id', flat=True))
+        student_ids = [student_id for student_id in student_ids if student_id not in enrolled]
+    if not student_ids:
+        return 0
+    UserCourseGroupEnrollment.objects.bulk_create([
+        UserCourseGroupEnrollment(student_id=student_id, course_group_id=course_group_id)
+        for student_id in student_ids
+    ], batch_size=BATCH_SIZE)
+    adjust_enrollment_counters(course_group_id, len(student_ids))
+    return len(student_ids)
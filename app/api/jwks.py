@@ -0,0 +1,264 @@
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+import jwt
+import requests
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+REFRESH_LOCK_STRIPES = 64
+
+
+class JWKSFetchError(Exception):
+    """
+    Raised when the signing keys for a tenant cannot be fetched and no cached keys are available
+    """
+
+
+class JWKSKeyStore:
+    """
+    Process-wide cache of Azure AD signing keys (JWKS), keyed by tenant and kid.
+    - Keys are served from memory until AZURE_JWKS_CACHE_TTL has passed
+    - After that, stale keys are still served for up to AZURE_JWKS_STALE_TTL while a
+      background thread refreshes them (stale-while-revalidate)
+    - An unknown kid triggers a refresh, at most once per AZURE_JWKS_MIN_REFRESH_INTERVAL
+    - Only one refresh per tenant runs at a time, concurrent callers wait for its result
+    - If AZURE_JWKS_REDIS_URL is set, fetched keys are shared with other workers through Redis
+    - Public key objects built from the JWKs are cached per kid until the keys are refreshed
+    - Tenant ids come from unverified tokens, so at most AZURE_JWKS_MAX_TENANTS tenants are remembered,
+      the least recently fetched are evicted, and refreshes are serialised on a fixed set of locks
+    """
+    redis_key_prefix = 'eduquest:jwks'
+
+    def __init__(self):
+        self._entries = OrderedDict()  # tenant_id -> {'keys': {kid: jwk}, 'fetched_at': epoch seconds}
+        self._lock = threading.Lock()
+        # A tenant always maps to the same lock, so its refreshes still run one at a time
+        self._refresh_locks = [threading.Lock() for _ in range(REFRESH_LOCK_STRIPES)]
+        self._refreshing = set()
+        self._last_refresh_attempt = OrderedDict()
+        self._public_keys = {}  # (tenant_id, kid) -> (jwk, public key object)
+        self._redis = None
+        self._counters = {
+            'hits': 0,
+            'stale_hits': 0,
+            'misses': 0,
+            'refreshes': 0,
+            'shared_hits': 0,
+            'refresh_errors': 0,
+        }
+
+    # Settings are read on every call so that they can be overridden in tests
+    @property
+    def ttl(self):
+        return getattr(settings, 'AZURE_JWKS_CACHE_TTL', 60 * 60 * 24)
+
+    @property
+    def stale_ttl(self):
+        return getattr(settings, 'AZURE_JWKS_STALE_TTL', 60 * 60 * 24 * 7)
+
+    @property
+    def min_refresh_interval(self):
+        return getattr(settings, 'AZURE_JWKS_MIN_REFRESH_INTERVAL', 60)
+
+    @property
+    def max_tenants(self):
+        return getattr(settings, 'AZURE_JWKS_MAX_TENANTS', 100)
+
+    def get_signing_key(self, tenant_id, kid):
+        """
+        Return the JWK dict for the given tenant and kid, or None if the tenant does not publish it.
+        Raises JWKSFetchError if the keys cannot be fetched and nothing is cached.
+        """
+        entry = self._entries.get(tenant_id)
+        if entry is not None:
+            key = entry['keys'].get(kid)
+            age = time.time() - entry['fetched_at']
+            if key is not None and age < self.ttl:
+                self._incr('hits')
+                return key
+            if key is not None and age < self.ttl + self.stale_ttl:
+                self._incr('stale_hits')
+                self._refresh_in_background(tenant_id)
+                return key
+            if key is None and age < self.ttl and not self._can_refresh(tenant_id):
+                # Unknown kid on fresh keys, and a refresh was attempted recently
+                self._incr('misses')
+                return None
+
+        self._incr('misses')
+        entry = self._refresh(tenant_id, kid)
+        return entry['keys'].get(kid)
+
+    def get_public_key(self, tenant_id, kid):
+        """
+        Return the RSA public key object for the given tenant and kid, or None if the kid is unknown.
+        The key is only rebuilt from its JWK when the JWK itself changes.
+        """
+        key = self.get_signing_key(tenant_id, kid)
+        if key is None:
+            return None
+        cached = self._public_keys.get((tenant_id, kid))
+        if cached is not None and cached[0] is key:
+            return cached[1]
+        public_key = jwt.algorithms.RSAAlgorithm.from_jwk(key)
+        with self._lock:
+            # Not cached for a tenant evicted meanwhile, whose public keys were dropped
+            if tenant_id in self._entries:
+                self._public_keys[(tenant_id, kid)] = (key, public_key)
+        return public_key
+
+    def prime(self, tenant_id, keys):
+        """
+        Seed the cache with a list of JWKs for a tenant, e.g. for benchmarks or warm-up
+        """
+        with self._get_refresh_lock(tenant_id):
+            self._set_entry(tenant_id, {
+                'keys': {key['kid']: key for key in keys if 'kid' in key},
+                'fetched_at': time.time(),
+            })
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._last_refresh_attempt.clear()
+            self._public_keys.clear()
+            for name in self._counters:
+                self._counters[name] = 0
+
+    def _incr(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def _can_refresh(self, tenant_id):
+        last_attempt = self._last_refresh_attempt.get(tenant_id)
+        return last_attempt is None or time.time() - last_attempt >= self.min_refresh_interval
+
+    def _get_refresh_lock(self, tenant_id):
+        return self._refresh_locks[hash(tenant_id) % len(self._refresh_locks)]
+
+    def _set_entry(self, tenant_id, entry):
+        with self._lock:
+            self._entries[tenant_id] = entry
+            self._entries.move_to_end(tenant_id)
+            while len(self._entries) > self.max_tenants:
+                evicted_tenant_id, _ = self._entries.popitem(last=False)
+                for key in [key for key in self._public_keys if key[0] == evicted_tenant_id]:
+                    del self._public_keys[key]
+
+    def _set_last_refresh_attempt(self, tenant_id):
+        with self._lock:
+            self._last_refresh_attempt[tenant_id] = time.time()
+            self._last_refresh_attempt.move_to_end(tenant_id)
+            while len(self._last_refresh_attempt) > self.max_tenants:
+                self._last_refresh_attempt.popitem(last=False)
+
+    def _refresh_in_background(self, tenant_id):
+        with self._lock:
+            if tenant_id in self._refreshing:
+                return
+            self._refreshing.add(tenant_id)
+
+        def run():
+            try:
+                self._refresh(tenant_id)
+            except JWKSFetchError as e:
+                logger.warning(f"[JWKS] Background refresh for tenant {tenant_id} failed: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(tenant_id)
+
+        threading.Thread(target=run, name=f'jwks-refresh-{tenant_id}', daemon=True).start()
+
+    def _refresh(self, tenant_id, kid=None):
+        """
+        Single-flight refresh of a tenant's keys. Callers that queue up behind a running
+        refresh reuse its result instead of fetching again.
+        """
+        requested_at = time.time()
+        with self._get_refresh_lock(tenant_id):
+            entry = self._entries.get(tenant_id)
+            if entry is not None and entry['fetched_at'] >= requested_at:
+                return entry
+
+            shared_entry = self._read_shared(tenant_id)
+            if shared_entry is not None and time.time() - shared_entry['fetched_at'] < self.ttl \
+                    and (entry is None or shared_entry['fetched_at'] > entry['fetched_at']) \
+                    and (kid is None or kid in shared_entry['keys']):
+                # Another worker has already fetched the keys we need
+                self._incr('shared_hits')
+                self._set_entry(tenant_id, shared_entry)
+                return shared_entry
+
+            self._set_last_refresh_attempt(tenant_id)
+            try:
+                keys = self._fetch(tenant_id)
+            except JWKSFetchError:
+                self._incr('refresh_errors')
+                if entry is not None:
+                    # Keep serving the keys we have rather than failing every request
+                    return entry
+                raise
+
+            self._incr('refreshes')
+            entry = {'keys': keys, 'fetched_at': time.time()}
+            self._set_entry(tenant_id, entry)
+            self._write_shared(tenant_id, entry)
+            return entry
+
+    def _fetch(self, tenant_id):
+        jwks_url = settings.AZURE_JWKS_URL.format(tenant_id=tenant_id)
+        try:
+            response = requests.get(jwks_url, timeout=getattr(settings, 'AZURE_JWKS_FETCH_TIMEOUT', 5))
+        except requests.RequestException as e:
+            raise JWKSFetchError(str(e))
+        if response.status_code != 200:
+            raise JWKSFetchError(f"Unexpected status code {response.status_code} from {jwks_url}")
+        keys = response.json().get('keys') or []
+        return {key['kid']: key for key in keys if 'kid' in key}
+
+    def _get_redis(self):
+        redis_url = getattr(settings, 'AZURE_JWKS_REDIS_URL', None)
+        if not redis_url:
+            return None
+        if self._redis is None:
+            import redis
+            self._redis = redis.Redis.from_url(redis_url, socket_timeout=1)
+        return self._redis
+
+    def _read_shared(self, tenant_id):
+        client = self._get_redis()
+        if client is None:
+            return None
+        try:
+            value = client.get(f'{self.redis_key_prefix}:{tenant_id}')
+        except Exception as e:
+            logger.warning(f"[JWKS] Failed to read shared keys for tenant {tenant_id}: {e}")
+            return None
+        if not value:
+            return None
+        return json.loads(value)
+
+    def _write_shared(self, tenant_id, entry):
+        client = self._get_redis()
+        if client is None:
+            return
+        try:
+            client.set(
+                f'{self.redis_key_prefix}:{tenant_id}',
+                json.dumps(entry),
+                ex=int(self.ttl + self.stale_ttl),
+            )
+        except Exception as e:
+            logger.warning(f"[JWKS] Failed to share keys for tenant {tenant_id}: {e}")
+
+
+jwks_key_store = JWKSKeyStore()
@@ -0,0 +1,72 @@
+import json
+import time
+
+import jwt
+from cryptography.hazmat.primitives.asymmetric import rsa
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from ...authentication import CustomJWTAuthentication
+from ...jwks import jwks_key_store
+from ...token_cache import verified_token_cache
+
+
+class Command(BaseCommand):
+    help = 'Microbenchmark of the per-request token validation cost, with and without the auth caches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+        tenant_id = 'benchmark-tenant'
+        kid = 'benchmark-kid'
+
+        # Sign a token the same way Azure AD would, and publish its key in the JWKS cache
+        private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        jwk = json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(private_key.public_key()))
+        jwk['kid'] = kid
+        payload = {
+            'tid': tenant_id,
+            'aud': settings.AZURE_CLIENT_ID or 'benchmark-client-id',
+            'preferred_username': 'benchmark@e.ntu.edu.sg',
+            'exp': int(time.time()) + 3600,
+        }
+        raw_token = jwt.encode(payload, private_key, algorithm='RS256', headers={'kid': kid}).encode()
+        auth = CustomJWTAuthentication()
+
+        def uncached():
+            # Previous behaviour: unverified decodes, key construction and RS256 verification on every request
+            header = jwt.get_unverified_header(raw_token)
+            jwt.decode(raw_token, options={"verify_signature": False})
+            public_key = jwt.algorithms.RSAAlgorithm.from_jwk(jwks_key_store.get_signing_key(tenant_id, header['kid']))
+            jwt.decode(raw_token, key=public_key, algorithms=["RS256"], audience=payload['aud'])
+
+        def cached():
+            auth.get_validated_token(raw_token)
+
+        original_client_id = settings.AZURE_CLIENT_ID
+        settings.AZURE_CLIENT_ID = payload['aud']
+        try:
+            jwks_key_store.clear()
+            verified_token_cache.clear()
+            jwks_key_store.prime(tenant_id, [jwk])
+            before = self.time_per_call(uncached, iterations)
+            after = self.time_per_call(cached, iterations)
+        finally:
+            settings.AZURE_CLIENT_ID = original_client_id
+            jwks_key_store.clear()
+            verified_token_cache.clear()
+
+        self.stdout.write(f"Iterations: {iterations}")
+        self.stdout.write(f"Before (verify on every request): {before:.1f} us/request")
+        self.stdout.write(f"After (verified token cache):     {after:.1f} us/request")
+        self.stdout.write(f"Speedup: {before / after:.0f}x")
+
+    @staticmethod
+    def time_per_call(func, iterations):
+        func()  # Warm up
+        start = time.perf_counter()
+        for _ in range(iterations):
+            func()
+        return (time.perf_counter() - start) / iterations * 1_000_000
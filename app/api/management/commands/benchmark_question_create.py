@@ -0,0 +1,77 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from ...models import Answer, Question, Quest
+from ...serializers import QuestionSerializer, create_questions
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ("Benchmark of the creation of question payloads, one INSERT per question and answer against "
+            "the bulk path of QuestionSerializer. Everything created is rolled back")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', type=int, default=[50, 200, 1000])
+        parser.add_argument('--answers', type=int, default=4, help='Number of answers per question')
+        parser.add_argument('--quest-id', type=int, help='Quest to add the questions to, the first quest by default')
+
+    def handle(self, *args, **options):
+        quest = Quest.objects.filter(id=options['quest_id']) if options['quest_id'] else Quest.objects.order_by('id')
+        quest = quest.first()
+        if quest is None:
+            raise CommandError('No quest to add the questions to, populate the database first')
+
+        self.stdout.write(f"Questions with {options['answers']} answers each, added to quest {quest.id}")
+        for size in options['sizes']:
+            payload = [
+                {
+                    'quest_id': quest.id,
+                    'text': f'Benchmark question {number}',
+                    'number': number,
+                    'max_score': 1.0,
+                    'answers': [
+                        {'text': f'Answer {option}', 'is_correct': option == 1, 'reason': None}
+                        for option in range(1, options['answers'] + 1)
+                    ]
+                }
+                for number in range(1, size + 1)
+            ]
+            serializer = QuestionSerializer(data=payload, many=True)
+            if not serializer.is_valid():
+                raise CommandError(serializer.errors)
+
+            before = self.measure(self.create_one_by_one, serializer.validated_data)
+            after = self.measure(create_questions, serializer.validated_data)
+            self.stdout.write(
+                f"{size:>5} questions: one by one {before[0]:7.3f}s {before[1]:6} queries, "
+                f"bulk {after[0]:7.3f}s {after[1]:3} queries, speedup {before[0] / after[0]:.1f}x"
+            )
+
+    @staticmethod
+    def create_one_by_one(validated_data):
+        # Previous behaviour of QuestionSerializer.create with a list
+        for item in validated_data:
+            answers_data = item.pop('answers')
+            question = Question.objects.create(**item)
+            for answer_data in answers_data:
+                Answer.objects.create(question=question, **answer_data)
+
+    @staticmethod
+    def measure(create, validated_data):
+        # create_questions pops the answers from the validated data, so each run gets a copy
+        validated_data = [dict(item) for item in validated_data]
+        try:
+            with transaction.atomic(), CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                create(validated_data)
+                elapsed = time.perf_counter() - start
+                raise Rollback
+        except Rollback:
+            pass
+        return elapsed, len(queries.captured_queries)
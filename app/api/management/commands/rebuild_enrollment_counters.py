@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from ...models import Course, CourseGroup, UserCourseGroupEnrollment
+
+
+class Command(BaseCommand):
+    help = 'Recompute the stored enrollment counters of all courses and course groups from the enrollment table'
+
+    def handle(self, *args, **options):
+        group_counts = UserCourseGroupEnrollment.objects.filter(
+            course_group=OuterRef('pk')
+        ).order_by().values('course_group').annotate(total=Count('id')).values('total')
+        course_counts = UserCourseGroupEnrollment.objects.filter(
+            course_group__course=OuterRef('pk')
+        ).order_by().values('course_group__course').annotate(total=Count('id')).values('total')
+
+        with transaction.atomic():
+            groups = CourseGroup.objects.update(
+                students_enrolled_count=Coalesce(Subquery(group_counts), Value(0))
+            )
+            courses = Course.objects.update(
+                students_enrolled_count=Coalesce(Subquery(course_counts), Value(0))
+            )
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt enrollment counters of {courses} courses and {groups} course groups'
+        ))
@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from ...scoring import rescore_quests
+from ...tasks import rescore_quests as rescore_quests_task
+
+
+class Command(BaseCommand):
+    help = "Recompute the scores of all submitted attempts of the given quests and the users' total points"
+
+    def add_arguments(self, parser):
+        parser.add_argument('quest_ids', nargs='+', type=int)
+        parser.add_argument(
+            '--async',
+            action='store_true',
+            dest='run_async',
+            help='Queue the rescore on the Celery workers instead of running it here'
+        )
+
+    def handle(self, *args, **options):
+        quest_ids = options['quest_ids']
+        if options['run_async']:
+            result = rescore_quests_task.delay(quest_ids)
+            self.stdout.write(f'Queued rescore of quests {quest_ids} as task {result.id}')
+            return
+
+        start = time.perf_counter()
+        result = rescore_quests(quest_ids)
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f"Rescored {result['attempts']} attempts of quests {quest_ids} in {elapsed:.2f}s: "
+            f"{result['attempts_changed']} attempt scores and {result['students_changed']} users' points changed"
+        ))
@@ -0,0 +1,40 @@
+# Generated by Django 5.0.6 on 2026-10-18 04:23
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_enrollment_counters(apps, schema_editor):
+    Course = apps.get_model('api', 'Course')
+    CourseGroup = apps.get_model('api', 'CourseGroup')
+    UserCourseGroupEnrollment = apps.get_model('api', 'UserCourseGroupEnrollment')
+    group_counts = UserCourseGroupEnrollment.objects.filter(
+        course_group=OuterRef('pk')
+    ).order_by().values('course_group').annotate(total=Count('id')).values('total')
+    course_counts = UserCourseGroupEnrollment.objects.filter(
+        course_group__course=OuterRef('pk')
+    ).order_by().values('course_group__course').annotate(total=Count('id')).values('total')
+    CourseGroup.objects.update(students_enrolled_count=Coalesce(Subquery(group_counts), Value(0)))
+    Course.objects.update(students_enrolled_count=Coalesce(Subquery(course_counts), Value(0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='students_enrolled_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='coursegroup',
+            name='students_enrolled_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_enrollment_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.0.6 on 2026-10-18 04:45
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def remove_duplicate_awards(apps, schema_editor):
+    """
+    Keep the earliest award of each badge per attempt / enrollment, so that the constraints can be created
+    """
+    for model_name, field_name in (('UserQuestBadge', 'user_quest_attempt'),
+                                   ('UserCourseBadge', 'user_course_group_enrollment')):
+        model = apps.get_model('api', model_name)
+        duplicates = model.objects.values('badge', field_name).annotate(
+            first_id=Min('id'), awards=Count('id')
+        ).filter(awards__gt=1)
+        for duplicate in duplicates:
+            model.objects.filter(
+                badge=duplicate['badge'], **{field_name: duplicate[field_name]}
+            ).exclude(id=duplicate['first_id']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_enrollment_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_awards, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='usercoursebadge',
+            constraint=models.UniqueConstraint(fields=('badge', 'user_course_group_enrollment'), name='unique_course_badge_per_enrollment'),
+        ),
+        migrations.AddConstraint(
+            model_name='userquestbadge',
+            constraint=models.UniqueConstraint(fields=('badge', 'user_quest_attempt'), name='unique_quest_badge_per_attempt'),
+        ),
+    ]
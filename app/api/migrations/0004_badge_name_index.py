@@ -0,0 +1,18 @@
+# Generated by Django 5.0.6 on 2026-10-18 04:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_unique_badge_awards'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='badge',
+            name='name',
+            field=models.CharField(db_index=True, max_length=50),
+        ),
+    ]
@@ -3,12 +3,13 @@ from datetime import datetime
 import os
 
 from celery import chain
-from django.db import models
+from django.db import models, transaction
 from django.utils import timezone
 from django.contrib.auth.models import AbstractUser
 from django.utils.text import slugify
-from .utils import split_full_name
-from django.db.models import Sum
+from .utils import split_full_name, update_returning_pks
+from django.db.models import Sum, Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
 from storages.backends.azure_storage import AzureStorage
 from django.core.exceptions import ValidationError
 
@@ -78,7 +79,89 @@ class Term(models.Model):
         return f"{self.academic_year} - {self.name} ({self.start_date} to {self.end_date})"
 
 
-class Course(models.Model):
+class FieldTrackerMixin:
+    """
+    Remember the stored values of the fields listed in tracked_fields when an instance is loaded
+    from the database and after every save, so that save() can detect transitions such as a status
+    change without reading the row again first.
+    Only instances that were not loaded through a queryset, e.g. built with an explicit primary key,
+    or that had a tracked field deferred, read the stored values with one query when they are needed.
+    """
+    tracked_fields = ()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._original_values = {
+            attname: instance.__dict__[attname]
+            for attname in instance._tracked_attnames() if attname in instance.__dict__
+        }
+        return instance
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # The row now holds the saved values, fields left out of update_fields keep their stored value
+        self._record_original_values(kwargs.get('update_fields'))
+
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        super().refresh_from_db(using=using, fields=fields, **kwargs)
+        # The reloaded fields hold the stored values again, e.g. after a bulk UPDATE of the row
+        self._record_original_values(fields)
+
+    def _record_original_values(self, field_names=None):
+        originals = self.__dict__.setdefault('_original_values', {})
+        for field_name, attname in zip(self.tracked_fields, self._tracked_attnames()):
+            if (field_names is None or field_name in field_names or attname in field_names) \
+                    and attname in self.__dict__:
+                originals[attname] = self.__dict__[attname]
+
+    def tracked_changes(self, update_fields=None):
+        """
+        Return {field name: stored value} of the tracked fields whose value differs from the stored one
+        and that a save with the given update_fields would write.
+        A new instance has no stored values, they are all None.
+        """
+        originals = self._get_original_values()
+        changes = {}
+        for field_name, attname in zip(self.tracked_fields, self._tracked_attnames()):
+            if update_fields is not None and field_name not in update_fields and attname not in update_fields:
+                continue
+            original = originals.get(attname)
+            if original != getattr(self, attname):
+                changes[field_name] = original
+        return changes
+
+    def get_original_value(self, field_name):
+        return self._get_original_values().get(self._meta.get_field(field_name).attname)
+
+    def _tracked_attnames(self):
+        return [self._meta.get_field(field_name).attname for field_name in self.tracked_fields]
+
+    def _get_original_values(self):
+        originals = self.__dict__.setdefault('_original_values', {})
+        missing = [attname for attname in self._tracked_attnames() if attname not in originals]
+        if missing and self.pk is not None:
+            stored = type(self)._base_manager.filter(pk=self.pk).values(*missing).first()
+            originals.update(stored or dict.fromkeys(missing))
+        return originals
+
+
+def save_without_counters(instance, kwargs):
+    """
+    Leave the denormalised enrollment counter out of regular saves of an existing row,
+    so that a stale in-memory value never overwrites it.
+    The counter is only written with F() updates by the enrollment signals and the rebuild command.
+    """
+    if instance._state.adding or kwargs.get('force_insert') or kwargs.get('update_fields') is not None:
+        return kwargs
+    kwargs['update_fields'] = [
+        field.name for field in instance._meta.concrete_fields
+        if not field.primary_key and field.name != 'students_enrolled_count'
+    ]
+    return kwargs
+
+
+class Course(FieldTrackerMixin, models.Model):
     """
     Model to store courses for each term
     e.g. Term 1 - SC1000, SC2000
@@ -97,6 +180,11 @@ class Course(models.Model):
     status = models.CharField(max_length=100)  # Active, Expired
     image = models.ForeignKey(Image, on_delete=models.SET_NULL, null=True, blank=True)
     coordinators = models.ManyToManyField(EduquestUser, related_name='coordinated_courses')
+    # Maintained by the enrollment signals, rebuilt with 'manage.py rebuild_enrollment_counters'
+    students_enrolled_count = models.IntegerField(default=0, editable=False)
+
+    # Transitions detected by save()
+    tracked_fields = ('status',)
 
     def clean(self):
         super().clean()
@@ -105,11 +193,8 @@ class Course(models.Model):
         #     raise ValidationError("A course must have at least one coordinator.")
 
     def save(self, *args, **kwargs):
-        is_new_instance = self.pk is None
-        old_status_value = None
-        if not is_new_instance:
-            old_instance = Course.objects.get(pk=self.pk)
-            old_status_value = old_instance.status
+        kwargs = save_without_counters(self, kwargs)
+        old_status_value = self.tracked_changes(kwargs.get('update_fields')).get('status')
 
         self.full_clean()  # Call the clean method
         super(Course, self).save(*args, **kwargs)
@@ -121,11 +206,11 @@ class Course(models.Model):
             # Trigger all tasks
             check_course_completion_and_award_completionist_badge.delay(self.id)
 
-            # Recursively set all quests in all course groups to 'Expired'
-            for course_group in self.groups.all():
-                for quest in course_group.quests.all():
-                    quest.status = 'Expired'
-                    quest.save()
+            # Set all quests in all course groups to 'Expired', active quests also get their expiry badges
+            quests = Quest.objects.filter(course_group__course=self)
+            quests.expire()
+            # Quests in any other status are expired without the expiry badges, as saving them did
+            quests.exclude(status__in=('Active', 'Expired')).update(status='Expired')
 
     def total_students_enrolled(self):
         return UserCourseGroupEnrollment.objects.filter(course_group__course=self).count()
@@ -135,7 +220,7 @@ class Course(models.Model):
 
 
 
-class CourseGroup(models.Model):
+class CourseGroup(FieldTrackerMixin, models.Model):
     """
     Model to store course groups for each course
     This is similar to how course index works in NTU
@@ -147,6 +232,16 @@ class CourseGroup(models.Model):
     session_day = models.CharField(max_length=10, null=True, blank=True)  # e.g. Monday, Tuesday, Wednesday
     session_time = models.CharField(max_length=100, null=True, blank=True)  # e.g. 10:00 AM - 12:00 PM, 2:30 PM - 4:30 PM
     instructor = models.ForeignKey(EduquestUser, on_delete=models.CASCADE, related_name='instructed_course_groups')
+    # Maintained by the enrollment signals, rebuilt with 'manage.py rebuild_enrollment_counters'
+    students_enrolled_count = models.IntegerField(default=0, editable=False)
+
+    # The enrollment signals move the course counters when the course changes
+    tracked_fields = ('course',)
+
+    def save(self, *args, **kwargs):
+        # Save the course group and move the course counters in the same transaction
+        with transaction.atomic():
+            super().save(*args, **save_without_counters(self, kwargs))
 
     def total_students_enrolled(self):
         return UserCourseGroupEnrollment.objects.filter(course_group=self).count()
@@ -155,7 +250,7 @@ class CourseGroup(models.Model):
         return f"Group {self.name} from {self.course.code}"
 
 
-class UserCourseGroupEnrollment(models.Model):
+class UserCourseGroupEnrollment(FieldTrackerMixin, models.Model):
     """
     Model to store the user's enrollment in a course group
     One course group can have many course group enrollment records
@@ -166,11 +261,58 @@ class UserCourseGroupEnrollment(models.Model):
     enrolled_on = models.DateTimeField(auto_now_add=True)
     completed_on = models.DateTimeField(null=True, blank=True)
 
+    # The enrollment signals move the counters when the course group changes
+    tracked_fields = ('course_group',)
+
+    def save(self, *args, **kwargs):
+        # Save the enrollment and update the enrollment counters in the same transaction
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
     def __str__(self):
         return f"{self.student.username} enrolled in {self.course_group.course.code} - {self.course_group.name}"
 
 
-class Quest(models.Model):
+class QuestQuerySet(models.QuerySet):
+
+    def with_totals(self):
+        """
+        Annotate the total max score and total number of questions of each quest in the same query,
+        instead of one SUM and one COUNT query per quest.
+        Read by QuestSerializer when present.
+        The total max score of a quest without questions is None, read as int 0 like Quest.total_max_score().
+        """
+        questions = Question.objects.filter(quest=OuterRef('pk')).order_by().values('quest')
+        return self.annotate(
+            annotated_total_max_score=Subquery(questions.annotate(total=Sum('max_score')).values('total')),
+            annotated_total_questions=Coalesce(
+                Subquery(questions.annotate(total=Count('id')).values('total')),
+                Value(0)
+            ),
+        )
+
+    def expire(self):
+        """
+        Set the Active quests of this queryset to 'Expired' and stamp their expiration date in a single
+        UPDATE ... RETURNING, then queue one task that awards the expert and speedster badges of all of them.
+        This is the bulk equivalent of setting the status to 'Expired' and saving each quest.
+        Returns the ids of the quests that were expired by this call.
+        """
+        with transaction.atomic():
+            # A row locked by a concurrent expiry is waited for, then left out by the status re-check
+            # once that expiry has committed, so every quest is expired exactly once
+            quest_ids = update_returning_pks(
+                self.filter(status='Active').select_for_update(of=('self',)),
+                status='Expired',
+                expiration_date=timezone.now()
+            )
+            if quest_ids:
+                from .tasks import dispatch_expired_quest_badges
+                transaction.on_commit(lambda: dispatch_expired_quest_badges(quest_ids))
+        return quest_ids
+
+
+class Quest(FieldTrackerMixin, models.Model):
     """
     Model to store quests for each course group
     One course group can have many quests
@@ -186,6 +328,11 @@ class Quest(models.Model):
     organiser = models.ForeignKey(EduquestUser, on_delete=models.CASCADE, related_name='quests_organised')
     image = models.ForeignKey(Image, on_delete=models.SET_NULL, null=True, blank=True)
 
+    objects = QuestQuerySet.as_manager()
+
+    # Transitions detected by save()
+    tracked_fields = ('status', 'expiration_date')
+
     def __str__(self):
         return f"{self.name} from Group {self.course_group.course.name} {self.course_group.course.code}"
 
@@ -199,12 +346,18 @@ class Quest(models.Model):
 
     def save(self, *args, **kwargs):
         is_new = self.pk is None
-        previous_status = None
-        if not is_new:
-            previous = Quest.objects.get(pk=self.pk)
-            previous_status = previous.status
+        changes = {} if is_new else self.tracked_changes(kwargs.get('update_fields'))
+        previous_status = changes.get('status', None if is_new else self.status)
 
         super(Quest, self).save(*args, **kwargs)
+
+        # Schedule the expiry when an active quest gets a new expiration date,
+        # a task scheduled for the previous date does nothing when it runs
+        if self.status == "Active" and self.expiration_date is not None \
+                and (is_new or previous_status != "Active" or 'expiration_date' in changes):
+            from .tasks import schedule_quest_expiry
+            quest_id, expiration_date = self.id, self.expiration_date
+            transaction.on_commit(lambda: schedule_quest_expiry(quest_id, expiration_date))
         # If the quest status changed from Active to Expired
         if previous_status == "Active" and self.status == "Expired":
             self.expiration_date = timezone.now()
@@ -242,7 +395,27 @@ class Answer(models.Model):
         return f"{self.text} for Question ID {self.question.id}"
 
 
-class UserQuestAttempt(models.Model):
+class UserQuestAttemptQuerySet(models.QuerySet):
+
+    def submit(self):
+        """
+        Mark the unsubmitted attempts of this queryset as submitted in a single UPDATE ... RETURNING,
+        then queue the processing of exactly those attempts in batches.
+        This is the bulk equivalent of setting submitted to True and saving each attempt.
+        Returns the ids of the attempts that were submitted by this call.
+        """
+        with transaction.atomic():
+            attempt_ids = update_returning_pks(
+                self.filter(submitted=False).select_for_update(of=('self',)),
+                submitted=True
+            )
+            if attempt_ids:
+                from .submissions import dispatch_submitted_attempts
+                transaction.on_commit(lambda: dispatch_submitted_attempts(attempt_ids))
+        return attempt_ids
+
+
+class UserQuestAttempt(FieldTrackerMixin, models.Model):
     """
     Model to store the user's attempt for each quest
     When the user starts a quest attempt, a record will be created
@@ -254,6 +427,11 @@ class UserQuestAttempt(models.Model):
     last_attempted_date = models.DateTimeField(blank=True, null=True)  # blank for imported quests
     total_score_achieved = models.FloatField(default=0)
 
+    objects = UserQuestAttemptQuerySet.as_manager()
+
+    # Transitions detected by save()
+    tracked_fields = ('submitted',)
+
     def __str__(self):
         return f"{self.student.username} attempted {self.quest.name}"
 
@@ -262,35 +440,8 @@ class UserQuestAttempt(models.Model):
         Calculate the total score achieved by the user for the quest
         Set the score_achieved for each answer attempt.
         """
-        total_score = 0
-        user_answer_attempts_to_update = []
-        questions = self.quest.questions.all()
-
-        for question in questions:
-            answers = question.answers.all()
-            num_options = answers.count()
-
-            if num_options == 0:
-                continue  # Avoid division by zero
-
-            weight_per_option = question.max_score / num_options
-            user_answers = self.answer_attempts.filter(question=question)
-            question_score = 0
-
-            for ua in user_answers:
-                if ua.is_selected == ua.answer.is_correct:
-                    ua.score_achieved = weight_per_option
-                    question_score += weight_per_option
-                else:
-                    ua.score_achieved = 0
-                user_answer_attempts_to_update.append(ua)
-
-            total_score += question_score
-
-        # Bulk update all UserAnswerAttempt instances' score_achieved fields
-        UserAnswerAttempt.objects.bulk_update(user_answer_attempts_to_update, ['score_achieved'])
-
-        return total_score
+        from .scoring import score_quest_attempts
+        return score_quest_attempts([self.id])[self.id]
 
     @property
     def time_taken(self):
@@ -308,18 +459,16 @@ class UserQuestAttempt(models.Model):
         is_new_instance = self.pk is None
         old_submitted_value = None
         if not is_new_instance:
-            old_instance = UserQuestAttempt.objects.get(pk=self.pk)
-            old_submitted_value = old_instance.submitted
+            old_submitted_value = self.tracked_changes(kwargs.get('update_fields')).get('submitted', self.submitted)
 
         super(UserQuestAttempt, self).save(*args, **kwargs)
 
         # After saving the instance, check if 'submitted' changed from False to True
         if old_submitted_value == False and self.submitted == True:
-            # Import tasks locally to avoid circular import
-            from .tasks import (award_first_attempt_badge, calculate_score_and_issue_points)
-            # Trigger all tasks
-            calculate_score_and_issue_points.delay(self.id)
-            award_first_attempt_badge.delay(self.id)
+            # Import locally to avoid circular import
+            from .submissions import queue_submitted_attempt
+            # Scoring, points and badges are processed together once the submission is committed
+            transaction.on_commit(lambda: queue_submitted_attempt(self.id))
 
 
 class UserAnswerAttempt(models.Model):
@@ -340,7 +489,7 @@ class Badge(models.Model):
     """
     Model to store badges that can be earned by users
     """
-    name = models.CharField(max_length=50)
+    name = models.CharField(max_length=50, db_index=True)
     description = models.TextField()
     type = models.CharField(max_length=50)  # Course Type or Quest Type
     condition = models.CharField(max_length=250)  # Condition to be met to earn the badge
@@ -367,6 +516,14 @@ class UserCourseBadge(models.Model):
     )
     awarded_date = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['badge', 'user_course_group_enrollment'],
+                name='unique_course_badge_per_enrollment'
+            )
+        ]
+
     def __str__(self):
         return (f"{self.user_course_group_enrollment.student.username} earned {self.badge.name} from Course "
                 f"{self.user_course_group_enrollment.course_group.course.code} - "
@@ -382,6 +539,11 @@ class UserQuestBadge(models.Model):
     user_quest_attempt = models.ForeignKey(UserQuestAttempt, on_delete=models.CASCADE, related_name='earned_quest_badges')
     awarded_date = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['badge', 'user_quest_attempt'], name='unique_quest_badge_per_attempt')
+        ]
+
     def __str__(self):
         return (f"{self.user_quest_attempt.student.username} earned {self.badge.name} from Quest "
                 f"{self.user_quest_attempt.quest.name}")
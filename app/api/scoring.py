@@ -0,0 +1,162 @@
+from collections import defaultdict
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, F
+
+from .authentication import auth_user_cache_key
+from .models import EduquestUser, Question, UserAnswerAttempt, UserQuestAttempt
+
+BATCH_SIZE = 5000
+
+
+def score_quest_attempts(user_quest_attempt_ids):
+    """
+    Score any number of quest attempts in two queries plus one UPDATE per distinct option score,
+    instead of a few queries per question and per answer attempt.
+    Every option of a question weighs max_score / number of options, and an answer attempt
+    earns that weight when its selection matches the option's correctness.
+    Sets score_achieved on the answer attempts and returns {user_quest_attempt_id: total score}.
+
+    The arithmetic matches the previous per-question loop exactly: a question's score is
+    built by repeated addition of the option weight, and question scores are added in
+    question id order, so the totals are bit-identical.
+    """
+    user_quest_attempt_ids = list(user_quest_attempt_ids)
+    if not user_quest_attempt_ids:
+        return {}
+    answer_attempts = UserAnswerAttempt.objects.filter(user_quest_attempt_id__in=user_quest_attempt_ids)
+    return _score_answer_attempts(answer_attempts, user_quest_attempt_ids)
+
+
+def _score_answer_attempts(answer_attempts, user_quest_attempt_ids):
+    totals = {attempt_id: 0 for attempt_id in user_quest_attempt_ids}
+
+    # Query 1: every answer attempt of the quest attempts, with the correctness of its option
+    answer_attempts = answer_attempts.values_list(
+        'id', 'user_quest_attempt_id', 'user_quest_attempt__quest_id',
+        'question_id', 'is_selected', 'answer__is_correct', 'score_achieved'
+    )
+    # question -> attempt -> [(answer attempt id, is_selected == is_correct, current score)]
+    by_question = defaultdict(lambda: defaultdict(list))
+    attempt_quests = {}
+    for ua_id, attempt_id, quest_id, question_id, is_selected, is_correct, score_achieved in answer_attempts:
+        by_question[question_id][attempt_id].append((ua_id, is_selected == is_correct, score_achieved))
+        attempt_quests[attempt_id] = quest_id
+
+    # Query 2: max score and number of options of every question involved
+    questions = Question.objects.filter(id__in=by_question.keys()).annotate(
+        num_options=Count('answers')
+    ).order_by('id').values_list('id', 'quest_id', 'max_score', 'num_options')
+
+    to_update = {}
+    for question_id, quest_id, max_score, num_options in questions:
+        if num_options == 0:
+            continue  # Avoid division by zero
+        weight_per_option = max_score / num_options
+        for attempt_id, user_answers in by_question[question_id].items():
+            if attempt_quests[attempt_id] != quest_id:
+                continue  # Answer attempts on a question of another quest are ignored, as before
+            question_score = 0
+            for ua_id, is_correct, score_achieved in user_answers:
+                new_score = weight_per_option if is_correct else 0
+                if is_correct:
+                    question_score += weight_per_option
+                if new_score != score_achieved:
+                    to_update[ua_id] = new_score
+            totals[attempt_id] += question_score
+
+    # Only the answer attempts whose score changed are written
+    update_by_value(UserAnswerAttempt, 'score_achieved', to_update)
+
+    return totals
+
+
+def rescore_quests(quest_ids):
+    """
+    Recompute the scores of every submitted attempt of the given quests, e.g. after an answer's
+    correctness was changed, and apply the resulting change of each student's best score to
+    their total points, all in one transaction.
+    A student's points from a non-private quest are their best submitted score, as built up
+    by process_submissions, so only the difference between the old and new best
+    score is applied.
+    Returns the number of attempts rescored, attempts whose total changed and students whose points changed.
+    """
+    quest_ids = list(quest_ids)
+    with transaction.atomic():
+        # Lock the attempts, so that a submission scored concurrently cannot be counted twice
+        attempts = list(
+            UserQuestAttempt.objects.select_for_update(of=('self',)).filter(
+                quest_id__in=quest_ids,
+                submitted=True
+            ).order_by('id').values_list('id', 'quest_id', 'quest__type', 'student_id', 'total_score_achieved')
+        )
+        attempt_ids = [attempt[0] for attempt in attempts]
+        totals = _score_answer_attempts(
+            UserAnswerAttempt.objects.filter(user_quest_attempt__quest_id__in=quest_ids,
+                                             user_quest_attempt__submitted=True),
+            attempt_ids
+        )
+
+        old_best = {}
+        new_best = {}
+        changed_attempts = {}
+        for attempt_id, quest_id, quest_type, student_id, old_total in attempts:
+            new_total = totals[attempt_id]
+            if new_total != old_total:
+                changed_attempts[attempt_id] = new_total
+            if quest_type == 'Private':
+                continue  # Private quests do not earn points
+            key = (student_id, quest_id)
+            old_best[key] = max(old_best.get(key, 0), old_total)
+            new_best[key] = max(new_best.get(key, 0), new_total)
+
+        points_delta = defaultdict(float)
+        for (student_id, quest_id), best in new_best.items():
+            delta = best - old_best[(student_id, quest_id)]
+            if delta:
+                points_delta[student_id] += delta
+
+        update_by_value(UserQuestAttempt, 'total_score_achieved', changed_attempts)
+        add_points(points_delta)
+
+    return {
+        'attempts': len(attempts),
+        'attempts_changed': len(changed_attempts),
+        'students_changed': len(points_delta),
+    }
+
+
+def update_by_value(model, field_name, values):
+    """
+    Write {pk: value} to one field with one 'UPDATE ... WHERE id IN (...)' per distinct value and batch.
+    Scores only take a few distinct values (the option weights of each question and 0),
+    which makes this much cheaper than bulk_update's per-row CASE expression.
+    """
+    pks_by_value = defaultdict(list)
+    for pk, value in values.items():
+        pks_by_value[value].append(pk)
+    for value, pks in pks_by_value.items():
+        for start in range(0, len(pks), BATCH_SIZE):
+            model.objects.filter(pk__in=pks[start:start + BATCH_SIZE]).update(**{field_name: value})
+
+
+def add_points(points_delta):
+    """
+    Add each student's delta to their total points, one UPDATE per distinct delta and batch.
+    The F() expression keeps concurrent point changes.
+    """
+    student_ids_by_delta = defaultdict(list)
+    for student_id, delta in points_delta.items():
+        student_ids_by_delta[delta].append(student_id)
+    for delta, student_ids in student_ids_by_delta.items():
+        for start in range(0, len(student_ids), BATCH_SIZE):
+            EduquestUser.objects.filter(id__in=student_ids[start:start + BATCH_SIZE]).update(
+                total_points=F('total_points') + delta
+            )
+    if points_delta:
+        # Queryset updates do not send post_save, so drop the cached users used by authentication here.
+        # The cache is shared, so this also reaches the web processes when run by a Celery worker
+        emails = EduquestUser.objects.filter(id__in=list(points_delta)).exclude(email='').values_list('email', flat=True)
+        keys = [auth_user_cache_key(email) for email in emails]
+        transaction.on_commit(lambda: cache.delete_many(keys))
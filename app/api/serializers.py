@@ -1,5 +1,8 @@
+from django.db import transaction
+from django.db.models import BooleanField, F, FloatField, IntegerField, Value, prefetch_related_objects
 from rest_framework import serializers
-from .utils import split_full_name
+from .fields import BatchedPrimaryKeyRelatedField
+from .utils import insert_from_select, split_full_name
 from collections import OrderedDict
 from datetime import datetime
 from .models import (
@@ -65,7 +68,7 @@ class AcademicYearSerializer(serializers.ModelSerializer):
 
 class TermSerializer(serializers.ModelSerializer):
     # Use PrimaryKeyRelatedField for writing operations
-    academic_year_id = serializers.PrimaryKeyRelatedField(
+    academic_year_id = BatchedPrimaryKeyRelatedField(
         queryset=AcademicYear.objects.all(),
         source='academic_year',  # Maps 'academic_year_id' to the 'academic_year' model field
         write_only=True
@@ -93,17 +96,17 @@ class TermSerializer(serializers.ModelSerializer):
 
 class CourseSerializer(serializers.ModelSerializer):
     # Use PrimaryKeyRelatedField for writing operations
-    term_id = serializers.PrimaryKeyRelatedField(
+    term_id = BatchedPrimaryKeyRelatedField(
         queryset=Term.objects.all(),
         source='term',  # Maps 'term_id' to the 'term' model field
         write_only=True
     )
-    image_id = serializers.PrimaryKeyRelatedField(
+    image_id = BatchedPrimaryKeyRelatedField(
         queryset=Image.objects.all(),
         source='image',  # Maps 'image_id' to the 'image' model field
         write_only=True
     )
-    coordinators = serializers.PrimaryKeyRelatedField(
+    coordinators = BatchedPrimaryKeyRelatedField(
         queryset=EduquestUser.objects.all(),
         many=True,
         write_only=True,
@@ -113,14 +116,12 @@ class CourseSerializer(serializers.ModelSerializer):
     term = TermSerializer(read_only=True)
     image = ImageSerializer(read_only=True)
     coordinators_summary = EduquestUserSummarySerializer(many=True, read_only=True, source='coordinators')
-    total_students_enrolled = serializers.SerializerMethodField()
+    # Stored counter maintained by the enrollment signals, instead of a COUNT per course
+    total_students_enrolled = serializers.IntegerField(source='students_enrolled_count', read_only=True)
 
     class Meta:
         model = Course
-        fields = '__all__'
-
-    def get_total_students_enrolled(self, obj):
-        return obj.total_students_enrolled()
+        exclude = ['students_enrolled_count']
 
     def validate_coordinators(self, value):
         """
@@ -174,28 +175,26 @@ class CourseSummarySerializer(serializers.ModelSerializer):
 
 
 class CourseGroupSerializer(serializers.ModelSerializer):
-    course_id = serializers.PrimaryKeyRelatedField(
+    course_id = BatchedPrimaryKeyRelatedField(
         queryset=Course.objects.all(),
         source='course',
         write_only=True
     )
-    instructor_id = serializers.PrimaryKeyRelatedField(
+    instructor_id = BatchedPrimaryKeyRelatedField(
         queryset=EduquestUser.objects.all(),
         source='instructor',
         write_only=True
     )
     course = CourseSummarySerializer(read_only=True)
     instructor = EduquestUserSummarySerializer(read_only=True)
-    total_students_enrolled = serializers.SerializerMethodField()
+    # Stored counter maintained by the enrollment signals, instead of a COUNT per course group
+    total_students_enrolled = serializers.IntegerField(source='students_enrolled_count', read_only=True)
 
     class Meta:
         model = CourseGroup
         fields = ['id', 'course', 'course_id', 'instructor_id', 'instructor', 'name',
                   'session_day', 'session_time', 'total_students_enrolled']
 
-    def get_total_students_enrolled(self, obj):
-        return obj.total_students_enrolled()
-
     def update(self, instance, validated_data):
         course = validated_data.pop('course', None)
         if course:
@@ -219,12 +218,12 @@ class CourseGroupSummarySerializer(serializers.ModelSerializer):
 
 
 class UserCourseGroupEnrollmentSerializer(serializers.ModelSerializer):
-    course_group_id = serializers.PrimaryKeyRelatedField(
+    course_group_id = BatchedPrimaryKeyRelatedField(
         queryset=CourseGroup.objects.all(),
         source='course_group',
         write_only=True
     )
-    student_id = serializers.PrimaryKeyRelatedField(
+    student_id = BatchedPrimaryKeyRelatedField(
         queryset=EduquestUser.objects.all(),
         source='student',
         # write_only=True
@@ -277,7 +276,7 @@ class UserCourseGroupEnrollmentSerializer(serializers.ModelSerializer):
 
 class UserCourseGroupEnrollmentSummarySerializer(serializers.ModelSerializer):
     course_group = CourseGroupSummarySerializer(read_only=True)
-    student_id = serializers.PrimaryKeyRelatedField(
+    student_id = BatchedPrimaryKeyRelatedField(
         queryset=EduquestUser.objects.all(),
         source='student',
     )
@@ -288,17 +287,17 @@ class UserCourseGroupEnrollmentSummarySerializer(serializers.ModelSerializer):
 
 
 class QuestSerializer(serializers.ModelSerializer):
-    course_group_id = serializers.PrimaryKeyRelatedField(
+    course_group_id = BatchedPrimaryKeyRelatedField(
         queryset=CourseGroup.objects.all(),
         source='course_group',
         write_only=True
     )
-    organiser_id = serializers.PrimaryKeyRelatedField(
+    organiser_id = BatchedPrimaryKeyRelatedField(
         queryset=EduquestUser.objects.all(),
         source='organiser',
         write_only=True
     )
-    image_id = serializers.PrimaryKeyRelatedField(
+    image_id = BatchedPrimaryKeyRelatedField(
         queryset=Image.objects.all(),
         source='image',
         write_only=True
@@ -314,10 +313,15 @@ class QuestSerializer(serializers.ModelSerializer):
         model = Quest
         fields = '__all__'
 
+    # Use the values annotated by Quest.objects.with_totals() when present, avoiding two queries per quest
     def get_total_max_score(self, obj):
+        if hasattr(obj, 'annotated_total_max_score'):
+            return obj.annotated_total_max_score or 0
         return obj.total_max_score()
 
     def get_total_questions(self, obj):
+        if hasattr(obj, 'annotated_total_questions'):
+            return obj.annotated_total_questions
         return obj.total_questions()
 
     def update(self, instance, validated_data):
@@ -354,8 +358,13 @@ class AnswerSerializer(serializers.ModelSerializer):
         fields = ['id', 'text', 'is_correct', 'reason']
 
 
+class QuestionListSerializer(serializers.ListSerializer):
+    def create(self, validated_data):
+        return create_questions(validated_data)
+
+
 class QuestionSerializer(serializers.ModelSerializer):
-    quest_id = serializers.PrimaryKeyRelatedField(
+    quest_id = BatchedPrimaryKeyRelatedField(
         queryset=Quest.objects.all(),
         source='quest',
     )
@@ -364,6 +373,7 @@ class QuestionSerializer(serializers.ModelSerializer):
     class Meta:
         model = Question
         fields = ['id', 'quest_id', 'text', 'number', 'max_score', 'answers']
+        list_serializer_class = QuestionListSerializer
 
     def validate(self, data):
         answers = data.get('answers', [])
@@ -372,34 +382,33 @@ class QuestionSerializer(serializers.ModelSerializer):
         return data
 
     def create(self, validated_data):
-        # Check if validated_data is a list (bulk creation)
-        if isinstance(validated_data, list):
-            questions = []
-            for item in validated_data:
-                answers_data = item.pop('answers')
-                question = Question.objects.create(**item)
-                self._create_answers(question, answers_data)
-                questions.append(question)
-            return questions
-        else:
-            # Single object creation
-            answers_data = validated_data.pop('answers')
-            question = Question.objects.create(**validated_data)
-            self._create_answers(question, answers_data)
-            return question
-
-    def _create_answers(self, question, answers_data):
-        for answer_data in answers_data:
-            Answer.objects.create(question=question, **answer_data)
+        return create_questions([validated_data])[0]
 
 
+def create_questions(questions_data):
+    """
+    Create questions with their answers in two INSERTs, one for all the questions and one for all the answers,
+    whatever the number of questions, and prefetch the answers to serialize the result with one more query.
+    """
+    answers_data = [question_data.pop('answers') for question_data in questions_data]
+    with transaction.atomic():
+        # PostgreSQL returns the primary keys of the bulk created rows
+        questions = Question.objects.bulk_create([Question(**question_data) for question_data in questions_data])
+        Answer.objects.bulk_create([
+            Answer(question=question, **answer_data)
+            for question, question_answers_data in zip(questions, answers_data)
+            for answer_data in question_answers_data
+        ])
+    prefetch_related_objects(questions, 'answers')
+    return questions
+
 
 class UserQuestAttemptSerializer(serializers.ModelSerializer):
-    quest_id = serializers.PrimaryKeyRelatedField(
+    quest_id = BatchedPrimaryKeyRelatedField(
         queryset=Quest.objects.all(),  # Handles both read and write
         source='quest'  # Maps to the 'quest' ForeignKey field in the model
     )
-    student_id = serializers.PrimaryKeyRelatedField(
+    student_id = BatchedPrimaryKeyRelatedField(
         queryset=EduquestUser.objects.all(),  # Handles both read and write
         source='student'  # Maps to the 'student' ForeignKey field in the model
     )
@@ -443,24 +452,26 @@ class UserQuestAttemptSerializer(serializers.ModelSerializer):
         student = validated_data.pop('student')
         quest = validated_data.pop('quest')
 
-        # Create a UserQuestAttempt instance
-        user_quest_attempt = UserQuestAttempt.objects.create(student=student, quest=quest, **validated_data)
-
-        # Create UserAnswerAttempt for each question in the quest
-        questions = Question.objects.filter(quest=user_quest_attempt.quest)
-        user_answer_attempts = []
-
-        for question in questions:
-            answers = Answer.objects.filter(question=question)
-            for answer in answers:
-                user_answer_attempts.append(UserAnswerAttempt(
-                    user_quest_attempt=user_quest_attempt,
-                    question=question,
-                    answer=answer,
-                    is_selected=False,
-                ))
-        # Bulk create all UserAnswerAttempt instances
-        UserAnswerAttempt.objects.bulk_create(user_answer_attempts)
+        with transaction.atomic():
+            # Create a UserQuestAttempt instance
+            user_quest_attempt = UserQuestAttempt.objects.create(student=student, quest=quest, **validated_data)
+
+            # Create an unselected UserAnswerAttempt for each answer of each question of the quest,
+            # with one INSERT ... SELECT from the answers whatever their number
+            insert_from_select(
+                UserAnswerAttempt,
+                ['user_quest_attempt', 'question', 'answer', 'is_selected', 'score_achieved'],
+                Answer.objects.filter(question__quest=quest).order_by('question_id', 'id').annotate(
+                    prefill_user_quest_attempt_id=Value(user_quest_attempt.id, output_field=IntegerField()),
+                    prefill_question_id=F('question_id'),
+                    prefill_answer_id=F('id'),
+                    prefill_is_selected=Value(False, output_field=BooleanField()),
+                    prefill_score_achieved=Value(0, output_field=FloatField()),
+                ).values_list(
+                    'prefill_user_quest_attempt_id', 'prefill_question_id', 'prefill_answer_id',
+                    'prefill_is_selected', 'prefill_score_achieved'
+                )
+            )
 
         return user_quest_attempt
 
@@ -482,7 +493,7 @@ class UserQuestAttemptSerializer(serializers.ModelSerializer):
 
 class UserQuestAttemptSummarySerializer(serializers.ModelSerializer):
     quest = QuestSummarySerializer(read_only=True)
-    student_id = serializers.PrimaryKeyRelatedField(
+    student_id = BatchedPrimaryKeyRelatedField(
         queryset=EduquestUser.objects.all(),
         source='student',
     )
@@ -494,17 +505,17 @@ class UserQuestAttemptSummarySerializer(serializers.ModelSerializer):
 
 
 class UserAnswerAttemptSerializer(serializers.ModelSerializer):
-    user_quest_attempt_id = serializers.PrimaryKeyRelatedField(
+    user_quest_attempt_id = BatchedPrimaryKeyRelatedField(
         queryset=UserQuestAttempt.objects.all(),
         source='user_quest_attempt',
         # write_only=True
     )
-    question_id = serializers.PrimaryKeyRelatedField(
+    question_id = BatchedPrimaryKeyRelatedField(
         queryset=Question.objects.all(),
         source='question',
         write_only=True
     )
-    answer_id = serializers.PrimaryKeyRelatedField(
+    answer_id = BatchedPrimaryKeyRelatedField(
         queryset=Answer.objects.all(),
         source='answer',
         write_only=True
@@ -567,8 +578,33 @@ class BulkUpdateUserAnswerAttemptSerializer(serializers.Serializer):
         return user_answer_attempts
 
 
+class UserAnswerAttemptBulkItemSerializer(serializers.Serializer):
+    """
+    Validates the items of a UserAnswerAttempt bulk update, which only changes is_selected and score_achieved,
+    without resolving the related fields of UserAnswerAttemptSerializer.
+    The foreign keys may be sent back but cannot be changed, see UserAnswerAttemptViewSet.bulk_update.
+    Keys that UserAnswerAttemptSerializer does not have are rejected instead of being ignored.
+    """
+    id = serializers.IntegerField()
+    user_quest_attempt_id = serializers.IntegerField(required=False)
+    question_id = serializers.IntegerField(required=False)
+    answer_id = serializers.IntegerField(required=False)
+    is_selected = serializers.BooleanField(required=False)
+    score_achieved = serializers.FloatField(required=False)
+
+    # Read-only fields of UserAnswerAttemptSerializer, ignored as they always were
+    read_only_keys = ('question', 'answer')
+
+    def to_internal_value(self, data):
+        if isinstance(data, dict):
+            unknown_keys = [key for key in data if key not in self.fields and key not in self.read_only_keys]
+            if unknown_keys:
+                raise serializers.ValidationError({key: ["Unknown field."] for key in unknown_keys})
+        return super().to_internal_value(data)
+
+
 class BadgeSerializer(serializers.ModelSerializer):
-    image_id = serializers.PrimaryKeyRelatedField(
+    image_id = BatchedPrimaryKeyRelatedField(
         queryset=Image.objects.all(),
         source='image',
         write_only=True
@@ -580,12 +616,12 @@ class BadgeSerializer(serializers.ModelSerializer):
 
 
 class UserCourseBadgeSerializer(serializers.ModelSerializer):
-    badge_id = serializers.PrimaryKeyRelatedField(
+    badge_id = BatchedPrimaryKeyRelatedField(
         queryset=Badge.objects.all(),
         source='badge',
         write_only=True
     )
-    user_course_group_enrollment_id = serializers.PrimaryKeyRelatedField(
+    user_course_group_enrollment_id = BatchedPrimaryKeyRelatedField(
         queryset=UserCourseGroupEnrollment.objects.all(),
         source='user_course_group_enrollment',
         write_only=True
@@ -597,6 +633,23 @@ class UserCourseBadgeSerializer(serializers.ModelSerializer):
         model = UserCourseBadge
         fields = '__all__'
 
+    def validate(self, attrs):
+        instance = self.instance
+        badge = attrs.get('badge', instance.badge if instance else None)
+        user_course_group_enrollment = attrs.get(
+            'user_course_group_enrollment', instance.user_course_group_enrollment if instance else None
+        )
+
+        # Check if the badge has already been awarded for this enrollment
+        if UserCourseBadge.objects.filter(
+            badge=badge, user_course_group_enrollment=user_course_group_enrollment
+        ).exclude(id=instance.id if instance else None).exists():
+            raise serializers.ValidationError({
+                'badge': 'This badge has already been awarded for this course group enrollment.'
+            })
+
+        return attrs
+
     def update(self, instance, validated_data):
         badge = validated_data.pop('badge', None)
         if badge:
@@ -613,12 +666,12 @@ class UserCourseBadgeSerializer(serializers.ModelSerializer):
 
 
 class UserQuestBadgeSerializer(serializers.ModelSerializer):
-    badge_id = serializers.PrimaryKeyRelatedField(
+    badge_id = BatchedPrimaryKeyRelatedField(
         queryset=Badge.objects.all(),
         source='badge',
         write_only=True
     )
-    user_quest_attempt_id = serializers.PrimaryKeyRelatedField(
+    user_quest_attempt_id = BatchedPrimaryKeyRelatedField(
         queryset=UserQuestAttempt.objects.all(),
         source='user_quest_attempt',
         write_only=True
@@ -629,6 +682,21 @@ class UserQuestBadgeSerializer(serializers.ModelSerializer):
         model = UserQuestBadge
         fields = '__all__'
 
+    def validate(self, attrs):
+        instance = self.instance
+        badge = attrs.get('badge', instance.badge if instance else None)
+        user_quest_attempt = attrs.get('user_quest_attempt', instance.user_quest_attempt if instance else None)
+
+        # Check if the badge has already been awarded for this quest attempt
+        if UserQuestBadge.objects.filter(
+            badge=badge, user_quest_attempt=user_quest_attempt
+        ).exclude(id=instance.id if instance else None).exists():
+            raise serializers.ValidationError({
+                'badge': 'This badge has already been awarded for this quest attempt.'
+            })
+
+        return attrs
+
     def update(self, instance, validated_data):
         badge = validated_data.pop('badge', None)
         if badge:
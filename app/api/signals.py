@@ -0,0 +1,89 @@
+from django.core.cache import cache
+from django.db.models import F, Subquery
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .authentication import auth_user_cache_key
+from .badges import badge_catalogue
+from .models import EduquestUser, Image, Course, CourseGroup, UserCourseGroupEnrollment, Badge
+
+
+@receiver([post_save, post_delete], sender=EduquestUser)
+def invalidate_auth_user_cache(sender, instance, **kwargs):
+    """
+    Drop the cached user used by CustomJWTAuthentication whenever the user row changes
+    """
+    if instance.email:
+        cache.delete(auth_user_cache_key(instance.email))
+
+
+def adjust_enrollment_counters(course_group_id, delta):
+    """
+    Atomically add delta to the enrollment counters of a course group and of its course
+    """
+    CourseGroup.objects.filter(pk=course_group_id).update(students_enrolled_count=F('students_enrolled_count') + delta)
+    Course.objects.filter(groups=course_group_id).update(students_enrolled_count=F('students_enrolled_count') + delta)
+
+
+@receiver(post_save, sender=UserCourseGroupEnrollment)
+def count_saved_enrollment(sender, instance, created, raw=False, **kwargs):
+    """
+    Increment the counters for a new enrollment, or move them when the enrollment changes course group
+    """
+    if raw:
+        return
+    if created:
+        adjust_enrollment_counters(instance.course_group_id, 1)
+        return
+    # The tracked stored value is only updated once post_save has been sent
+    changes = instance.tracked_changes(kwargs.get('update_fields'))
+    old_course_group_id = changes.get('course_group')
+    if old_course_group_id is not None:
+        adjust_enrollment_counters(old_course_group_id, -1)
+        adjust_enrollment_counters(instance.course_group_id, 1)
+
+
+@receiver(post_save, sender=CourseGroup)
+def move_course_group_counters(sender, instance, created, raw=False, **kwargs):
+    """
+    Move the enrollments of a course group from the counter of its old course to the new one
+    when the course group changes course
+    """
+    if raw or created:
+        return
+    # The tracked stored value is only updated once post_save has been sent
+    changes = instance.tracked_changes(kwargs.get('update_fields'))
+    old_course_id = changes.get('course')
+    if old_course_id is None:
+        return
+    # The stored counter, the in-memory one may be stale
+    enrolled_count = Subquery(
+        CourseGroup.objects.filter(pk=instance.pk).values('students_enrolled_count')
+    )
+    Course.objects.filter(pk=old_course_id).update(students_enrolled_count=F('students_enrolled_count') - enrolled_count)
+    Course.objects.filter(pk=instance.course_id).update(students_enrolled_count=F('students_enrolled_count') + enrolled_count)
+
+
+@receiver(post_delete, sender=UserCourseGroupEnrollment)
+def count_deleted_enrollment(sender, instance, **kwargs):
+    """
+    Decrement the counters for a deleted enrollment
+    """
+    adjust_enrollment_counters(instance.course_group_id, -1)
+
+
+@receiver([post_save, post_delete], sender=Badge)
+def invalidate_badge_catalogue(sender, **kwargs):
+    """
+    Reload the badge catalogue on next use whenever a badge changes
+    """
+    badge_catalogue.clear()
+
+
+@receiver([post_save, post_delete], sender=Image)
+def invalidate_badge_catalogue_image(sender, instance, **kwargs):
+    """
+    Reload the badge catalogue on next use whenever the image of a cached badge changes
+    """
+    if badge_catalogue.uses_image(instance.id):
+        badge_catalogue.clear()
@@ -0,0 +1,186 @@
+import logging
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+
+from .badges import award_quest_badge, badge_catalogue
+from .models import Badge, Quest, UserQuestAttempt, UserQuestBadge
+from .scoring import add_points, score_quest_attempts, update_by_value
+
+logger = logging.getLogger(__name__)
+
+QUEUE_KEY = 'eduquest:submissions:queue'
+SCHEDULED_KEY = 'eduquest:submissions:scheduled'
+DRAIN_BATCH_SIZE = 500
+
+_redis = None
+
+
+def _get_redis():
+    global _redis
+    if _redis is None:
+        import redis
+        _redis = redis.Redis.from_url(settings.CELERY_BROKER_URL, socket_timeout=1)
+    return _redis
+
+
+def queue_submitted_attempt(user_quest_attempt_id):
+    """
+    Queue a submitted attempt for process_submitted_attempts.
+    Attempts submitted within SUBMISSION_BATCH_WINDOW seconds of each other are collected in a Redis set
+    and processed together by a single task, scheduled by the first attempt of the window.
+    With a window of 0, or when Redis cannot be reached, the attempt gets a task of its own.
+    """
+    from .tasks import process_submitted_attempts
+
+    window = getattr(settings, 'SUBMISSION_BATCH_WINDOW', 0)
+    if window <= 0:
+        process_submitted_attempts.delay([user_quest_attempt_id])
+        return
+    try:
+        client = _get_redis()
+        pipeline = client.pipeline()
+        pipeline.sadd(QUEUE_KEY, user_quest_attempt_id)
+        pipeline.set(SCHEDULED_KEY, 1, nx=True, ex=window)
+        _, first_of_window = pipeline.execute()
+    except Exception as e:
+        logger.warning(f"[Submissions] Failed to queue attempt {user_quest_attempt_id}, processing it on its own: {e}")
+        process_submitted_attempts.delay([user_quest_attempt_id])
+        return
+    if first_of_window:
+        process_submitted_attempts.apply_async(countdown=window)
+
+
+def dispatch_submitted_attempts(user_quest_attempt_ids, batch_size=DRAIN_BATCH_SIZE):
+    """
+    Queue the processing of attempts submitted in bulk, one task per batch of attempts
+    instead of one per attempt.
+    """
+    from .tasks import process_submitted_attempts
+
+    for start in range(0, len(user_quest_attempt_ids), batch_size):
+        process_submitted_attempts.delay(user_quest_attempt_ids[start:start + batch_size])
+
+
+def drain_queued_attempts():
+    """
+    Pop every queued attempt id, in batches of DRAIN_BATCH_SIZE.
+    The scheduled flag is dropped first, so an attempt queued after this point schedules a new task
+    instead of waiting for a task that has already drained the queue.
+    """
+    client = _get_redis()
+    client.delete(SCHEDULED_KEY)
+    while True:
+        ids = client.spop(QUEUE_KEY, DRAIN_BATCH_SIZE)
+        if not ids:
+            return
+        yield [int(attempt_id) for attempt_id in ids]
+
+
+def process_submissions(user_quest_attempt_ids):
+    """
+    Score submitted attempts, add the points they earn to their students and award the
+    "First Attempt" and "Perfectionist" badges, for any number of attempts in one transaction
+    and a fixed number of queries.
+    This replaces calculate_score_and_issue_points, award_first_attempt_badge and award_perfectionist_badge
+    for each attempt, which each loaded the attempt, quest and student again.
+    Returns the number of attempts processed, students who earned points and badges awarded.
+    """
+    with transaction.atomic():
+        # Lock the attempts, so that an attempt rescored concurrently cannot be counted twice
+        attempts = list(
+            UserQuestAttempt.objects.select_for_update(of=('self',)).filter(
+                id__in=list(user_quest_attempt_ids),
+                submitted=True
+            ).select_related('quest').order_by('id')
+        )
+        if not attempts:
+            return {'attempts': 0, 'students_changed': 0, 'badges_awarded': 0}
+        attempt_ids = [attempt.id for attempt in attempts]
+
+        totals = score_quest_attempts(attempt_ids)
+        update_by_value(UserQuestAttempt, 'total_score_achieved', {
+            attempt.id: totals[attempt.id] for attempt in attempts
+            if totals[attempt.id] != attempt.total_score_achieved
+        })
+        for attempt in attempts:
+            attempt.total_score_achieved = totals[attempt.id]
+
+        public_attempts = [attempt for attempt in attempts if attempt.quest.type != 'Private']
+        points_delta = _points_delta(public_attempts, attempt_ids)
+        add_points(points_delta)
+
+        badges_awarded = _award_first_attempt_badges(public_attempts) + _award_perfectionist_badges(public_attempts)
+
+    return {
+        'attempts': len(attempts),
+        'students_changed': len(points_delta),
+        'badges_awarded': badges_awarded,
+    }
+
+
+def _points_delta(attempts, attempt_ids):
+    # A student's points from a quest are their best submitted score, so only the amount by which
+    # the best of the new attempts beats the best of the earlier ones is added
+    new_best = {}
+    for attempt in attempts:
+        key = (attempt.student_id, attempt.quest_id)
+        new_best[key] = max(new_best.get(key, 0), attempt.total_score_achieved)
+    if not new_best:
+        return {}
+
+    old_best = UserQuestAttempt.objects.filter(
+        student_id__in={student_id for student_id, _ in new_best},
+        quest_id__in={quest_id for _, quest_id in new_best},
+        submitted=True
+    ).exclude(id__in=attempt_ids).values('student_id', 'quest_id').annotate(
+        best=Max('total_score_achieved')
+    ).values_list('student_id', 'quest_id', 'best')
+    old_best = {(student_id, quest_id): best for student_id, quest_id, best in old_best}
+
+    points_delta = defaultdict(float)
+    for key, best in new_best.items():
+        delta = best - (old_best.get(key) or 0)
+        if delta > 0:
+            points_delta[key[0]] += delta
+    return points_delta
+
+
+def _award_first_attempt_badges(attempts):
+    if not attempts:
+        return 0
+    try:
+        badge = badge_catalogue.get("First Attempt")
+    except Badge.DoesNotExist:
+        logger.warning("[Submissions] Badge 'First Attempt' does not exist.")
+        return 0
+    first_attempts = {}
+    for attempt in attempts:
+        first_attempts.setdefault(attempt.student_id, attempt.id)
+    has_badge = set(UserQuestBadge.objects.filter(
+        badge=badge,
+        user_quest_attempt__student_id__in=list(first_attempts)
+    ).values_list('user_quest_attempt__student_id', flat=True))
+    return len(award_quest_badge(badge, [
+        attempt_id for student_id, attempt_id in first_attempts.items() if student_id not in has_badge
+    ]))
+
+
+def _award_perfectionist_badges(attempts):
+    if not attempts:
+        return 0
+    try:
+        badge = badge_catalogue.get("Perfectionist")
+    except Badge.DoesNotExist:
+        logger.warning("[Submissions] Badge 'Perfectionist' does not exist.")
+        return 0
+    max_scores = dict(Quest.objects.filter(
+        id__in={attempt.quest_id for attempt in attempts}
+    ).with_totals().values_list('id', 'annotated_total_max_score'))
+    # Quests with only open-ended questions or questions without a correct answer have a max score of 0
+    return len(award_quest_badge(badge, [
+        attempt.id for attempt in attempts
+        if max_scores[attempt.quest_id] and attempt.total_score_achieved == max_scores[attempt.quest_id]
+    ]))
@@ -16,22 +16,93 @@ def test_task():
     return "Task Completed"
 
 
+def schedule_quest_expiry(quest_id, expiration_date):
+    """
+    Queue an ETA task that expires the quest at its expiration date, if that date is within
+    QUEST_EXPIRY_SCHEDULE_HORIZON. Later dates are scheduled by the check_expired_quest sweep.
+    The task carries the expiration date it was scheduled for, so a task made obsolete by a
+    later change of the date does nothing when it runs.
+    """
+    from datetime import timedelta
+    from django.conf import settings
+
+    if expiration_date is None:
+        return False
+    if expiration_date - timezone.now() > timedelta(seconds=settings.QUEST_EXPIRY_SCHEDULE_HORIZON):
+        return False
+    expire_quest.apply_async(args=[quest_id, expiration_date.isoformat()], eta=expiration_date)
+    return True
+
+
+def dispatch_expired_quest_badges(quest_ids, batch_size=100):
+    """
+    Queue the expert and speedster badge evaluation of expired quests, one task per batch of quests
+    instead of two tasks per quest.
+    """
+    for start in range(0, len(quest_ids), batch_size):
+        award_expired_quest_badges.delay(quest_ids[start:start + batch_size])
+
+
+@shared_task
+def award_expired_quest_badges(quest_ids):
+    """
+    Award the "Expert" and "Speedster" badges of a batch of quests that have just expired.
+    """
+    results = []
+    for quest_id in quest_ids:
+        for badge_name, award_badge in (('Expert', award_expert_badge), ('Speedster', award_speedster_badge)):
+            try:
+                results.append(award_badge(quest_id))
+            except Exception as e:
+                # One failing quest must not prevent the badges of the others
+                logger.exception(f"[Expired Quest Badges] Failed to award the {badge_name} badge for quest {quest_id}")
+                results.append(f"[Error] Failed to award the {badge_name} badge for quest {quest_id}: {e}")
+    return results
+
+
+@shared_task
+def expire_quest(quest_id, expected_expiration_date):
+    """
+    ETA task to set an Active quest to 'Expired' when its expiration date is reached.
+    """
+    from datetime import datetime
+    from .models import Quest
+
+    expiration_date = datetime.fromisoformat(expected_expiration_date)
+    if expiration_date > timezone.now():
+        # Delivered early, e.g. because of clock drift between workers
+        expire_quest.apply_async(args=[quest_id, expected_expiration_date], eta=expiration_date)
+        return f"[Expire Quest] Quest {quest_id} is not expired yet, rescheduled"
+
+    # Does nothing if the quest is no longer active, or if its expiration date was changed or removed since
+    if not Quest.objects.filter(id=quest_id, expiration_date=expiration_date).expire():
+        return f"[Expire Quest] Quest {quest_id} is not active or was rescheduled"
+    return f"[Expire Quest] Quest {quest_id} has expired"
+
+
 @shared_task
 def check_expired_quest():
     """
-    Check for expired quests and update their status to 'Expired'.
+    Safety net for the expire_quest ETA tasks, run hourly by Celery beat:
+    update overdue quests to 'Expired' and schedule the quests that expire before the next run.
     """
+    from datetime import timedelta
+    from django.conf import settings
     from .models import Quest
     now = timezone.now()
-    expired_quests = Quest.objects.filter(expiration_date__lt=now, status='Active')
-    expired_quests_ids = [quest.id for quest in expired_quests]
-    if not expired_quests:
-        return "[Expired Quest Check] No expired quests found that need to be updated"
 
-    for quest in expired_quests:
-        quest.status = 'Expired'
-        quest.save()
-    return f"[Expired Quest Check] {len(expired_quests)} expired quests: {expired_quests_ids}"
+    upcoming_quests = Quest.objects.filter(
+        status='Active',
+        expiration_date__gte=now,
+        expiration_date__lte=now + timedelta(seconds=settings.QUEST_EXPIRY_SCHEDULE_HORIZON)
+    ).values_list('id', 'expiration_date')
+    for quest_id, expiration_date in upcoming_quests:
+        schedule_quest_expiry(quest_id, expiration_date)
+
+    expired_quests_ids = Quest.objects.filter(expiration_date__lt=now, status='Active').expire()
+    if not expired_quests_ids:
+        return f"[Expired Quest Check] No expired quests found that need to be updated, {len(upcoming_quests)} quests scheduled"
+    return f"[Expired Quest Check] {len(expired_quests_ids)} expired quests: {expired_quests_ids}, {len(upcoming_quests)} quests scheduled"
 
 
 @shared_task
@@ -81,12 +152,93 @@ def calculate_score_and_issue_points(user_quest_attempt_id):
         return f"[Error] Failed to update score and points for UserQuestAttempt {user_quest_attempt_id}: {e}"
 
 
+@shared_task
+def process_submitted_attempts(user_quest_attempt_ids=None):
+    """
+    Task to score submitted attempts, issue their points and award their "First Attempt" and "Perfectionist" badges.
+    Triggered after a user quest attempt is submitted, see queue_submitted_attempt.
+    Without ids, processes every attempt queued during the batch window.
+    """
+    from .submissions import drain_queued_attempts, process_submissions
+
+    batches = [user_quest_attempt_ids] if user_quest_attempt_ids is not None else drain_queued_attempts()
+    processed = students_changed = badges_awarded = 0
+    failed = []
+    for batch in batches:
+        try:
+            results = [process_submissions(batch)]
+        except Exception:
+            # The batch was rolled back and its ids are no longer queued, so its attempts are processed
+            # one by one: only the failing attempts are left out, as when each attempt had a task of its own
+            logger.exception(f"[Process Submissions] Failed to process attempts {batch}, retrying them one by one")
+            results = []
+            for user_quest_attempt_id in batch:
+                try:
+                    results.append(process_submissions([user_quest_attempt_id]))
+                except Exception:
+                    logger.exception(f"[Process Submissions] Failed to process attempt {user_quest_attempt_id}")
+                    failed.append(user_quest_attempt_id)
+        for result in results:
+            processed += result['attempts']
+            students_changed += result['students_changed']
+            badges_awarded += result['badges_awarded']
+    if failed:
+        return f"[Error] Processed {processed} attempts, failed to process submitted attempts {failed}"
+    return (f"[Process Submissions] Processed {processed} attempts: "
+            f"{students_changed} users earned points, {badges_awarded} badges awarded")
+
+
+@shared_task(bind=True)
+def import_quest_file(self, file_name, quest_data):
+    """
+    Task to import a quest from a staged Wooclap Excel file, see the import_quest and import_status actions.
+    Progress is reported as the PROGRESS state with the current stage and row counts,
+    the result holds the status, quest id, questions and row counts, or the errors of a failed import.
+    """
+    from django.core.files.storage import default_storage
+    from .importer import QuestImportError, run_quest_import
+
+    def report_progress(stage, counts):
+        # Eager tasks (e.g. in tests) have no result backend to report to
+        if not self.request.is_eager:
+            self.update_state(state='PROGRESS', meta={'status': 'running', 'stage': stage, 'counts': counts})
+
+    try:
+        with default_storage.open(file_name, 'rb') as excel_file:
+            quest, questions, counts = run_quest_import(excel_file, quest_data, report_progress)
+    except QuestImportError as e:
+        return {'status': 'failed', 'errors': e.errors}
+    except Exception as e:
+        logger.exception(f"[Import Quest] Failed to import {file_name}")
+        return {'status': 'failed', 'errors': {"Error importing quest": str(e)}}
+    finally:
+        default_storage.delete(file_name)
+    logger.info(f"[Import Quest] Imported quest {quest.id} from {file_name}: {counts}")
+    return {'status': 'completed', 'quest_id': quest.id, 'questions': questions, 'counts': counts}
+
+
+@shared_task
+def rescore_quests(quest_ids):
+    """
+    Task to recompute the scores of all submitted attempts of the given quests and the affected users' total points.
+    """
+    from .scoring import rescore_quests as rescore
+
+    try:
+        result = rescore(quest_ids)
+        return (f"[Rescore Quests] Rescored {result['attempts']} attempts of quests {quest_ids}: "
+                f"{result['attempts_changed']} attempt scores and {result['students_changed']} users' points changed")
+    except Exception as e:
+        return f"[Error] Failed to rescore quests {quest_ids}: {e}"
+
+
 @shared_task
 def award_first_attempt_badge(user_quest_attempt_id):
     """
     Award the "First Attempt" badge to a user who has attempted a quest for the first time.
     Triggered after a user quest attempt is submitted.
     """
+    from .badges import award_quest_badge, badge_catalogue
     from .models import UserQuestAttempt, Badge, UserQuestBadge
     try:
         attempt = UserQuestAttempt.objects.get(id=user_quest_attempt_id)
@@ -100,20 +252,17 @@ def award_first_attempt_badge(user_quest_attempt_id):
 
         user = attempt.student
 
+        badge = badge_catalogue.get("First Attempt")
+
         # Check if the user has any "First Attempt" badge
         has_badge = UserQuestBadge.objects.filter(
             user_quest_attempt__student=user,
-            badge__name="First Attempt"
+            badge=badge
         ).exists()
 
         if not has_badge:
             # Award the "First Attempt" badge
-            badge = Badge.objects.get(name="First Attempt")
-            user_quest_badge, created = UserQuestBadge.objects.get_or_create(
-                badge=badge,
-                user_quest_attempt=attempt
-            )
-            if created:
+            if award_quest_badge(badge, [attempt.id]):
                 return f"[First Attempt] Badge awarded to user: {user.username}"
             else:
                 return f"[First Attempt] User: {user.username} already has the badge"
@@ -130,7 +279,8 @@ def award_perfectionist_badge(user_quest_attempt_id):
     Award the "Perfectionist" badge to a user who has achieved full marks for a quest.
     Triggered after a user quest attempt is submitted.
     """
-    from .models import Quest, UserQuestAttempt, UserQuestBadge, Badge
+    from .badges import award_quest_badge, badge_catalogue
+    from .models import Quest, UserQuestAttempt, Badge
     try:
         attempt = UserQuestAttempt.objects.get(id=user_quest_attempt_id)
         quest = attempt.quest
@@ -150,12 +300,8 @@ def award_perfectionist_badge(user_quest_attempt_id):
 
         if total_score_achieved == quest_max_score:
             # Award the "Perfectionist" badge
-            badge = Badge.objects.get(name="Perfectionist")
-            user_quest_badge, created = UserQuestBadge.objects.get_or_create(
-                badge=badge,
-                user_quest_attempt=attempt
-            )
-            if created:
+            badge = badge_catalogue.get("Perfectionist")
+            if award_quest_badge(badge, [attempt.id]):
                 return f"[Perfectionist] Badge awarded to user: {attempt.student.username}"
             else:
                 return f"[Perfectionist] User: {attempt.student.username} already has the badge for this quest"
@@ -176,7 +322,8 @@ def award_speedster_badge(quest_id):
     Award the "Speedster" badge to the fastest user who has completed a quest.
     Triggered after a quest status is changed from Active to Expired.
     """
-    from .models import Quest, UserQuestAttempt, UserQuestBadge, Badge
+    from .badges import award_quest_badge, badge_catalogue
+    from .models import Quest, UserQuestAttempt
     try:
         quest = Quest.objects.get(id=quest_id)
         if quest.type == "Private":
@@ -215,11 +362,7 @@ def award_speedster_badge(quest_id):
         logger.info(f"[Speedster] Top three scores for quest: {quest.name} are: {top_three_scores}")
 
         if fastest_attempt_score in top_three_scores:
-            badge, created = UserQuestBadge.objects.get_or_create(
-                badge=Badge.objects.get(name="Speedster"),
-                user_quest_attempt=fastest_attempt
-            )
-            if created:
+            if award_quest_badge(badge_catalogue.get("Speedster"), [fastest_attempt.id]):
                 return f"[Speedster] Badge awarded to user: {fastest_attempt.student.username}"
             else:
                 return f"[Speedster] User: {fastest_attempt.student.username} already has the badge."
@@ -236,7 +379,8 @@ def award_expert_badge(quest_id):
     Award the "Expert" badge to the user who has scored the highest for a quest.
     Triggered after a quest status is changed from Active to Expired.
     """
-    from .models import Quest, UserQuestAttempt, UserQuestBadge, Badge
+    from .badges import award_quest_badge, badge_catalogue
+    from .models import Quest, UserQuestAttempt, Badge
     try:
         quest = Quest.objects.get(id=quest_id)
 
@@ -264,23 +408,22 @@ def award_expert_badge(quest_id):
             return f"[Expert] No user scored above 0 for quest: {quest.name}"
 
         # Get all attempts with the highest score
-        top_attempts = user_quest_attempts.filter(total_score_achieved=highest_score)
+        top_attempts = list(
+            user_quest_attempts.filter(total_score_achieved=highest_score).values_list('id', 'student__username')
+        )
 
-        badge = Badge.objects.get(name="Expert")
+        badge = badge_catalogue.get("Expert")
         logger.info(f"[Expert] Highest score for quest: {quest.name} is: {highest_score}")
 
-        if top_attempts.count() == 0:
+        if not top_attempts:
             return f"[Expert] No attempts with the highest score for quest: {quest.name}"
 
-        users_awarded = []
-        for attempt in top_attempts:
-            UserQuestBadge.objects.get_or_create(
-                badge=badge,
-                user_quest_attempt=attempt
-            )
-            users_awarded.append(attempt.student.username)
+        # Award all tied attempts at once
+        awarded_count = len(award_quest_badge(badge, [attempt_id for attempt_id, _ in top_attempts]))
+        users_awarded = [username for _, username in top_attempts]
 
-        return f"[Expert] Badge awarded to users: {users_awarded} with the highest score: {highest_score} for quest: {quest.name}"
+        return (f"[Expert] Badge awarded to users: {users_awarded} with the highest score: {highest_score} "
+                f"for quest: {quest.name} ({awarded_count} new awards)")
 
     except Quest.DoesNotExist:
         return f"[Expert] Quest with id {quest_id} does not exist."
@@ -324,8 +467,11 @@ def check_course_completion_and_award_completionist_badge(course_id):
     and issue the "Completionist" badge.
     Triggered after a course status is changed from Active to Expired.
     """
+    from django.db import transaction
+    from django.db.models import Count, F, OuterRef, Subquery
     from django.utils import timezone
-    from .models import UserQuestAttempt, Quest, UserCourseGroupEnrollment, Badge, UserCourseBadge
+    from .badges import award_course_badge, badge_catalogue
+    from .models import UserQuestAttempt, Quest, UserCourseGroupEnrollment
     try:
 
         user_course_group_enrollments = UserCourseGroupEnrollment.objects.filter(course_group__course_id=course_id)
@@ -333,47 +479,40 @@ def check_course_completion_and_award_completionist_badge(course_id):
         if not user_course_group_enrollments.exists():
             return f"[Course Completion Check] No user enrollments found for course: {course_id}"
 
-        awarded_users = []
-        for user_course_group_enrollment in user_course_group_enrollments:
-            course_group = user_course_group_enrollment.course_group
-            user = user_course_group_enrollment.student
-
-            # Get all non-private quests under the course group
-            quests_in_group = Quest.objects.filter(
-                course_group=course_group
-            ).exclude(type="Private")
-
-            # Check if there are any quests to complete
-            if not quests_in_group.exists():
-                logger.info(f"[Course Completion Check] No quests found in course group {course_group.name}")
-                continue
-
-            # Get IDs of all quests in the course group
-            quests_in_group_ids = set(quests_in_group.values_list('id', flat=True))
-
-            # Get IDs of quests the user has submitted attempts for
-            user_attempts_in_group = set(
-                UserQuestAttempt.objects.filter(
-                    student=user,
-                    quest__in=quests_in_group,
-                    submitted=True
-                ).values_list('quest_id', flat=True)
-            )
-            # Check if the user has submitted attempts for all quests
-            if quests_in_group_ids == user_attempts_in_group:
-                # User has completed all quests
-                user_course_group_enrollment.completed_on = timezone.now()
-                user_course_group_enrollment.save()
-
-                # Award the "Completionist" badge
-                badge = Badge.objects.get(name="Completionist")
-                UserCourseBadge.objects.get_or_create(
-                    badge=badge,
-                    user_course_group_enrollment=user_course_group_enrollment
-                )
-                awarded_users.append(user_course_group_enrollment.student.username)
-
-        return f"[Course Completion Check] Badge awarded to users: {awarded_users} for completing course group: {course_group}"
+        # Number of non-private quests in the enrollment's course group
+        group_quest_count = Quest.objects.filter(
+            course_group=OuterRef('course_group')
+        ).exclude(type="Private").order_by().values('course_group').annotate(total=Count('id')).values('total')
+        # Number of distinct non-private quests of the group the student has submitted
+        submitted_quest_count = UserQuestAttempt.objects.filter(
+            student=OuterRef('student'),
+            quest__course_group=OuterRef('course_group'),
+            submitted=True
+        ).exclude(quest__type="Private").order_by().values('student').annotate(
+            total=Count('quest', distinct=True)
+        ).values('total')
+
+        # A student completed the group when they submitted every quest in it, groups without quests are skipped
+        completed_enrollments = list(user_course_group_enrollments.annotate(
+            group_quest_count=Subquery(group_quest_count),
+            submitted_quest_count=Subquery(submitted_quest_count)
+        ).filter(
+            group_quest_count__gt=0,
+            submitted_quest_count=F('group_quest_count')
+        ).values_list('id', 'student__username'))
+
+        if not completed_enrollments:
+            return f"[Course Completion Check] No users completed course: {course_id}"
+
+        completed_enrollment_ids = [enrollment_id for enrollment_id, _ in completed_enrollments]
+        badge = badge_catalogue.get("Completionist")
+        with transaction.atomic():
+            UserCourseGroupEnrollment.objects.filter(id__in=completed_enrollment_ids).update(completed_on=timezone.now())
+            awarded_count = len(award_course_badge(badge, completed_enrollment_ids))
+
+        awarded_users = [username for _, username in completed_enrollments]
+        return (f"[Course Completion Check] Badge awarded to users: {awarded_users} for completing course: {course_id} "
+                f"({awarded_count} new awards)")
 
     except UserCourseGroupEnrollment.DoesNotExist:
         return f"[Course Completion Check] UserCourseGroupEnrollment with course id {course_id} does not exist."
@@ -1,10 +1,19 @@
-from django.test import TestCase, RequestFactory
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from django.core.cache import cache
+from django.test import TestCase, RequestFactory, override_settings
 from unittest.mock import patch, MagicMock
 from django.contrib.auth import get_user_model
 from rest_framework.exceptions import AuthenticationFailed
 import jwt
+from cryptography.hazmat.primitives.asymmetric import rsa
 from datetime import datetime, timedelta
-from ..authentication import CustomJWTAuthentication
+from ..authentication import CustomJWTAuthentication, auth_user_cache_key
+from ..models import EduquestUser
+from ..jwks import REFRESH_LOCK_STRIPES, jwks_key_store
+from ..token_cache import verified_token_cache
 
 
 User = get_user_model()
@@ -13,6 +22,8 @@ User = get_user_model()
 class CustomJWTAuthenticationTest(TestCase):
 
     def setUp(self):
+        jwks_key_store.clear()
+        verified_token_cache.clear()
         self.auth = CustomJWTAuthentication()
         self.factory = RequestFactory()
         self.user = User.objects.create_user(
@@ -22,7 +33,7 @@ class CustomJWTAuthenticationTest(TestCase):
 
     @patch('api.authentication.jwt.get_unverified_header')
     @patch('api.authentication.jwt.decode')
-    @patch('api.authentication.requests.get')
+    @patch('api.jwks.requests.get')
     def test_authenticate_valid_token(self, mock_requests_get, mock_jwt_decode, mock_get_unverified_header):
         """
         Test that a valid token is successfully authenticated.
@@ -81,7 +92,7 @@ class CustomJWTAuthenticationTest(TestCase):
 
     @patch('api.authentication.jwt.get_unverified_header')
     @patch('api.authentication.jwt.decode')
-    @patch('api.authentication.requests.get')
+    @patch('api.jwks.requests.get')
     def test_authenticate_invalid_token(self, mock_get_unverified_header, mock_jwt_decode, mock_requests_get):
         """
         Test that an invalid token raises an AuthenticationFailed exception.
@@ -116,4 +127,396 @@ class CustomJWTAuthenticationTest(TestCase):
             self.auth.authenticate(request)
 
         # Check that the expected error message is in the exception
-        self.assertIn('Token has expired, please authenticate again.', str(context.exception))
\ No newline at end of file
+        self.assertIn('Token has expired, please authenticate again.', str(context.exception))
+
+
+class StandInJWKSServer:
+    """
+    Local stand-in for the Azure AD discovery keys endpoint
+    """
+
+    def __init__(self, keys, delay=0):
+        self.keys = keys
+        self.delay = delay
+        self.requests_served = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.requests_served += 1
+                time.sleep(server.delay)
+                body = json.dumps({'keys': server.keys}).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_port}/{{tenant_id}}/discovery/v2.0/keys"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def generate_signing_key(kid):
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    jwk = json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(private_key.public_key()))
+    jwk.update({'kid': kid, 'use': 'sig'})
+    return private_key, jwk
+
+
+class JWKSKeyStoreTest(TestCase):
+
+    def setUp(self):
+        jwks_key_store.clear()
+        verified_token_cache.clear()
+        self.private_key, self.jwk = generate_signing_key('kid-1')
+        self.server = StandInJWKSServer([self.jwk])
+        self.settings_override = override_settings(
+            AZURE_JWKS_URL=self.server.url,
+            AZURE_JWKS_MIN_REFRESH_INTERVAL=0,
+            AZURE_CLIENT_ID='test-client-id',
+        )
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.server.stop()
+        jwks_key_store.clear()
+
+    def test_keys_are_fetched_once_and_cached(self):
+        """
+        Test that repeated lookups for the same tenant and kid are served from memory.
+        """
+        for _ in range(5):
+            self.assertEqual(jwks_key_store.get_signing_key('tenant123', 'kid-1'), self.jwk)
+        self.assertEqual(self.server.requests_served, 1)
+        stats = jwks_key_store.stats()
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['hits'], 4)
+        self.assertEqual(stats['refreshes'], 1)
+
+    def test_keys_are_cached_per_tenant(self):
+        """
+        Test that each tenant has its own cache entry.
+        """
+        jwks_key_store.get_signing_key('tenant123', 'kid-1')
+        jwks_key_store.get_signing_key('tenant456', 'kid-1')
+        self.assertEqual(self.server.requests_served, 2)
+
+    def test_unknown_kid_triggers_refresh(self):
+        """
+        Test that a rotated key is picked up by refreshing the keys on an unknown kid.
+        """
+        jwks_key_store.get_signing_key('tenant123', 'kid-1')
+        _, rotated_jwk = generate_signing_key('kid-2')
+        self.server.keys = [self.jwk, rotated_jwk]
+
+        self.assertEqual(jwks_key_store.get_signing_key('tenant123', 'kid-2'), rotated_jwk)
+        self.assertEqual(self.server.requests_served, 2)
+
+    @override_settings(AZURE_JWKS_MIN_REFRESH_INTERVAL=60)
+    def test_unknown_kid_refresh_is_throttled(self):
+        """
+        Test that tokens with unknown kids cannot force a fetch on every request.
+        """
+        jwks_key_store.get_signing_key('tenant123', 'kid-1')
+        self.assertIsNone(jwks_key_store.get_signing_key('tenant123', 'unknown'))
+        self.assertIsNone(jwks_key_store.get_signing_key('tenant123', 'unknown'))
+        self.assertEqual(self.server.requests_served, 1)
+
+    @override_settings(AZURE_JWKS_CACHE_TTL=0, AZURE_JWKS_STALE_TTL=60)
+    def test_stale_keys_are_served_while_refreshing(self):
+        """
+        Test that expired keys are still served while a background refresh runs.
+        """
+        jwks_key_store.get_signing_key('tenant123', 'kid-1')
+        self.server.delay = 0.2
+
+        start = time.monotonic()
+        self.assertEqual(jwks_key_store.get_signing_key('tenant123', 'kid-1'), self.jwk)
+        self.assertLess(time.monotonic() - start, 0.2)
+        self.assertEqual(jwks_key_store.stats()['stale_hits'], 1)
+
+        # Wait for the background refresh to complete
+        for _ in range(50):
+            if jwks_key_store.stats()['refreshes'] == 2:
+                break
+            time.sleep(0.05)
+        self.assertEqual(self.server.requests_served, 2)
+
+    def test_concurrent_misses_fetch_once(self):
+        """
+        Test that a burst of requests on a cold cache results in a single fetch.
+        """
+        self.server.delay = 0.2
+        results = []
+
+        def lookup():
+            results.append(jwks_key_store.get_signing_key('tenant123', 'kid-1'))
+
+        threads = [threading.Thread(target=lookup) for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results, [self.jwk] * 10)
+        self.assertEqual(self.server.requests_served, 1)
+
+    def test_failed_refresh_keeps_serving_cached_keys(self):
+        """
+        Test that an unreachable endpoint does not fail requests with cached keys.
+        """
+        jwks_key_store.get_signing_key('tenant123', 'kid-1')
+        self.server.stop()
+        with override_settings(AZURE_JWKS_CACHE_TTL=0, AZURE_JWKS_STALE_TTL=0, AZURE_JWKS_FETCH_TIMEOUT=1):
+            self.assertEqual(jwks_key_store.get_signing_key('tenant123', 'kid-1'), self.jwk)
+        self.assertEqual(jwks_key_store.stats()['refresh_errors'], 1)
+        self.server = StandInJWKSServer([self.jwk])
+
+    def test_get_validated_token_against_stand_in_server(self):
+        """
+        Test that a token signed with a published key is validated end to end.
+        """
+        payload = {
+            'tid': 'tenant123',
+            'aud': 'test-client-id',
+            'preferred_username': 'testuser@e.ntu.edu.sg',
+            'exp': int(time.time()) + 3600,
+        }
+        token = jwt.encode(payload, self.private_key, algorithm='RS256', headers={'kid': 'kid-1'})
+
+        auth = CustomJWTAuthentication()
+        for _ in range(3):
+            self.assertEqual(auth.get_validated_token(token), payload)
+        self.assertEqual(self.server.requests_served, 1)
+
+    def test_get_validated_token_with_unpublished_kid(self):
+        """
+        Test that a token signed with a key that is not published is rejected.
+        """
+        private_key, _ = generate_signing_key('kid-unpublished')
+        token = jwt.encode({'tid': 'tenant123', 'aud': 'test-client-id'}, private_key,
+                           algorithm='RS256', headers={'kid': 'kid-unpublished'})
+
+        with self.assertRaises(AuthenticationFailed):
+            CustomJWTAuthentication().get_validated_token(token)
+
+    @override_settings(AZURE_JWKS_MAX_TENANTS=3)
+    def test_forged_tenants_are_bounded(self):
+        """
+        Test that tokens with made-up tenant ids cannot grow the key store without limit.
+        """
+        jwks_key_store.get_public_key('tenant123', 'kid-1')
+        private_key, _ = generate_signing_key('kid-unpublished')
+        auth = CustomJWTAuthentication()
+        for number in range(10):
+            token = jwt.encode({'tid': f'forged-{number}', 'aud': 'test-client-id'}, private_key,
+                               algorithm='RS256', headers={'kid': 'kid-unpublished'})
+            with self.assertRaises(AuthenticationFailed):
+                auth.get_validated_token(token)
+
+        self.assertEqual(list(jwks_key_store._entries), ['forged-7', 'forged-8', 'forged-9'])
+        self.assertLessEqual(len(jwks_key_store._last_refresh_attempt), 3)
+        self.assertEqual(len(jwks_key_store._refresh_locks), REFRESH_LOCK_STRIPES)
+        # The public keys of evicted tenants are dropped with them
+        self.assertEqual(jwks_key_store._public_keys, {})
+        # An evicted tenant is fetched again
+        self.assertEqual(jwks_key_store.get_signing_key('tenant123', 'kid-1'), self.jwk)
+        self.assertEqual(self.server.requests_served, 12)
+
+
+class VerifiedTokenCacheTest(TestCase):
+
+    def setUp(self):
+        jwks_key_store.clear()
+        verified_token_cache.clear()
+        self.private_key, self.jwk = generate_signing_key('kid-1')
+        jwks_key_store.prime('tenant123', [self.jwk])
+        self.settings_override = override_settings(AZURE_CLIENT_ID='test-client-id')
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        jwks_key_store.clear()
+        verified_token_cache.clear()
+
+    def make_token(self, **claims):
+        payload = {'tid': 'tenant123', 'aud': 'test-client-id', 'exp': int(time.time()) + 3600, **claims}
+        return jwt.encode(payload, self.private_key, algorithm='RS256', headers={'kid': 'kid-1'}).encode()
+
+    def test_signature_is_verified_once_per_token(self):
+        """
+        Test that repeated requests with the same token skip the RS256 verification.
+        """
+        token = self.make_token()
+        auth = CustomJWTAuthentication()
+        with patch('api.authentication.jwt.decode', wraps=jwt.decode) as mock_decode:
+            first = auth.get_validated_token(token)
+            for _ in range(5):
+                self.assertEqual(auth.get_validated_token(token), first)
+        # One unverified and one verified decode for the first request only
+        self.assertEqual(mock_decode.call_count, 2)
+        self.assertEqual(verified_token_cache.stats()['hits'], 5)
+
+    def test_public_key_is_built_once_per_kid(self):
+        """
+        Test that the public key object is reused across different tokens signed with the same key.
+        """
+        auth = CustomJWTAuthentication()
+        with patch('api.jwks.jwt.algorithms.RSAAlgorithm.from_jwk',
+                   wraps=jwt.algorithms.RSAAlgorithm.from_jwk) as mock_from_jwk:
+            auth.get_validated_token(self.make_token(sub='a'))
+            auth.get_validated_token(self.make_token(sub='b'))
+        self.assertEqual(mock_from_jwk.call_count, 1)
+
+    def test_expired_entries_are_not_served(self):
+        """
+        Test that a cached token is no longer served once its exp has passed.
+        """
+        verified_token_cache.set(b'raw.token', {'exp': int(time.time()) - 1})
+        self.assertIsNone(verified_token_cache.get(b'raw.token'))
+
+    def test_expired_token_is_rejected_after_being_cached(self):
+        """
+        Test that a token that expired after being cached goes through full validation again.
+        """
+        token = self.make_token(exp=int(time.time()) + 60)
+        auth = CustomJWTAuthentication()
+        auth.get_validated_token(token)
+        with patch('api.token_cache.time.time', return_value=time.time() + 120):
+            self.assertIsNone(verified_token_cache.get(token))
+
+    def test_tokens_without_exp_are_not_cached(self):
+        """
+        Test that tokens without an exp claim are never cached.
+        """
+        verified_token_cache.set(b'raw.token', {'sub': 'a'})
+        self.assertIsNone(verified_token_cache.get(b'raw.token'))
+
+    @override_settings(AZURE_TOKEN_CACHE_SIZE=2)
+    def test_cache_is_bounded(self):
+        """
+        Test that the least recently used token is evicted when the cache is full.
+        """
+        exp = int(time.time()) + 3600
+        verified_token_cache.set(b'token.a', {'exp': exp})
+        verified_token_cache.set(b'token.b', {'exp': exp})
+        verified_token_cache.get(b'token.a')
+        verified_token_cache.set(b'token.c', {'exp': exp})
+
+        self.assertIsNotNone(verified_token_cache.get(b'token.a'))
+        self.assertIsNone(verified_token_cache.get(b'token.b'))
+        self.assertIsNotNone(verified_token_cache.get(b'token.c'))
+        self.assertEqual(verified_token_cache.stats()['size'], 2)
+
+    @override_settings(AZURE_TOKEN_CACHE_SIZE=2)
+    def test_expired_entries_are_evicted_first(self):
+        """
+        Test that a full cache drops its expired tokens before the least recently used valid one.
+        """
+        verified_token_cache.set(b'token.a', {'exp': int(time.time()) + 3600})
+        verified_token_cache.set(b'token.b', {'exp': int(time.time()) - 1})
+        verified_token_cache.set(b'token.c', {'exp': int(time.time()) + 3600})
+
+        self.assertIsNotNone(verified_token_cache.get(b'token.a'))
+        self.assertIsNotNone(verified_token_cache.get(b'token.c'))
+        self.assertEqual(verified_token_cache.stats()['size'], 2)
+
+    def test_rejected_tokens_are_not_cached(self):
+        """
+        Test that tokens that fail validation never take a place in the cache.
+        """
+        private_key, _ = generate_signing_key('kid-1')
+        auth = CustomJWTAuthentication()
+        for number in range(5):
+            token = jwt.encode({'tid': 'tenant123', 'aud': 'test-client-id', 'exp': int(time.time()) + 3600,
+                                'sub': str(number)}, private_key, algorithm='RS256', headers={'kid': 'kid-1'})
+            with self.assertRaises(AuthenticationFailed):
+                auth.get_validated_token(token)
+        self.assertEqual(verified_token_cache.stats()['size'], 0)
+
+
+class GetOrCreateUserTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.auth = CustomJWTAuthentication()
+        self.issued_at = datetime(2024, 9, 1, 10, 0, 0)
+        self.token = {
+            'preferred_username': 'student@e.ntu.edu.sg',
+            'name': '#Student One#',
+            'iat': self.issued_at.timestamp(),
+        }
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_new_user_is_created(self):
+        """
+        Test that the first request of a new user creates the user.
+        """
+        user = self.auth.get_or_create_user(self.token)
+        self.assertEqual(user.email, 'STUDENT@E.NTU.EDU.SG')
+        self.assertFalse(user.is_staff)
+        self.assertIsNotNone(user.last_login)
+
+    def test_repeated_requests_do_not_query_the_database(self):
+        """
+        Test that requests with the same token are served from the cache without any query.
+        """
+        user = self.auth.get_or_create_user(self.token)
+        with self.assertNumQueries(0):
+            for _ in range(5):
+                self.assertEqual(self.auth.get_or_create_user(self.token).pk, user.pk)
+
+    def test_existing_user_is_not_saved(self):
+        """
+        Test that authenticating an existing user does not bump updated_at.
+        """
+        user = self.auth.get_or_create_user(self.token)
+        updated_at = EduquestUser.objects.get(pk=user.pk).updated_at
+        cache.clear()
+
+        self.auth.get_or_create_user(self.token)
+        self.assertEqual(EduquestUser.objects.get(pk=user.pk).updated_at, updated_at)
+
+    def test_last_login_is_written_only_when_it_changes(self):
+        """
+        Test that a new token updates last_login with a single write.
+        """
+        user = self.auth.get_or_create_user(self.token)
+        previous_last_login = EduquestUser.objects.get(pk=user.pk).last_login
+
+        new_token = dict(self.token, iat=(self.issued_at + timedelta(hours=1)).timestamp())
+        with self.assertNumQueries(1):
+            self.auth.get_or_create_user(new_token)
+        self.assertEqual(
+            EduquestUser.objects.get(pk=user.pk).last_login,
+            previous_last_login + timedelta(hours=1)
+        )
+
+    def test_cache_is_invalidated_when_user_changes(self):
+        """
+        Test that saving the user drops the cached copy.
+        """
+        user = self.auth.get_or_create_user(self.token)
+        self.assertIsNotNone(cache.get(auth_user_cache_key(user.email)))
+
+        user.nickname = 'New Nickname'
+        user.save()
+        self.assertIsNone(cache.get(auth_user_cache_key(user.email)))
+        self.assertEqual(self.auth.get_or_create_user(self.token).nickname, 'New Nickname')
+
+    def test_invalid_domain(self):
+        """
+        Test that users from other domains are rejected.
+        """
+        with self.assertRaises(AuthenticationFailed):
+            self.auth.get_or_create_user(dict(self.token, preferred_username='someone@gmail.com'))
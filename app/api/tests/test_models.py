@@ -1,9 +1,16 @@
 from datetime import timedelta
+import os
+from io import StringIO
+from django.core.cache import cache
+from django.core.management import call_command
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.utils import timezone
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth import get_user_model
 from unittest.mock import patch
+import pandas as pd
 
 from ..models import (
     EduquestUser,
@@ -24,6 +31,10 @@ from ..models import (
     Document
 )
 
+from ..authentication import auth_user_cache_key
+from ..excel import Excel
+from ..importer import import_quest_attempts
+from ..scoring import score_quest_attempts, rescore_quests
 from .factory import (
     EduquestUserFactory,
     ImageFactory,
@@ -336,6 +347,102 @@ class UserCourseGroupEnrollmentModelTest(TestCase):
         self.assertEqual(enrollment_refreshed.completed_on, completion_time)
 
 
+class EnrollmentCounterTest(TestCase):
+
+    def setUp(self):
+        self.coordinator = EduquestUserFactory()
+        self.course = CourseFactory()
+        self.group1 = CourseGroupFactory(course=self.course, instructor=self.coordinator)
+        self.group2 = CourseGroupFactory(course=self.course, instructor=self.coordinator)
+        self.student1 = EduquestUserFactory()
+        self.student2 = EduquestUserFactory()
+
+    def assertCounters(self, course_count, group1_count, group2_count):
+        self.course.refresh_from_db()
+        self.group1.refresh_from_db()
+        self.group2.refresh_from_db()
+        self.assertEqual(self.course.students_enrolled_count, course_count)
+        self.assertEqual(self.group1.students_enrolled_count, group1_count)
+        self.assertEqual(self.group2.students_enrolled_count, group2_count)
+        self.assertEqual(self.course.total_students_enrolled(), course_count)
+
+    def test_counters_follow_enrollments(self):
+        """
+        Test that creating and deleting enrollments updates the course and course group counters
+        """
+        enrollment1 = UserCourseGroupEnrollment.objects.create(student=self.student1, course_group=self.group1)
+        UserCourseGroupEnrollment.objects.create(student=self.student2, course_group=self.group2)
+        self.assertCounters(2, 1, 1)
+        enrollment1.delete()
+        self.assertCounters(1, 0, 1)
+
+    def test_counters_follow_course_group_change(self):
+        """
+        Test that moving an enrollment to another course group moves the counters
+        """
+        enrollment = UserCourseGroupEnrollment.objects.create(student=self.student1, course_group=self.group1)
+        enrollment = UserCourseGroupEnrollment.objects.get(id=enrollment.id)
+        enrollment.course_group = self.group2
+        enrollment.save()
+        self.assertCounters(1, 0, 1)
+        # Saving again without a change does not move the counters
+        enrollment.save()
+        self.assertCounters(1, 0, 1)
+
+    def test_saving_stale_instance_keeps_counters(self):
+        """
+        Test that saving a course or course group loaded before an enrollment does not overwrite the counters
+        """
+        stale_course = Course.objects.get(id=self.course.id)
+        stale_group = CourseGroup.objects.get(id=self.group1.id)
+        UserCourseGroupEnrollment.objects.create(student=self.student1, course_group=self.group1)
+        stale_course.name = 'Renamed'
+        stale_course.save()
+        stale_group.name = 'Renamed'
+        stale_group.save()
+        self.assertCounters(1, 1, 0)
+
+    def test_deleting_course_group_updates_course_counter(self):
+        """
+        Test that deleting a course group removes its enrollments from the course counter
+        """
+        UserCourseGroupEnrollment.objects.create(student=self.student1, course_group=self.group1)
+        UserCourseGroupEnrollment.objects.create(student=self.student2, course_group=self.group2)
+        self.group1.delete()
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.students_enrolled_count, 1)
+
+    def test_counters_follow_course_change(self):
+        """
+        Test that moving a course group to another course moves its enrollments between the course counters
+        """
+        other_course = CourseFactory()
+        # Loaded before the enrollments, its in-memory counter is stale
+        group = CourseGroup.objects.get(id=self.group1.id)
+        UserCourseGroupEnrollment.objects.create(student=self.student1, course_group=self.group1)
+        UserCourseGroupEnrollment.objects.create(student=self.student2, course_group=self.group1)
+        UserCourseGroupEnrollment.objects.create(student=self.student1, course_group=self.group2)
+        group.course = other_course
+        group.save()
+        # Saving again without a change does not move the counters
+        group.save()
+
+        other_course.refresh_from_db()
+        self.assertEqual(other_course.students_enrolled_count, 2)
+        self.assertEqual(other_course.total_students_enrolled(), 2)
+        self.assertCounters(1, 2, 1)
+
+    def test_rebuild_enrollment_counters(self):
+        """
+        Test that the rebuild_enrollment_counters command recomputes drifted counters
+        """
+        UserCourseGroupEnrollment.objects.create(student=self.student1, course_group=self.group1)
+        Course.objects.filter(id=self.course.id).update(students_enrolled_count=42)
+        CourseGroup.objects.filter(id=self.group2.id).update(students_enrolled_count=-3)
+        call_command('rebuild_enrollment_counters', stdout=StringIO())
+        self.assertCounters(1, 1, 0)
+
+
 class QuestModelTest(TestCase):
 
     def setUp(self):
@@ -543,34 +650,275 @@ class UserQuestAttemptModelTest(TestCase):
         # Time taken should be approximately 600000 milliseconds (10 minutes)
         self.assertAlmostEqual(self.attempt.time_taken, 600000, delta=1000)
 
-    @patch('api.tasks.award_first_attempt_badge.delay')
-    @patch('api.tasks.calculate_score_and_issue_points.delay')
-    def test_save_trigger_tasks_on_submission(self, mock_score_task, mock_badge_task):
+    @patch('api.submissions.queue_submitted_attempt')
+    def test_save_trigger_tasks_on_submission(self, mock_queue):
         """
-        Test that the tasks are triggered when the attempt is submitted
+        Test that the attempt is queued for processing once its submission is committed
         """
         # Submit the attempt
-        self.attempt.submitted = True
-        self.attempt.save()
-        # Assert that both tasks were called with the attempt ID
-        mock_score_task.assert_called_with(self.attempt.id)
-        mock_badge_task.assert_called_with(self.attempt.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.attempt.submitted = True
+            self.attempt.save()
+            # Nothing is queued before the submission is committed
+            mock_queue.assert_not_called()
+        mock_queue.assert_called_once_with(self.attempt.id)
 
-    @patch('api.tasks.award_first_attempt_badge.delay')
-    @patch('api.tasks.calculate_score_and_issue_points.delay')
-    def test_save_trigger_tasks_on_new_submission(self, mock_score_task, mock_badge_task):
+    @patch('api.submissions.queue_submitted_attempt')
+    def test_save_trigger_tasks_on_new_submission(self, mock_queue):
         """
         Test that the tasks are not triggered when a new attempt is created with submitted=True
         """
         # Create a new attempt with submitted=True
-        attempt_new = UserQuestAttempt.objects.create(
-            student=self.student,
-            quest=self.quest,
-            submitted=True
+        with self.captureOnCommitCallbacks(execute=True):
+            attempt_new = UserQuestAttempt.objects.create(
+                student=self.student,
+                quest=self.quest,
+                submitted=True
+            )
+        # Assert that the attempt was not queued for a new attempt with submitted=True
+        mock_queue.assert_not_called()
+
+
+class FieldTrackerTest(TestCase):
+
+    def setUp(self):
+        self.quest = QuestFactory()
+        self.attempt = UserQuestAttemptFactory(quest=self.quest)
+
+    @patch('api.submissions.queue_submitted_attempt')
+    def test_submission_detected_without_select(self, mock_queue):
+        """
+        Test that submitting a loaded attempt only runs the UPDATE
+        """
+        attempt = UserQuestAttempt.objects.get(id=self.attempt.id)
+        attempt.submitted = True
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertNumQueries(1):
+                attempt.save()
+        mock_queue.assert_called_once_with(attempt.id)
+
+        # Saving again is not a new submission
+        with self.captureOnCommitCallbacks(execute=True):
+            attempt.save()
+        mock_queue.assert_called_once()
+
+    @patch('api.submissions.queue_submitted_attempt')
+    def test_fields_left_out_of_update_fields_are_not_changes(self, mock_queue):
+        """
+        Test that a field changed in memory but not saved is not reported as a transition
+        """
+        attempt = UserQuestAttempt.objects.get(id=self.attempt.id)
+        attempt.submitted = True
+        self.assertEqual(attempt.tracked_changes(['total_score_achieved']), {})
+        with self.captureOnCommitCallbacks(execute=True):
+            attempt.save(update_fields=['total_score_achieved'])
+        mock_queue.assert_not_called()
+        self.assertFalse(attempt.get_original_value('submitted'))
+
+    def test_instance_not_loaded_from_db_reads_stored_values(self):
+        """
+        Test that an instance built with an explicit primary key compares with the stored row
+        """
+        quest = Quest(id=self.quest.id, status='Expired')
+        self.assertEqual(quest.tracked_changes(), {'status': 'Active', 'expiration_date': self.quest.expiration_date})
+
+    @patch('api.tasks.award_speedster_badge.delay')
+    @patch('api.tasks.award_expert_badge.delay')
+    def test_refresh_from_db_records_stored_values(self, mock_expert, mock_speedster):
+        """
+        Test that a quest expired by a bulk UPDATE and refreshed is not expired again by its next save
+        """
+        quest = Quest.objects.get(id=self.quest.id)
+        self.assertEqual(quest.status, 'Active')
+        with patch('api.tasks.dispatch_expired_quest_badges'):
+            Quest.objects.filter(id=quest.id).expire()
+        quest.refresh_from_db()
+        expiration_date = quest.expiration_date
+        self.assertEqual(quest.tracked_changes(), {})
+
+        quest.name = 'Renamed quest'
+        with self.captureOnCommitCallbacks(execute=True):
+            quest.save()
+        mock_expert.assert_not_called()
+        mock_speedster.assert_not_called()
+        self.assertEqual(Quest.objects.get(id=quest.id).expiration_date, expiration_date)
+
+        # Only the reloaded fields are recorded
+        Quest.objects.filter(id=quest.id).update(status='Active')
+        quest.refresh_from_db(fields=['name'])
+        self.assertEqual(quest.get_original_value('status'), 'Expired')
+
+    def test_course_status_transition(self):
+        """
+        Test that the course detects its Active to Expired transition from the tracked status
+        """
+        course = Course.objects.get(id=self.quest.course_group.course.id)
+        course.status = 'Expired'
+        with patch('api.tasks.check_course_completion_and_award_completionist_badge.delay') as mock_delay:
+            course.save()
+            course.save()
+        mock_delay.assert_called_once_with(course.id)
+        self.assertEqual(Quest.objects.get(id=self.quest.id).status, 'Expired')
+
+
+class ScoringEngineTest(TestCase):
+
+    def setUp(self):
+        self.quest = QuestFactory()
+        self.students = [EduquestUserFactory() for _ in range(3)]
+        self.attempts = [UserQuestAttemptFactory(quest=self.quest, student=student) for student in self.students]
+        # Awkward weights, so that any change in the order of float additions would show up
+        for number, (max_score, num_options) in enumerate([(1, 3), (0.7, 6), (2.3, 7), (5, 0), (0.1, 3)], start=1):
+            question = QuestionFactory(quest=self.quest, number=number, max_score=max_score)
+            answers = [AnswerFactory(question=question, is_correct=i % 2 == 0) for i in range(num_options)]
+            for a, attempt in enumerate(self.attempts):
+                for i, answer in enumerate(answers):
+                    UserAnswerAttemptFactory(
+                        user_quest_attempt=attempt,
+                        question=question,
+                        answer=answer,
+                        is_selected=(i + a) % 3 == 0,
+                        score_achieved=7
+                    )
+
+    def reference_score(self, attempt):
+        """
+        The previous per-question implementation, kept to check the engine against it
+        """
+        total_score = 0
+        scores = {}
+        for question in attempt.quest.questions.all().order_by('id'):
+            num_options = question.answers.all().count()
+            if num_options == 0:
+                continue
+            weight_per_option = question.max_score / num_options
+            question_score = 0
+            for ua in attempt.answer_attempts.filter(question=question):
+                if ua.is_selected == ua.answer.is_correct:
+                    scores[ua.id] = weight_per_option
+                    question_score += weight_per_option
+                else:
+                    scores[ua.id] = 0
+            total_score += question_score
+        return total_score, scores
+
+    def test_scores_are_bit_identical(self):
+        """
+        Test that the engine returns exactly the same totals and option scores as the previous implementation
+        """
+        expected = {attempt.id: self.reference_score(attempt) for attempt in self.attempts}
+        totals = score_quest_attempts([attempt.id for attempt in self.attempts])
+        for attempt in self.attempts:
+            expected_total, expected_scores = expected[attempt.id]
+            self.assertEqual(totals[attempt.id].hex(), float(expected_total).hex())
+            for ua in attempt.answer_attempts.all():
+                if ua.id in expected_scores:
+                    self.assertEqual(ua.score_achieved.hex(), float(expected_scores[ua.id]).hex())
+                else:
+                    # Questions without options are skipped
+                    self.assertEqual(ua.score_achieved, 7)
+
+    def test_query_count_is_constant(self):
+        """
+        Test that scoring runs a fixed number of queries, whatever the number of questions and attempts
+        """
+        # 2 reads, then one UPDATE per distinct option score: 4 option weights and 0
+        with self.assertNumQueries(7):
+            score_quest_attempts([attempt.id for attempt in self.attempts])
+        # Nothing changed, so nothing is written
+        with self.assertNumQueries(2):
+            score_quest_attempts([attempt.id for attempt in self.attempts])
+
+    def test_attempt_without_answers(self):
+        """
+        Test that an attempt without answer attempts scores 0
+        """
+        attempt = UserQuestAttemptFactory(quest=self.quest)
+        self.assertEqual(score_quest_attempts([attempt.id]), {attempt.id: 0})
+        self.assertEqual(score_quest_attempts([]), {})
+
+
+class RescoreQuestsTest(TestCase):
+
+    def setUp(self):
+        self.quest = QuestFactory(type='Eduquest MCQ')
+        self.question = QuestionFactory(quest=self.quest, max_score=2)
+        self.answer_a = AnswerFactory(question=self.question, is_correct=True)
+        self.answer_b = AnswerFactory(question=self.question, is_correct=False)
+        self.student1 = EduquestUserFactory(total_points=2)
+        self.student2 = EduquestUserFactory(total_points=2)
+        # Student 1 scored 2 then 0, student 2 scored 2
+        self.attempt1 = self.make_attempt(self.student1, selected=self.answer_a, total=2)
+        self.attempt2 = self.make_attempt(self.student1, selected=self.answer_b, total=0)
+        self.attempt3 = self.make_attempt(self.student2, selected=self.answer_a, total=2)
+        self.unsubmitted = self.make_attempt(self.student2, selected=self.answer_b, total=0, submitted=False)
+
+    def make_attempt(self, student, selected, total, submitted=True, quest=None):
+        attempt = UserQuestAttemptFactory(
+            student=student, quest=quest or self.quest, submitted=submitted, total_score_achieved=total
         )
-        # Assert that tasks were not called for a new attempt with submitted=True
-        mock_score_task.assert_not_called()
-        mock_badge_task.assert_not_called()
+        for answer in (self.answer_a, self.answer_b):
+            UserAnswerAttemptFactory(
+                user_quest_attempt=attempt, question=self.question, answer=answer, is_selected=answer == selected
+            )
+        return attempt
+
+    def test_rescore_after_correction(self):
+        """
+        Test that correcting an answer rescores every submitted attempt and applies the change of best score
+        """
+        Answer.objects.filter(id=self.answer_a.id).update(is_correct=False)
+        Answer.objects.filter(id=self.answer_b.id).update(is_correct=True)
+        result = rescore_quests([self.quest.id])
+        self.assertEqual(result, {'attempts': 3, 'attempts_changed': 3, 'students_changed': 1})
+
+        for attempt, expected in ((self.attempt1, 0), (self.attempt2, 2), (self.attempt3, 0), (self.unsubmitted, 0)):
+            attempt.refresh_from_db()
+            self.assertEqual(attempt.total_score_achieved, expected)
+        self.student1.refresh_from_db()
+        self.student2.refresh_from_db()
+        # Student 1's best score is still 2, student 2 lost their 2 points
+        self.assertEqual(self.student1.total_points, 2)
+        self.assertEqual(self.student2.total_points, 0)
+
+    def test_rescore_without_changes(self):
+        """
+        Test that rescoring unchanged quests changes nothing
+        """
+        result = rescore_quests([self.quest.id])
+        self.assertEqual(result, {'attempts': 3, 'attempts_changed': 0, 'students_changed': 0})
+        self.student1.refresh_from_db()
+        self.assertEqual(self.student1.total_points, 2)
+
+    def test_private_quest_does_not_change_points(self):
+        """
+        Test that rescoring a private quest updates the attempt scores but not the users' points
+        """
+        Quest.objects.filter(id=self.quest.id).update(type='Private')
+        Answer.objects.filter(id=self.answer_a.id).update(is_correct=False)
+        result = rescore_quests([self.quest.id])
+        self.assertEqual(result['students_changed'], 0)
+        self.attempt3.refresh_from_db()
+        self.assertEqual(self.attempt3.total_score_achieved, 1)
+        self.student2.refresh_from_db()
+        self.assertEqual(self.student2.total_points, 2)
+
+
+    def test_rescore_drops_cached_users(self):
+        """
+        Test that rescoring drops the cached users whose points changed, once the transaction commits
+        """
+        self.addCleanup(cache.clear)
+        for student in (self.student1, self.student2):
+            cache.set(auth_user_cache_key(student.email), student)
+        Answer.objects.filter(id=self.answer_a.id).update(is_correct=False)
+        Answer.objects.filter(id=self.answer_b.id).update(is_correct=True)
+        with self.captureOnCommitCallbacks(execute=True):
+            rescore_quests([self.quest.id])
+            self.assertIsNotNone(cache.get(auth_user_cache_key(self.student2.email)))
+        self.assertIsNone(cache.get(auth_user_cache_key(self.student2.email)))
+        # Student 1's points did not change
+        self.assertIsNotNone(cache.get(auth_user_cache_key(self.student1.email)))
 
 
 class UserAnswerAttemptModelTest(TestCase):
@@ -973,3 +1321,130 @@ class BadgeAssociationTest(TestCase):
         """
         self.assertIn(self.user_quest_badge, self.badge_quest.awarded_to_quest_attempt.all())
         self.assertIn(self.user_quest_badge, self.attempt.earned_quest_badges.all())
+
+
+class QuestImporterTest(TestCase):
+
+    def setUp(self):
+        self.group = CourseGroupFactory()
+        self.quest = QuestFactory(course_group=self.group, type='Wooclap')
+        self.question = QuestionFactory(quest=self.quest, number=1)
+        self.answer_a = AnswerFactory(question=self.question, text='Paris')
+        self.answer_b = AnswerFactory(question=self.question, text='Lyon')
+        self.existing = EduquestUserFactory(email='EXISTING@EXAMPLE.COM')
+
+    def import_users(self, count):
+        users_data = [{'email': f'NEW{i}@EXAMPLE.COM', 'username': f'New #{i} Student'} for i in range(count)]
+        selections = {user['email']: {1: ['Paris']} for user in users_data}
+        return import_quest_attempts(self.quest, self.group.id, users_data, selections)
+
+    def test_import_creates_users_enrollments_and_attempts(self):
+        """
+        Test that users are matched by email or created, enrolled once and given their selected answers
+        """
+        UserCourseGroupEnrollmentFactory(student=self.existing, course_group=self.group)
+        users_data = [
+            {'email': 'EXISTING@EXAMPLE.COM', 'username': 'Existing'},
+            {'email': 'NEW@EXAMPLE.COM', 'username': 'Jane #Doe'},
+        ]
+        selections = {'EXISTING@EXAMPLE.COM': {1: ['Lyon']}, 'NEW@EXAMPLE.COM': {1: ['Paris', 'Lyon']}}
+        result = import_quest_attempts(self.quest, self.group.id, users_data, selections)
+        self.assertEqual(result, {
+            'users_created': 1,
+            'enrollments_created': 1,
+            'attempts_created': 2,
+            'answer_attempts_created': 4,
+        })
+
+        new_user = EduquestUser.objects.get(email='NEW@EXAMPLE.COM')
+        self.assertEqual((new_user.nickname, new_user.first_name, new_user.last_name), ('Jane Doe', 'Jane', 'Doe'))
+        self.assertTrue(UserCourseGroupEnrollment.objects.filter(
+            student=new_user, course_group__name='Private Course Group').exists())
+        self.assertEqual(UserCourseGroupEnrollment.objects.filter(course_group=self.group).count(), 2)
+        self.assertEqual(CourseGroup.objects.get(id=self.group.id).students_enrolled_count, 2)
+
+        selected = set(UserAnswerAttempt.objects.filter(
+            user_quest_attempt__quest=self.quest, is_selected=True
+        ).values_list('user_quest_attempt__student__email', 'answer__text'))
+        self.assertEqual(selected, {
+            ('EXISTING@EXAMPLE.COM', 'Lyon'), ('NEW@EXAMPLE.COM', 'Paris'), ('NEW@EXAMPLE.COM', 'Lyon')
+        })
+
+    def test_query_count_does_not_grow_with_users(self):
+        """
+        Test that the import runs the same number of queries for any number of users
+        """
+        with CaptureQueriesContext(connection) as context:
+            self.import_users(2)
+        baseline_count = len(context.captured_queries)
+        with CaptureQueriesContext(connection) as context:
+            result = self.import_users(50)
+        self.assertEqual(len(context.captured_queries), baseline_count)
+        self.assertEqual(result['attempts_created'], 50)
+
+
+class ExcelTest(TestCase):
+
+    def setUp(self):
+        self.excel = Excel()
+        current_dir = os.path.dirname(os.path.realpath(__file__))
+        self.excel.read_excel_sheets(os.path.join(current_dir, 'test_files', 'test_excel.xlsx'))
+        self.excel.get_questions()
+
+    def test_email_index(self):
+        """
+        Test that the user rows of the main results sheet are indexed by upper-cased email
+        """
+        self.assertEqual(self.excel.email_index, {'STUDENT3@EXAMPLE.COM': [0], 'STUDENT4@EXAMPLE.COM': [1]})
+
+    def test_get_all_user_answer_attempts(self):
+        """
+        Test that the selected answers of all users are returned at once, unattempted questions selecting nothing
+        """
+        self.assertEqual(self.excel.get_all_user_answer_attempts(), {
+            'STUDENT3@EXAMPLE.COM': {1: ['Choice 1A'], 2: ['Choice 2B']},
+            'STUDENT4@EXAMPLE.COM': {1: ['Choice 1B'], 2: []},
+        })
+        self.assertEqual(self.excel.get_user_answer_attempts('student4@example.com'), [
+            {'number': 1, 'question': 'Question 1', 'selected_answers': ['Choice 1B']},
+            {'number': 2, 'question': 'Question 2', 'selected_answers': []},
+        ])
+
+    def test_mcq_columns_skip_open_questions(self):
+        """
+        Test that MCQ columns are matched with their own question when an open question comes before them,
+        and that longer answers are matched before their prefixes
+        """
+        self.excel.main_results_sheet = pd.DataFrame([
+            [1, 'student5', 'Student', 'Five', 'student5@example.com', 'Some opinion', 'V - Yes, Yes please', '1 / 1'],
+        ])
+        self.excel.question_type_mapping_list = [
+            {'sheet_name': 'Q1', 'is_mcq': False},
+            {'sheet_name': 'Q2', 'is_mcq': True},
+        ]
+        self.excel.question_list = [
+            {'text': 'Question 2', 'number': 1, 'answers': [{'text': 'Yes'}, {'text': 'Yes please'}]},
+        ]
+        self.excel.build_email_index()
+        self.excel.build_answer_matchers()
+        self.assertEqual(self.excel.get_all_user_answer_attempts(), {
+            'STUDENT5@EXAMPLE.COM': {1: ['Yes', 'Yes please']},
+        })
+
+    def test_read_question_sheet(self):
+        """
+        Test that only the question text, MCQ marker, answer options and maximum score are read from a question sheet
+        """
+        rows = iter([
+            ('Question 3',), (None,), ('Choice', 'Number of votes'), ('Yes', 1), ('No', 0), (None, None),
+            ('Number of participants', 1), ('Maximum score', 2), ('By SMS', 0),
+        ])
+        self.assertEqual(Excel.read_question_sheet('Q3', rows), {
+            'sheet_name': 'Q3', 'text': 'Question 3', 'is_mcq': True, 'max_score': 2, 'answers': ['Yes', 'No'],
+        })
+        # Reading stopped at the 'Maximum score' row
+        self.assertEqual(next(rows), ('By SMS', 0))
+
+        open_question = Excel.read_question_sheet('Q4', iter([('Question 4',), (None,), ('Answer',), ('Something',)]))
+        self.assertFalse(open_question['is_mcq'])
+        self.assertEqual(open_question['answers'], [])
@@ -1,5 +1,8 @@
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from unittest.mock import patch
+from rest_framework.test import APIRequestFactory
 
 from ..models import (
     EduquestUser,
@@ -935,6 +938,49 @@ class QuestionSerializerTest(TestCase):
         self.assertEqual(Question.objects.count(), 2)
         self.assertEqual(Answer.objects.count(), 4)
 
+    def test_bulk_create_questions_query_count(self):
+        """
+        Test that bulk creating Questions inserts all questions and all answers in one query each,
+        whatever the number of questions, and returns each question with its own answers.
+        """
+        def payload(count):
+            return [
+                {
+                    'quest_id': self.quest.id,
+                    'text': f'Question {number}',
+                    'number': number,
+                    'max_score': 1.0,
+                    'answers': [
+                        {'text': f'Answer {number}.{option}', 'is_correct': option == 1, 'reason': None}
+                        for option in range(1, 4)
+                    ]
+                }
+                for number in range(1, count + 1)
+            ]
+
+        serializer = QuestionSerializer(data=payload(2), many=True)
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        with CaptureQueriesContext(connection) as small:
+            serializer.save()
+            serializer.data
+
+        serializer = QuestionSerializer(data=payload(20), many=True)
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        with CaptureQueriesContext(connection) as large:
+            questions = serializer.save()
+            data = serializer.data
+
+        self.assertEqual(len(small.captured_queries), len(large.captured_queries))
+        self.assertEqual(len(questions), 20)
+        self.assertEqual(Answer.objects.filter(question__in=questions).count(), 60)
+        self.assertEqual(data[4]['number'], 5)
+        self.assertEqual(
+            [answer['text'] for answer in data[4]['answers']],
+            ['Answer 5.1', 'Answer 5.2', 'Answer 5.3']
+        )
+        self.assertTrue(data[4]['answers'][0]['is_correct'])
+        self.assertTrue(Answer.objects.filter(question_id=data[4]['id'], text='Answer 5.1').exists())
+
     def test_bulk_create_questions_with_invalid_data(self):
         """
         Test that the serializer raises validation errors when bulk creating with invalid data.
@@ -1047,6 +1093,37 @@ class UserQuestAttemptSerializerTest(TestCase):
             self.assertFalse(uaa.is_selected)
             self.assertEqual(uaa.score_achieved, 0)
 
+    def test_create_user_quest_attempt_prefill_query_count(self):
+        """
+        Test that the UserAnswerAttempts are prefilled with a fixed number of queries, whatever the number of questions.
+        """
+        UserCourseGroupEnrollmentFactory(student=self.student, course_group=self.course_group)
+        data = {'quest_id': self.quest.id, 'student_id': self.student.id}
+
+        serializer = UserQuestAttemptSerializer(data=data)
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        with CaptureQueriesContext(connection) as small:
+            serializer.save()
+
+        for number in range(3, 23):
+            question = QuestionFactory(quest=self.quest, number=number, max_score=1.0)
+            for option in range(4):
+                AnswerFactory(question=question, is_correct=option == 0)
+        serializer = UserQuestAttemptSerializer(data=data)
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        with CaptureQueriesContext(connection) as large:
+            user_quest_attempt = serializer.save()
+
+        self.assertEqual(len(small.captured_queries), len(large.captured_queries))
+        answer_attempts = UserAnswerAttempt.objects.filter(user_quest_attempt=user_quest_attempt)
+        self.assertEqual(answer_attempts.count(), 84)
+        self.assertFalse(answer_attempts.filter(is_selected=True).exists())
+        self.assertFalse(answer_attempts.exclude(score_achieved=0).exists())
+        self.assertEqual(
+            set(answer_attempts.values_list('question_id', 'answer_id')),
+            set(Answer.objects.filter(question__quest=self.quest).values_list('question_id', 'id'))
+        )
+
     def test_create_user_quest_attempt_max_attempts_exceeded(self):
         """
         Test that the serializer raises a validation error when the maximum number of attempts is exceeded.
@@ -1182,6 +1259,99 @@ class UserAnswerAttemptSerializerTest(TestCase):
         self.assertEqual(updated_answer_attempt.score_achieved, 3)
 
 
+class BatchedPrimaryKeyRelatedFieldTest(TestCase):
+    def setUp(self):
+        self.student = EduquestUserFactory()
+        self.quest = QuestFactory()
+        self.user_quest_attempt = UserQuestAttemptFactory(student=self.student, quest=self.quest)
+        self.questions = [QuestionFactory(quest=self.quest, number=number) for number in range(1, 6)]
+        self.answers = [
+            AnswerFactory(question=question, is_correct=option == 0)
+            for question in self.questions
+            for option in range(4)
+        ]
+
+    def payload(self):
+        return [
+            {
+                'user_quest_attempt_id': self.user_quest_attempt.id,
+                'question_id': answer.question_id,
+                'answer_id': answer.id,
+                'is_selected': False,
+                'score_achieved': 0
+            }
+            for answer in self.answers
+        ]
+
+    def test_many_payload_is_validated_with_one_query_per_related_model(self):
+        """
+        Test that the related fields of a many=True payload are resolved with one query per related model.
+        """
+        serializer = UserAnswerAttemptSerializer(data=self.payload(), many=True)
+        with self.assertNumQueries(3):
+            self.assertTrue(serializer.is_valid(), serializer.errors)
+        self.assertEqual(serializer.validated_data[5]['answer'], self.answers[5])
+        self.assertEqual(serializer.validated_data[5]['question'], self.questions[1])
+        self.assertEqual(serializer.validated_data[5]['user_quest_attempt'], self.user_quest_attempt)
+
+    def test_invalid_values_have_the_usual_errors(self):
+        """
+        Test that missing objects and values of the wrong type fail like with PrimaryKeyRelatedField.
+        """
+        data = self.payload()[:3]
+        data[1]['answer_id'] = 9999
+        data[2]['question_id'] = 'first'
+        serializer = UserAnswerAttemptSerializer(data=data, many=True)
+        self.assertFalse(serializer.is_valid())
+        self.assertEqual(serializer.errors[0], {})
+        self.assertEqual(serializer.errors[1]['answer_id'][0].code, 'does_not_exist')
+        self.assertEqual(serializer.errors[1]['answer_id'][0], 'Invalid pk "9999" - object does not exist.')
+        self.assertEqual(serializer.errors[2]['question_id'][0].code, 'incorrect_type')
+
+    def test_resolved_objects_are_cached_for_the_request(self):
+        """
+        Test that serializers sharing a request do not load the same related objects again.
+        """
+        request = APIRequestFactory().post('/')
+        serializer = UserAnswerAttemptSerializer(data=self.payload()[:4], many=True, context={'request': request})
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        serializer = UserAnswerAttemptSerializer(data=self.payload()[0], context={'request': request})
+        with self.assertNumQueries(0):
+            self.assertTrue(serializer.is_valid(), serializer.errors)
+
+    def test_update_reuses_the_related_objects_of_the_instance(self):
+        """
+        Test that updating an instance without changing its foreign keys does not load the related objects again.
+        """
+        user_answer_attempt = UserAnswerAttemptFactory(
+            user_quest_attempt=self.user_quest_attempt, question=self.questions[0], answer=self.answers[0]
+        )
+        instance = UserAnswerAttempt.objects.select_related('user_quest_attempt', 'question', 'answer').get(
+            id=user_answer_attempt.id
+        )
+        data = {**self.payload()[0], 'is_selected': True}
+        serializer = UserAnswerAttemptSerializer(instance, data=data, partial=True)
+        with self.assertNumQueries(0):
+            self.assertTrue(serializer.is_valid(), serializer.errors)
+        self.assertIs(serializer.validated_data['question'], instance.question)
+
+        # A changed foreign key is still validated
+        serializer = UserAnswerAttemptSerializer(instance, data={'answer_id': self.answers[1].id}, partial=True)
+        with self.assertNumQueries(1):
+            self.assertTrue(serializer.is_valid(), serializer.errors)
+        self.assertEqual(serializer.validated_data['answer'], self.answers[1])
+
+    def test_many_related_field_is_resolved_with_one_query(self):
+        """
+        Test that a many related field, like the coordinators of a course, resolves its list with one query.
+        """
+        coordinators = [EduquestUserFactory() for _ in range(5)]
+        field = CourseSerializer().fields['coordinators']
+        with self.assertNumQueries(1):
+            resolved = field.run_validation([coordinator.id for coordinator in coordinators])
+        self.assertEqual(resolved, coordinators)
+
+
 class BadgeSerializerTest(TestCase):
     def setUp(self):
         self.image = ImageFactory()
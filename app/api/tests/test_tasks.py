@@ -0,0 +1,594 @@
+import threading
+from datetime import timedelta
+from django.db import connection, transaction, IntegrityError
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from unittest.mock import MagicMock, patch
+
+from ..badges import award_quest_badge, badge_catalogue
+from ..submissions import queue_submitted_attempt
+from ..models import Badge, EduquestUser, Quest, UserQuestAttempt, UserCourseBadge, UserQuestBadge
+from ..tasks import (
+    check_expired_quest,
+    expire_quest,
+    award_expired_quest_badges,
+    award_expert_badge,
+    award_first_attempt_badge,
+    process_submitted_attempts,
+    check_course_completion_and_award_completionist_badge
+)
+from .factory import (
+    EduquestUserFactory,
+    CourseFactory,
+    CourseGroupFactory,
+    UserCourseGroupEnrollmentFactory,
+    QuestFactory,
+    QuestionFactory,
+    AnswerFactory,
+    UserQuestAttemptFactory,
+    UserAnswerAttemptFactory,
+    BadgeFactory
+)
+
+
+@override_settings(QUEST_EXPIRY_SCHEDULE_HORIZON=3600)
+class QuestExpiryTest(TestCase):
+
+    def setUp(self):
+        self.expiration_date = timezone.now() + timedelta(minutes=30)
+        self.quest = QuestFactory(status='Active', expiration_date=self.expiration_date)
+
+    @patch('api.tasks.expire_quest.apply_async')
+    def test_expiry_is_scheduled_on_save(self, mock_apply_async):
+        """
+        Test that saving a quest with a new expiration date schedules an ETA task after commit
+        """
+        new_expiration_date = timezone.now() + timedelta(minutes=45)
+        self.quest.expiration_date = new_expiration_date
+        with self.captureOnCommitCallbacks(execute=True):
+            self.quest.save()
+        mock_apply_async.assert_called_once_with(
+            args=[self.quest.id, new_expiration_date.isoformat()], eta=new_expiration_date
+        )
+
+    @patch('api.tasks.expire_quest.apply_async')
+    def test_expiry_is_not_rescheduled_without_change(self, mock_apply_async):
+        """
+        Test that saving a quest without changing its expiration date does not schedule another task
+        """
+        self.quest.name = 'Renamed'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.quest.save()
+        mock_apply_async.assert_not_called()
+
+    @patch('api.tasks.expire_quest.apply_async')
+    def test_expiry_beyond_horizon_is_left_to_sweep(self, mock_apply_async):
+        """
+        Test that expiration dates beyond the horizon are not scheduled on save
+        """
+        self.quest.expiration_date = timezone.now() + timedelta(days=7)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.quest.save()
+        mock_apply_async.assert_not_called()
+
+    @patch('api.tasks.award_expired_quest_badges.delay')
+    def test_expire_quest(self, mock_badges_task):
+        """
+        Test that the ETA task expires the quest when its expiration date is reached
+        """
+        Quest.objects.filter(id=self.quest.id).update(expiration_date=timezone.now() - timedelta(seconds=1))
+        self.quest.refresh_from_db()
+        with self.captureOnCommitCallbacks(execute=True):
+            expire_quest(self.quest.id, self.quest.expiration_date.isoformat())
+        self.quest.refresh_from_db()
+        self.assertEqual(self.quest.status, 'Expired')
+        mock_badges_task.assert_called_once_with([self.quest.id])
+
+    @patch('api.tasks.award_expired_quest_badges.delay')
+    def test_obsolete_task_does_nothing(self, mock_badges_task):
+        """
+        Test that a task scheduled for a previous expiration date does not expire the quest
+        """
+        previous_expiration_date = timezone.now() - timedelta(minutes=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            expire_quest(self.quest.id, previous_expiration_date.isoformat())
+        self.quest.refresh_from_db()
+        self.assertEqual(self.quest.status, 'Active')
+        mock_badges_task.assert_not_called()
+
+    @patch('api.tasks.expire_quest.apply_async')
+    def test_early_task_is_rescheduled(self, mock_apply_async):
+        """
+        Test that a task delivered before the expiration date schedules itself again
+        """
+        expire_quest(self.quest.id, self.expiration_date.isoformat())
+        self.quest.refresh_from_db()
+        self.assertEqual(self.quest.status, 'Active')
+        mock_apply_async.assert_called_once_with(
+            args=[self.quest.id, self.expiration_date.isoformat()], eta=self.quest.expiration_date
+        )
+
+    @patch('api.tasks.award_expired_quest_badges.delay')
+    @patch('api.tasks.expire_quest.apply_async')
+    def test_sweep(self, mock_apply_async, mock_badges_task):
+        """
+        Test that the sweep expires overdue quests and schedules the quests expiring within the horizon
+        """
+        overdue_quest = QuestFactory(status='Active', expiration_date=timezone.now() - timedelta(minutes=5))
+        QuestFactory(status='Active', expiration_date=timezone.now() + timedelta(days=7))
+        check_expired_quest()
+        overdue_quest.refresh_from_db()
+        self.assertEqual(overdue_quest.status, 'Expired')
+        mock_apply_async.assert_called_once_with(
+            args=[self.quest.id, self.expiration_date.isoformat()], eta=self.expiration_date
+        )
+
+
+class BulkQuestExpiryTest(TestCase):
+
+    def setUp(self):
+        self.course = CourseFactory(status='Active')
+        self.group = CourseGroupFactory(course=self.course)
+        self.active_quests = [QuestFactory(course_group=self.group, status='Active') for _ in range(3)]
+        self.expired_quest = QuestFactory(course_group=self.group, status='Expired')
+        self.other_quest = QuestFactory(status='Active')
+
+    @patch('api.tasks.award_expired_quest_badges.delay')
+    def test_expire_returns_expired_quests(self, mock_badges_task):
+        """
+        Test that expire() only expires active quests, stamps their expiration date and queues one badge task
+        """
+        before = timezone.now()
+        with self.captureOnCommitCallbacks(execute=True):
+            with CaptureQueriesContext(connection) as context:
+                quest_ids = Quest.objects.filter(course_group=self.group).expire()
+        # A single UPDATE ... RETURNING, apart from the savepoint of the transaction
+        statements = [query['sql'] for query in context.captured_queries if 'SAVEPOINT' not in query['sql']]
+        self.assertEqual(len(statements), 1)
+        expected_ids = sorted(quest.id for quest in self.active_quests)
+        self.assertEqual(sorted(quest_ids), expected_ids)
+        for quest in Quest.objects.filter(id__in=expected_ids):
+            self.assertEqual(quest.status, 'Expired')
+            self.assertGreaterEqual(quest.expiration_date, before)
+        self.other_quest.refresh_from_db()
+        self.assertEqual(self.other_quest.status, 'Active')
+        mock_badges_task.assert_called_once()
+        self.assertEqual(sorted(mock_badges_task.call_args.args[0]), expected_ids)
+
+    @patch('api.tasks.award_expired_quest_badges.delay')
+    def test_expire_twice(self, mock_badges_task):
+        """
+        Test that expiring quests that are already expired does nothing
+        """
+        Quest.objects.filter(course_group=self.group).expire()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(Quest.objects.filter(course_group=self.group).expire(), [])
+        mock_badges_task.assert_not_called()
+
+    @patch('api.tasks.award_expired_quest_badges.delay')
+    @patch('api.tasks.check_course_completion_and_award_completionist_badge.delay')
+    def test_course_expiry_expires_quests(self, mock_course_task, mock_badges_task):
+        """
+        Test that expiring a course expires its quests in bulk
+        """
+        self.course.status = 'Expired'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.course.save()
+        self.assertFalse(Quest.objects.filter(course_group=self.group).exclude(status='Expired').exists())
+        self.assertEqual(
+            sorted(mock_badges_task.call_args.args[0]),
+            sorted(quest.id for quest in self.active_quests)
+        )
+
+    @patch('api.tasks.award_speedster_badge')
+    @patch('api.tasks.award_expert_badge')
+    def test_award_expired_quest_badges(self, mock_expert_badge, mock_speedster_badge):
+        """
+        Test that the batched badge task evaluates both badges for every quest, even if one fails
+        """
+        mock_expert_badge.side_effect = [Exception('boom'), 'expert']
+        mock_speedster_badge.return_value = 'speedster'
+        with self.assertLogs('api.tasks', level='ERROR'):
+            results = award_expired_quest_badges([1, 2])
+        self.assertEqual(mock_expert_badge.call_count, 2)
+        self.assertEqual(mock_speedster_badge.call_count, 2)
+        self.assertEqual(results[1:], ['speedster', 'expert', 'speedster'])
+
+
+class ConcurrentQuestExpiryTest(TransactionTestCase):
+
+    @patch('api.tasks.award_expired_quest_badges.delay')
+    def test_expire_waits_for_locked_quests(self, mock_badges_task):
+        """
+        Test that expire() waits for a quest locked by another transaction instead of skipping it
+        """
+        quests = [QuestFactory(status='Active', expiration_date=None) for _ in range(2)]
+        locked = threading.Event()
+        release = threading.Event()
+
+        def hold_lock():
+            try:
+                with transaction.atomic():
+                    Quest.objects.select_for_update().get(id=quests[0].id)
+                    locked.set()
+                    release.wait(5)
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=hold_lock)
+        thread.start()
+        self.assertTrue(locked.wait(5))
+        threading.Timer(0.5, release.set).start()
+        quest_ids = Quest.objects.filter(id__in=[quest.id for quest in quests]).expire()
+        thread.join()
+
+        self.assertEqual(sorted(quest_ids), sorted(quest.id for quest in quests))
+        self.assertFalse(Quest.objects.filter(id__in=quest_ids).exclude(status='Expired').exists())
+        self.assertEqual(sorted(mock_badges_task.call_args.args[0]), sorted(quest_ids))
+
+
+class CourseCompletionTest(TestCase):
+
+    def setUp(self):
+        self.badge = BadgeFactory(name='Completionist')
+        self.course = CourseFactory(status='Active')
+        self.group = CourseGroupFactory(course=self.course)
+        self.empty_group = CourseGroupFactory(course=self.course)
+        self.quest1 = QuestFactory(course_group=self.group, type='Eduquest MCQ')
+        self.quest2 = QuestFactory(course_group=self.group, type='Eduquest MCQ')
+        QuestFactory(course_group=self.group, type='Private')
+        self.completed = self.enroll(self.group, submitted_quests=[self.quest1, self.quest2, self.quest2])
+        self.partial = self.enroll(self.group, submitted_quests=[self.quest1])
+        self.unsubmitted = self.enroll(self.group, submitted_quests=[])
+        UserQuestAttemptFactory(student=self.unsubmitted.student, quest=self.quest1, submitted=False)
+        UserQuestAttemptFactory(student=self.unsubmitted.student, quest=self.quest2, submitted=False)
+        self.no_quests = self.enroll(self.empty_group, submitted_quests=[])
+
+    def enroll(self, course_group, submitted_quests):
+        enrollment = UserCourseGroupEnrollmentFactory(course_group=course_group, student=EduquestUserFactory())
+        for quest in submitted_quests:
+            UserQuestAttemptFactory(student=enrollment.student, quest=quest, submitted=True)
+        return enrollment
+
+    def test_completionist_badge_awarded(self):
+        """
+        Test that only students who submitted every non-private quest of their group complete the course
+        """
+        result = check_course_completion_and_award_completionist_badge(self.course.id)
+        self.assertIn(self.completed.student.username, result)
+        for enrollment in (self.completed, self.partial, self.unsubmitted, self.no_quests):
+            enrollment.refresh_from_db()
+        self.assertIsNotNone(self.completed.completed_on)
+        self.assertIsNone(self.partial.completed_on)
+        self.assertIsNone(self.unsubmitted.completed_on)
+        self.assertIsNone(self.no_quests.completed_on)
+        self.assertEqual(
+            list(UserCourseBadge.objects.values_list('user_course_group_enrollment_id', 'badge_id')),
+            [(self.completed.id, self.badge.id)]
+        )
+
+    def test_badge_is_not_awarded_twice(self):
+        """
+        Test that running the check again does not award the badge twice
+        """
+        check_course_completion_and_award_completionist_badge(self.course.id)
+        check_course_completion_and_award_completionist_badge(self.course.id)
+        self.assertEqual(UserCourseBadge.objects.count(), 1)
+
+    def test_query_count_does_not_grow_with_students(self):
+        """
+        Test that the check runs the same number of queries for any number of completing students
+        """
+        badge_catalogue.get('Completionist')
+        with CaptureQueriesContext(connection) as context:
+            check_course_completion_and_award_completionist_badge(self.course.id)
+        baseline_count = len(context.captured_queries)
+        UserCourseBadge.objects.all().delete()
+        for _ in range(10):
+            self.enroll(self.group, submitted_quests=[self.quest1, self.quest2])
+        with CaptureQueriesContext(connection) as context:
+            check_course_completion_and_award_completionist_badge(self.course.id)
+        self.assertEqual(len(context.captured_queries), baseline_count)
+        self.assertEqual(UserCourseBadge.objects.count(), 11)
+
+
+class BadgeAwardTest(TestCase):
+
+    def setUp(self):
+        self.expert_badge = BadgeFactory(name='Expert')
+        self.quest = QuestFactory(status='Expired', type='Eduquest MCQ')
+        QuestionFactory(quest=self.quest, max_score=4)
+
+    def make_attempts(self, count, score):
+        return [
+            UserQuestAttemptFactory(quest=self.quest, submitted=True, total_score_achieved=score)
+            for _ in range(count)
+        ]
+
+    def test_award_quest_badge_skips_existing_awards(self):
+        """
+        Test that awarding a badge again only inserts the missing awards and returns them
+        """
+        attempts = self.make_attempts(3, 4)
+        self.assertEqual(award_quest_badge(self.expert_badge, [attempts[0].id]), [attempts[0].id])
+        awarded = award_quest_badge(self.expert_badge, [attempt.id for attempt in attempts])
+        self.assertEqual(sorted(awarded), sorted(attempt.id for attempt in attempts[1:]))
+        self.assertEqual(UserQuestBadge.objects.filter(badge=self.expert_badge).count(), 3)
+
+    def test_unique_constraint(self):
+        """
+        Test that the database rejects a second award of the same badge for the same attempt
+        """
+        attempt = self.make_attempts(1, 4)[0]
+        UserQuestBadge.objects.create(badge=self.expert_badge, user_quest_attempt=attempt)
+        with self.assertRaises(IntegrityError):
+            UserQuestBadge.objects.create(badge=self.expert_badge, user_quest_attempt=attempt)
+
+    def test_expert_badge_query_count_with_ties(self):
+        """
+        Test that award_expert_badge runs the same number of queries however many students tie on the top score
+        """
+        self.make_attempts(2, 4)
+        self.make_attempts(1, 2)
+        badge_catalogue.get('Expert')
+        with CaptureQueriesContext(connection) as context:
+            award_expert_badge(self.quest.id)
+        baseline_count = len(context.captured_queries)
+
+        UserQuestBadge.objects.all().delete()
+        self.make_attempts(30, 4)
+        with CaptureQueriesContext(connection) as context:
+            result = award_expert_badge(self.quest.id)
+        self.assertEqual(len(context.captured_queries), baseline_count)
+        self.assertIn('(32 new awards)', result)
+        self.assertEqual(UserQuestBadge.objects.filter(badge=self.expert_badge).count(), 32)
+
+
+class BadgeCatalogueTest(TestCase):
+
+    def setUp(self):
+        badge_catalogue.clear()
+        self.badge = BadgeFactory(name='First Attempt')
+
+    def test_lookup_is_cached(self):
+        """
+        Test that only the first lookup of a badge queries the database
+        """
+        with self.assertNumQueries(1):
+            self.assertEqual(badge_catalogue.get('First Attempt'), self.badge)
+        with self.assertNumQueries(0):
+            self.assertEqual(badge_catalogue.get('First Attempt'), self.badge)
+            self.assertEqual(badge_catalogue.get_by_id(self.badge.id).image, self.badge.image)
+            self.assertEqual(badge_catalogue.all(), [self.badge])
+
+    def test_saving_a_badge_invalidates_the_catalogue(self):
+        """
+        Test that renaming a badge is visible to the next lookup
+        """
+        badge_catalogue.get('First Attempt')
+        self.badge.name = 'First Try'
+        self.badge.save()
+        self.assertEqual(badge_catalogue.get('First Try'), self.badge)
+        with self.assertRaises(Badge.DoesNotExist):
+            badge_catalogue.get('First Attempt')
+
+    def test_unknown_badge_reloads_once(self):
+        """
+        Test that a badge missing from the catalogue is looked up again before raising DoesNotExist
+        """
+        badge_catalogue.get('First Attempt')
+        with self.assertNumQueries(1):
+            with self.assertRaises(Badge.DoesNotExist):
+                badge_catalogue.get('Unknown')
+
+    def test_first_attempt_badge_uses_catalogue(self):
+        """
+        Test that the first attempt badge is awarded with the badge from the catalogue
+        """
+        attempt = UserQuestAttemptFactory(submitted=True)
+        badge_catalogue.get('First Attempt')
+        award_first_attempt_badge(attempt.id)
+        self.assertTrue(UserQuestBadge.objects.filter(badge=self.badge, user_quest_attempt=attempt).exists())
+
+    def test_saving_a_badge_image_invalidates_the_catalogue(self):
+        """
+        Test that only saving the image of a cached badge reloads the catalogue
+        """
+        badge_catalogue.get('First Attempt')
+        QuestFactory()
+        with self.assertNumQueries(0):
+            badge_catalogue.get('First Attempt')
+        self.badge.image.filename = 'first_attempt.svg'
+        self.badge.image.save()
+        self.assertEqual(badge_catalogue.get('First Attempt').image.filename, 'first_attempt.svg')
+
+
+class SubmissionProcessingTest(TestCase):
+
+    def setUp(self):
+        self.first_attempt_badge = BadgeFactory(name='First Attempt')
+        self.perfectionist_badge = BadgeFactory(name='Perfectionist')
+        self.quest = QuestFactory(type='Eduquest MCQ')
+        self.question = QuestionFactory(quest=self.quest, max_score=2)
+        self.correct = AnswerFactory(question=self.question, is_correct=True)
+        self.wrong = AnswerFactory(question=self.question, is_correct=False)
+
+    def submit(self, student, correct_selected, wrong_selected=False, quest_type=None):
+        """
+        Create a submitted attempt without queueing it, selecting the given answers
+        """
+        attempt = UserQuestAttemptFactory(student=student, quest=self.quest, submitted=True)
+        UserAnswerAttemptFactory(user_quest_attempt=attempt, question=self.question,
+                                 answer=self.correct, is_selected=correct_selected)
+        UserAnswerAttemptFactory(user_quest_attempt=attempt, question=self.question,
+                                 answer=self.wrong, is_selected=wrong_selected)
+        return attempt
+
+    def test_scores_points_and_badges(self):
+        """
+        Test that a batch of attempts is scored, earns points and is awarded badges
+        """
+        perfect_student = EduquestUserFactory(total_points=0)
+        partial_student = EduquestUserFactory(total_points=0)
+        perfect = self.submit(perfect_student, correct_selected=True)
+        partial = self.submit(partial_student, correct_selected=True, wrong_selected=True)
+
+        process_submitted_attempts([perfect.id, partial.id])
+
+        perfect.refresh_from_db()
+        partial.refresh_from_db()
+        self.assertEqual(perfect.total_score_achieved, 2)
+        self.assertEqual(partial.total_score_achieved, 1)
+        self.assertEqual(EduquestUser.objects.get(id=perfect_student.id).total_points, 2)
+        self.assertEqual(EduquestUser.objects.get(id=partial_student.id).total_points, 1)
+        self.assertEqual(
+            set(UserQuestBadge.objects.filter(badge=self.first_attempt_badge).values_list('user_quest_attempt', flat=True)),
+            {perfect.id, partial.id}
+        )
+        self.assertEqual(
+            list(UserQuestBadge.objects.filter(badge=self.perfectionist_badge).values_list('user_quest_attempt', flat=True)),
+            [perfect.id]
+        )
+
+    def test_only_best_score_earns_points(self):
+        """
+        Test that a student only earns the amount by which their best attempt beats their earlier attempts,
+        including when several of their attempts are in the same batch
+        """
+        student = EduquestUserFactory(total_points=0)
+        earlier = self.submit(student, correct_selected=True, wrong_selected=True)
+        process_submitted_attempts([earlier.id])
+        self.assertEqual(EduquestUser.objects.get(id=student.id).total_points, 1)
+
+        worse = self.submit(student, correct_selected=False, wrong_selected=True)
+        better = self.submit(student, correct_selected=True)
+        process_submitted_attempts([worse.id, better.id])
+        self.assertEqual(EduquestUser.objects.get(id=student.id).total_points, 2)
+        # The first attempt badge is only awarded once per student
+        self.assertEqual(UserQuestBadge.objects.filter(badge=self.first_attempt_badge).count(), 1)
+
+    def test_private_quest_earns_nothing(self):
+        """
+        Test that attempts of a private quest are scored but earn no points or badges
+        """
+        Quest.objects.filter(id=self.quest.id).update(type='Private')
+        student = EduquestUserFactory(total_points=0)
+        attempt = self.submit(student, correct_selected=True)
+        process_submitted_attempts([attempt.id])
+        attempt.refresh_from_db()
+        self.assertEqual(attempt.total_score_achieved, 2)
+        self.assertEqual(EduquestUser.objects.get(id=student.id).total_points, 0)
+        self.assertFalse(UserQuestBadge.objects.exists())
+
+    def test_query_count_does_not_grow_with_attempts(self):
+        """
+        Test that processing runs the same number of queries for any number of attempts
+        """
+        badge_catalogue.get('First Attempt')
+        badge_catalogue.get('Perfectionist')
+        attempts = [self.submit(EduquestUserFactory(), correct_selected=True) for _ in range(2)]
+        with CaptureQueriesContext(connection) as context:
+            process_submitted_attempts([attempt.id for attempt in attempts])
+        baseline_count = len(context.captured_queries)
+
+        attempts = [self.submit(EduquestUserFactory(), correct_selected=True) for _ in range(20)]
+        with CaptureQueriesContext(connection) as context:
+            process_submitted_attempts([attempt.id for attempt in attempts])
+        self.assertEqual(len(context.captured_queries), baseline_count)
+
+    @override_settings(SUBMISSION_BATCH_WINDOW=0)
+    @patch('api.tasks.process_submitted_attempts.delay')
+    def test_queue_without_window(self, mock_delay):
+        """
+        Test that every submission gets a task of its own when batching is disabled
+        """
+        queue_submitted_attempt(42)
+        mock_delay.assert_called_once_with([42])
+
+    @override_settings(SUBMISSION_BATCH_WINDOW=2)
+    @patch('api.tasks.process_submitted_attempts.apply_async')
+    @patch('api.submissions._get_redis')
+    def test_queue_schedules_one_task_per_window(self, mock_get_redis, mock_apply_async):
+        """
+        Test that only the first submission of a window schedules the task that processes the queued attempts
+        """
+        pipeline = mock_get_redis.return_value.pipeline.return_value
+        pipeline.execute.side_effect = [[1, True], [1, None]]
+        queue_submitted_attempt(1)
+        queue_submitted_attempt(2)
+        pipeline.sadd.assert_any_call('eduquest:submissions:queue', 2)
+        mock_apply_async.assert_called_once_with(countdown=2)
+
+    @override_settings(SUBMISSION_BATCH_WINDOW=2)
+    @patch('api.tasks.process_submitted_attempts.delay')
+    @patch('api.submissions._get_redis')
+    def test_queue_falls_back_without_redis(self, mock_get_redis, mock_delay):
+        """
+        Test that a submission gets a task of its own when Redis cannot be reached
+        """
+        mock_get_redis.return_value.pipeline.return_value.execute.side_effect = ConnectionError('Redis is down')
+        with self.assertLogs('api.submissions', level='WARNING'):
+            queue_submitted_attempt(42)
+        mock_delay.assert_called_once_with([42])
+
+    @patch('api.submissions._get_redis')
+    def test_task_drains_queue(self, mock_get_redis):
+        """
+        Test that the task processes the queued attempts when called without ids
+        """
+        attempt = self.submit(EduquestUserFactory(total_points=0), correct_selected=True)
+        client = MagicMock()
+        client.spop.side_effect = [[str(attempt.id).encode()], []]
+        mock_get_redis.return_value = client
+        result = process_submitted_attempts()
+        client.delete.assert_called_once_with('eduquest:submissions:scheduled')
+        self.assertIn('Processed 1 attempts', result)
+        self.assertEqual(UserQuestAttempt.objects.get(id=attempt.id).total_score_achieved, 2)
+
+    def test_failing_attempt_does_not_drop_its_batch(self):
+        """
+        Test that when one attempt of a batch fails, the other attempts of the batch are still processed
+        """
+        from .. import submissions
+
+        students = [EduquestUserFactory(total_points=0) for _ in range(3)]
+        attempts = [self.submit(student, correct_selected=True) for student in students]
+        bad_attempt = attempts[1]
+        award_perfectionist_badges = submissions._award_perfectionist_badges
+
+        def failing_award_perfectionist_badges(public_attempts):
+            # Fails inside the transaction, after the scores and points were written
+            if bad_attempt.id in [attempt.id for attempt in public_attempts]:
+                raise ValueError('Awarding failed')
+            return award_perfectionist_badges(public_attempts)
+
+        with patch('api.submissions._award_perfectionist_badges', side_effect=failing_award_perfectionist_badges):
+            result = process_submitted_attempts([attempt.id for attempt in attempts])
+
+        self.assertIn(f'failed to process submitted attempts [{bad_attempt.id}]', result)
+        self.assertIn('Processed 2 attempts', result)
+        for attempt, student in zip(attempts, students):
+            attempt.refresh_from_db()
+            student.refresh_from_db()
+            expected = 0 if attempt == bad_attempt else 2
+            self.assertEqual(attempt.total_score_achieved, expected)
+            self.assertEqual(student.total_points, expected)
+        self.assertEqual(UserQuestBadge.objects.filter(badge=self.first_attempt_badge).count(), 2)
+
+    @patch('api.tasks.process_submitted_attempts.delay')
+    def test_bulk_submit_dispatches_batches(self, mock_delay):
+        """
+        Test that submitting attempts in bulk updates them in one statement and queues one task per batch
+        """
+        pending = [UserQuestAttemptFactory(quest=self.quest) for _ in range(3)]
+        UserQuestAttemptFactory(quest=self.quest, submitted=True)
+        with self.captureOnCommitCallbacks(execute=True):
+            with CaptureQueriesContext(connection) as context:
+                submitted_ids = UserQuestAttempt.objects.filter(quest=self.quest).submit()
+        updates = [query for query in context.captured_queries if query['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(sorted(submitted_ids), [attempt.id for attempt in pending])
+        self.assertEqual(UserQuestAttempt.objects.filter(quest=self.quest, submitted=False).count(), 0)
+        mock_delay.assert_called_once()
+        self.assertEqual(sorted(mock_delay.call_args.args[0]), [attempt.id for attempt in pending])
@@ -1,7 +1,11 @@
 import os
 
+from django.core.cache import cache
+from django.core.files.storage import default_storage
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import TestCase
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 from rest_framework.test import APITestCase, APIClient
 from rest_framework import status
@@ -64,6 +68,15 @@ from .factory import (
     UserQuestBadgeFactory,
     UserCourseBadgeFactory,
 )
+from ..badges import badge_catalogue
+from ..importer import stage_import_file
+from ..tasks import import_quest_file
+
+# Staged import files are kept in memory instead of the Azure storage
+IN_MEMORY_STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.InMemoryStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
 
 
 class BaseViewTest(APITestCase):
@@ -831,10 +844,12 @@ class QuestViewSetTest(BaseViewTest):
         self.assertEqual(len(response.data), 1)
         self.assertEqual(response.data[0]['name'], 'Quest 2')
 
+    @override_settings(STORAGES=IN_MEMORY_STORAGES)
     def test_import_quest_action(self):
         """
         Test the custom 'import_quest' action to import quests from an Excel file.
         """
+        self.addCleanup(cache.clear)
         url = reverse('quests-import-quest')
         # get current dir
         current_dir = os.path.dirname(os.path.realpath(__file__))
@@ -856,8 +871,19 @@ class QuestViewSetTest(BaseViewTest):
                 'organiser_id': self.staff_user1.id,
             }
 
-            response = self.client.post(url, data, format='multipart')
-            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+            with patch('api.views.import_quest_file.delay') as mock_delay:
+                mock_delay.return_value.id = 'job-1'
+                response = self.client.post(url, data, format='multipart')
+            self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+            self.assertEqual(response.data['job_id'], 'job-1')
+
+            # Run the queued import job
+            result = import_quest_file.apply(args=mock_delay.call_args.args).get()
+            self.assertEqual(result['status'], 'completed')
+            self.assertEqual(result['counts']['questions'], 2)
+            self.assertEqual(result['counts']['attempts_created'], 2)
+            # The staged file is removed once imported
+            self.assertFalse(default_storage.exists(mock_delay.call_args.args[0]))
             # Verify that the quest was created
             imported_quest = Quest.objects.get(name='Imported Quest')
             self.assertEqual(imported_quest.type, 'Wooclap!')
@@ -926,6 +952,117 @@ class QuestViewSetTest(BaseViewTest):
                     self.assertFalse(answer_attempt.is_selected)
                     continue
 
+    @override_settings(STORAGES=IN_MEMORY_STORAGES)
+    def test_import_quest_job_failure_rolls_back(self):
+        """
+        Test that an import job that fails reports its errors and leaves nothing behind.
+        """
+        file_name = stage_import_file(SimpleUploadedFile('quest.xlsx', b'not an excel file'))
+        quest_data = {
+            'type': 'Wooclap!',
+            'name': 'Broken Import',
+            'description': 'Imported quest description.',
+            'status': 'Active',
+            'max_attempts': 1,
+            'course_group_id': self.course_group1.id,
+            'image_id': self.image1.id,
+            'organiser_id': self.staff_user1.id,
+        }
+        result = import_quest_file.apply(args=[file_name, quest_data]).get()
+        self.assertEqual(result['status'], 'failed')
+        self.assertIn('Error processing excel file', result['errors'])
+        self.assertFalse(Quest.objects.filter(name='Broken Import').exists())
+        self.assertFalse(default_storage.exists(file_name))
+
+        # A failure after the quest and its questions were created rolls them back
+        current_dir = os.path.dirname(os.path.realpath(__file__))
+        with open(os.path.join(current_dir, 'test_files', 'test_excel.xlsx'), 'rb') as excel_file:
+            file_name = stage_import_file(SimpleUploadedFile('quest.xlsx', excel_file.read()))
+        with patch('api.importer.import_quest_attempts', side_effect=Exception('Database is down')):
+            result = import_quest_file.apply(args=[file_name, quest_data]).get()
+        self.assertEqual(result['errors'], {'Error importing user attempts': 'Database is down'})
+        self.assertFalse(Quest.objects.filter(name='Broken Import').exists())
+        self.assertFalse(Question.objects.filter(text='Question 1').exists())
+
+    def test_import_quest_invalid_form_data(self):
+        """
+        Test that invalid quest data is rejected before a job is queued.
+        """
+        url = reverse('quests-import-quest')
+        with patch('api.views.import_quest_file.delay') as mock_delay:
+            response = self.client.post(url, {
+                'file': SimpleUploadedFile('quest.xlsx', b'content'),
+                'name': 'Missing fields',
+            }, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('Error creating quest', response.data['Validation Error'])
+        mock_delay.assert_not_called()
+
+    @patch('api.views.AsyncResult')
+    def test_import_status_action(self, mock_async_result):
+        """
+        Test that the 'import_status' action reports the progress and outcome of an import job.
+        """
+        url = reverse('quests-import-status')
+        job = mock_async_result.return_value
+
+        job.state = 'PENDING'
+        response = self.client.get(url, {'job_id': 'job-1'})
+        self.assertEqual(response.data, {'job_id': 'job-1', 'status': 'pending'})
+
+        job.state = 'PROGRESS'
+        job.info = {'status': 'running', 'stage': 'users', 'counts': {'questions': 2, 'users': 2}}
+        response = self.client.get(url, {'job_id': 'job-1'})
+        self.assertEqual(response.data['stage'], 'users')
+        self.assertEqual(response.data['counts'], {'questions': 2, 'users': 2})
+
+        job.state = 'SUCCESS'
+        job.info = {'status': 'failed', 'errors': {'Error processing excel file': 'File is not a zip file'}}
+        response = self.client.get(url, {'job_id': 'job-1'})
+        self.assertEqual(response.data['status'], 'failed')
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(STORAGES=IN_MEMORY_STORAGES)
+    @patch('api.views.AsyncResult')
+    def test_import_status_is_only_visible_to_its_owner(self, mock_async_result):
+        """
+        Test that an import job is only visible to the user who queued it and to staff users.
+        """
+        self.addCleanup(cache.clear)
+        mock_async_result.return_value.state = 'PENDING'
+        self.client.force_authenticate(user=self.student1)
+        with patch('api.views.import_quest_file.delay') as mock_delay:
+            mock_delay.return_value.id = 'job-2'
+            response = self.client.post(reverse('quests-import-quest'), {
+                'file': SimpleUploadedFile('quest.xlsx', b'content'),
+                'type': 'Wooclap!',
+                'name': 'Imported Quest',
+                'description': 'Imported quest description.',
+                'status': 'Active',
+                'max_attempts': 3,
+                'course_group_id': self.course_group1.id,
+                'image_id': self.image1.id,
+                'organiser_id': self.student1.id,
+            }, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+
+        url = reverse('quests-import-status')
+        response = self.client.get(url, {'job_id': 'job-2'})
+        self.assertEqual(response.data, {'job_id': 'job-2', 'status': 'pending'})
+
+        self.client.force_authenticate(user=self.student2)
+        response = self.client.get(url, {'job_id': 'job-2'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        # Jobs without a known owner are not found either
+        response = self.client.get(url, {'job_id': 'unknown-job'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        self.client.force_authenticate(user=self.staff_user2)
+        response = self.client.get(url, {'job_id': 'job-2'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
 
 class QuestionViewSetTest(BaseViewTest):
 
@@ -1203,6 +1340,73 @@ class AnswerViewSetTest(BaseViewTest):
         self.assertIn('error', response.data)
         self.assertEqual(response.data['error'], 'Answer with id 9999 does not exist.')
 
+    def test_bulk_update_answers_with_invalid_id_writes_nothing(self):
+        """
+        Test that no answer is updated when one of the IDs does not exist, whatever its position.
+        """
+        url = reverse('answers-bulk-update')
+        bulk_data = [
+            {'id': 9999, 'text': 'Invalid Answer', 'is_correct': False},
+            {'id': self.answer1.id, 'text': 'Madrid Updated', 'is_correct': True},
+        ]
+        response = self.client.put(url, bulk_data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.answer1.refresh_from_db()
+        self.assertEqual(self.answer1.text, 'Madrid')
+
+    def test_bulk_update_answers_in_one_update(self):
+        """
+        Test that bulk updating answers writes only the changed answers and fields, in a single UPDATE.
+        """
+        answers = [self.answer1, self.answer2] + [
+            AnswerFactory(question=self.question1, text=f'City {number}', is_correct=False, reason=None)
+            for number in range(10)
+        ]
+        bulk_data = [
+            {'id': answer.id, 'text': answer.text, 'is_correct': answer.is_correct, 'reason': answer.reason}
+            for answer in answers
+        ]
+        bulk_data[2]['text'] = 'Valencia'
+        bulk_data[5]['text'] = 'Seville'
+
+        url = reverse('answers-bulk-update')
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.put(url, bulk_data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([answer['id'] for answer in response.data], [answer.id for answer in answers])
+        self.assertEqual(response.data[2]['text'], 'Valencia')
+
+        updates = [query['sql'] for query in context.captured_queries if query['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 1)
+        self.assertIn('"text"', updates[0])
+        self.assertNotIn('"is_correct"', updates[0])
+        self.assertEqual(Answer.objects.filter(text__in=['Valencia', 'Seville']).count(), 2)
+
+    @patch('api.views.rescore_quests.delay')
+    def test_bulk_update_answers_rescore(self, mock_delay):
+        """
+        Test that changing which answers are correct queues one rescore of their quests when asked to.
+        """
+        url = reverse('answers-bulk-update')
+        bulk_data = [
+            {'id': self.answer1.id, 'text': 'Madrid', 'is_correct': False},
+            {'id': self.answer2.id, 'text': 'Barcelona', 'is_correct': True},
+        ]
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.put(f'{url}?rescore=true', bulk_data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        mock_delay.assert_called_once_with([self.quest1.id])
+
+        # Without the parameter, or when the correct answers do not change, nothing is rescored
+        mock_delay.reset_mock()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.put(url, [
+                {'id': self.answer1.id, 'text': 'Madrid', 'is_correct': True},
+                {'id': self.answer2.id, 'text': 'Barcelona', 'is_correct': False},
+            ], format='json')
+            self.client.put(f'{url}?rescore=true', [{'id': self.answer1.id, 'text': 'Madrid!'}], format='json')
+        mock_delay.assert_not_called()
+
     def test_bulk_update_answers_with_non_list_data(self):
         """
         Test that bulk updating with non-list data fails.
@@ -1361,6 +1565,23 @@ class UserQuestAttemptViewSetTest(BaseViewTest):
         updated_attempt2 = UserQuestAttempt.objects.get(id=self.attempt2.id)
         self.assertFalse(updated_attempt2.submitted)
         self.assertEqual(response.data['message'], f"All attempts for quest {self.quest1.id} have been marked as submitted.")
+        self.assertEqual(response.data['submitted'], 1)
+        self.assertEqual(response.data['already_submitted'], 0)
+
+    @patch('api.tasks.process_submitted_attempts.delay')
+    def test_set_all_attempts_submitted_by_quest_skips_submitted(self, mock_delay):
+        """
+        Test that attempts which are already submitted are neither updated nor processed again.
+        """
+        UserQuestAttempt.objects.filter(id=self.attempt1.id).update(submitted=True)
+        pending = UserQuestAttemptFactory(quest=self.quest1, submitted=False)
+        url = reverse('user-quest-attempts-set-all-attempts-submitted-by-quest')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f"{url}?quest_id={self.quest1.id}", format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['submitted'], 1)
+        self.assertEqual(response.data['already_submitted'], 1)
+        mock_delay.assert_called_once_with([pending.id])
 
     def test_permission_required_for_user_quest_attempt_endpoints(self):
         """
@@ -1517,6 +1738,113 @@ class UserAnswerAttemptViewSetTest(BaseViewTest):
         self.assertTrue(updated_attempt2.is_selected)
         self.assertEqual(updated_attempt2.score_achieved, 3)
 
+    def test_bulk_update_user_answer_attempts_query_budget(self):
+        """
+        Test that a student autosaving a 20 questions x 4 options quest stays within a fixed query budget.
+        """
+        answer_attempts = []
+        for number in range(2, 22):
+            question = QuestionFactory(quest=self.quest1, number=number, max_score=1)
+            for option in range(4):
+                answer = AnswerFactory(question=question, is_correct=option == 0)
+                answer_attempts.append(UserAnswerAttemptFactory(
+                    user_quest_attempt=self.attempt1, question=question, answer=answer, is_selected=False, score_achieved=0
+                ))
+        bulk_data = [
+            {
+                'id': answer_attempt.id,
+                'user_quest_attempt_id': self.attempt1.id,
+                'question_id': answer_attempt.question_id,
+                'answer_id': answer_attempt.answer_id,
+                'is_selected': index % 4 == 0,
+                'score_achieved': 1 if index % 4 == 0 else 0,
+            }
+            for index, answer_attempt in enumerate(answer_attempts)
+        ]
+
+        self.client.force_authenticate(user=self.student1)
+        url = reverse('user-answer-attempts-bulk-update')
+        # Load the attempts and the answers of their questions, then one UPDATE
+        with self.assertNumQueries(3):
+            response = self.client.patch(url, bulk_data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['updated_attempts']), 80)
+        self.assertEqual(len(response.data['updated_attempts'][0]['question']['answers']), 4)
+        self.assertEqual(UserAnswerAttempt.objects.filter(
+            user_quest_attempt=self.attempt1, is_selected=True, score_achieved=1
+        ).count(), 20)
+
+    def test_bulk_update_user_answer_attempts_of_another_student(self):
+        """
+        Test that a student cannot update the answer attempts of another student.
+        """
+        own_attempt = UserQuestAttemptFactory(student=self.student2, quest=self.quest1)
+        own_answer_attempt = UserAnswerAttemptFactory(
+            user_quest_attempt=own_attempt, question=self.question1, answer=self.answer2, is_selected=False
+        )
+        self.client.force_authenticate(user=self.student2)
+        url = reverse('user-answer-attempts-bulk-update')
+        bulk_data = [
+            {'id': own_answer_attempt.id, 'is_selected': True},
+            {'id': self.answer_attempt2.id, 'is_selected': True},
+        ]
+        response = self.client.patch(url, bulk_data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertFalse(UserAnswerAttempt.objects.get(id=own_answer_attempt.id).is_selected)
+        self.assertFalse(UserAnswerAttempt.objects.get(id=self.answer_attempt2.id).is_selected)
+
+        response = self.client.patch(url, bulk_data[:1], format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(UserAnswerAttempt.objects.get(id=own_answer_attempt.id).is_selected)
+
+    def test_bulk_update_user_answer_attempts_with_invalid_data(self):
+        """
+        Test bulk updating user answer attempts with a missing ID, an unknown ID or an invalid value.
+        """
+        url = reverse('user-answer-attempts-bulk-update')
+        response = self.client.patch(url, [{'is_selected': True}], format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['error'], 'ID is required for each attempt.')
+
+        response = self.client.patch(url, [{'id': 9999, 'is_selected': True}], format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(response.data['error'], 'UserAnswerAttempt with id 9999 not found.')
+
+        # Errors are given per item
+        response = self.client.patch(url, [{'id': self.answer_attempt1.id, 'score_achieved': 'high'}], format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('score_achieved', response.data[0])
+
+    def test_bulk_update_user_answer_attempts_rejects_unknown_and_changed_fields(self):
+        """
+        Test that keys other than the fields of a user answer attempt, and changed foreign keys, are rejected.
+        """
+        url = reverse('user-answer-attempts-bulk-update')
+        bulk_data = [
+            {'id': self.answer_attempt1.id, 'is_selected': False},
+            {'id': self.answer_attempt2.id, 'is_selected': True, 'selected': True},
+        ]
+        response = self.client.patch(url, bulk_data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data[0], {})
+        self.assertEqual(response.data[1]['selected'], ['Unknown field.'])
+
+        response = self.client.patch(url, [{'id': self.answer_attempt2.id, 'answer_id': self.answer1.id}], format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            response.data['error'],
+            f'The answer_id of UserAnswerAttempt with id {self.answer_attempt2.id} cannot be changed.'
+        )
+        # Nothing was written by the rejected requests
+        self.assertTrue(UserAnswerAttempt.objects.get(id=self.answer_attempt1.id).is_selected)
+
+        # Items returned by the endpoint can be sent back as they are
+        response = self.client.get(reverse('user-answer-attempts-detail', args=[self.answer_attempt2.id]))
+        item = {**response.data, 'is_selected': True}
+        response = self.client.patch(url, [item], format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(UserAnswerAttempt.objects.get(id=self.answer_attempt2.id).is_selected)
+
     def test_bulk_update_user_answer_attempts_with_non_list_data(self):
         """
         Test bulk updating user answer attempts with non-list data.
@@ -1702,16 +2030,29 @@ class UserQuestBadgeViewSetTest(BaseViewTest):
         """
         url = reverse('user-quest-badges-list')
         data = {
-            'badge_id': self.badge1.id,
+            'badge_id': self.badge3.id,
             'user_quest_attempt_id': self.attempt1.id,
         }
         response = self.client.post(url, data, format='json')
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
         self.assertEqual(UserQuestBadge.objects.count(), 3)
         new_badge = UserQuestBadge.objects.get(id=response.data['id'])
-        self.assertEqual(new_badge.badge, self.badge1)
+        self.assertEqual(new_badge.badge, self.badge3)
         self.assertEqual(new_badge.user_quest_attempt, self.attempt1)
 
+    def test_create_duplicate_user_quest_badge(self):
+        """
+        Test that the same badge cannot be awarded twice for the same quest attempt.
+        """
+        url = reverse('user-quest-badges-list')
+        data = {
+            'badge_id': self.badge1.id,
+            'user_quest_attempt_id': self.attempt1.id,
+        }
+        response = self.client.post(url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(UserQuestBadge.objects.count(), 2)
+
     def test_retrieve_user_quest_badge(self):
         """
         Test retrieving a specific user quest badge.
@@ -1728,12 +2069,12 @@ class UserQuestBadgeViewSetTest(BaseViewTest):
         """
         url = reverse('user-quest-badges-detail', args=[self.user_quest_badge1.id])
         data = {
-            'badge_id': self.badge2.id,  # Change badge
+            'badge_id': self.badge3.id,  # Change badge
         }
         response = self.client.patch(url, data, format='json')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         updated_badge = UserQuestBadge.objects.get(id=self.user_quest_badge1.id)
-        self.assertEqual(updated_badge.badge, self.badge2)
+        self.assertEqual(updated_badge.badge, self.badge3)
 
     def test_delete_user_quest_badge(self):
         """
@@ -1901,3 +2242,177 @@ class UserCourseBadgeViewSetTest(BaseViewTest):
         url = reverse('user-course-badges-by-user')
         response = self.client.get(url, {'user_id': self.student1.id})
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class AnalyticsPartTwoViewTest(BaseViewTest):
+
+    def setUp(self):
+        super().setUp()
+        badge_catalogue.clear()
+        self.addCleanup(badge_catalogue.clear)
+
+    def test_badge_progression(self):
+        """
+        Test that the badge progression counts the quest and course badges earned by the user.
+        """
+        attempt = UserQuestAttemptFactory(student=self.student1, quest=self.quest1)
+        UserQuestBadgeFactory(user_quest_attempt=attempt, badge=self.badge2)
+        url = reverse('analytics-part-two')
+        response = self.client.get(url, {'user_id': self.student1.id, 'option': 'badge_progression'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        progression = response.data['user_badge_progression']
+        self.assertEqual([badge['badge_id'] for badge in progression], [self.badge2.id, self.badge1.id, self.badge3.id])
+        self.assertEqual(progression[0]['count'], 2)
+        self.assertEqual(progression[0]['badge_name'], 'Badge 2')
+
+    def test_badge_progression_with_stale_catalogue(self):
+        """
+        Test that a badge created by another process after the catalogue was loaded is found.
+        """
+        badge_catalogue.all()
+        # bulk_create sends no signal, like a badge created in another worker
+        new_badge = Badge.objects.bulk_create([
+            Badge(name='Badge 5', description='Fifth badge', type='Quest Type', condition='Complete Quest 3')
+        ])[0]
+        UserQuestBadgeFactory(user_quest_attempt=self.attempt1, badge=new_badge)
+
+        url = reverse('analytics-part-two')
+        response = self.client.get(url, {'user_id': self.student1.id, 'option': 'badge_progression'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        progression = {badge['badge_id']: badge for badge in response.data['user_badge_progression']}
+        self.assertEqual(progression[new_badge.id]['badge_name'], 'Badge 5')
+        self.assertIsNone(progression[new_badge.id]['badge_filename'])
+        self.assertEqual(progression[new_badge.id]['count'], 1)
+
+
+class KeysetPaginationTest(BaseViewTest):
+
+    def test_list_without_pagination_params_is_unchanged(self):
+        """
+        Test that clients that do not send a cursor still get the full list.
+        """
+        url = reverse('quests-list')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIsInstance(response.data, list)
+        self.assertEqual(len(response.data), 4)
+
+    def test_list_is_paginated_by_id(self):
+        """
+        Test that pages follow each other by descending id until the last page.
+        """
+        url = reverse('quests-list')
+        response = self.client.get(url, {'page_size': 3})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        first_page_ids = [quest['id'] for quest in response.data['results']]
+        self.assertEqual(first_page_ids, [self.private_quest.id, self.quest3.id, self.quest2.id])
+        self.assertIsNotNone(response.data['next'])
+
+        response = self.client.get(response.data['next'])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([quest['id'] for quest in response.data['results']], [self.quest1.id])
+        self.assertIsNone(response.data['next'])
+
+    def test_cursor_is_stable_when_rows_are_added(self):
+        """
+        Test that rows created after the first page do not shift the next page.
+        """
+        url = reverse('quests-list')
+        response = self.client.get(url, {'page_size': 2})
+        next_url = response.data['next']
+        QuestFactory(name='Quest 4', course_group=self.course_group1, organiser=self.staff_user1)
+
+        response = self.client.get(next_url)
+        self.assertEqual([quest['id'] for quest in response.data['results']], [self.quest2.id, self.quest1.id])
+
+    def test_invalid_cursor(self):
+        """
+        Test that a tampered cursor is rejected.
+        """
+        url = reverse('quests-list')
+        response = self.client.get(url, {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_page_size_is_capped(self):
+        """
+        Test that the page size cannot exceed the maximum.
+        """
+        url = reverse('quests-list')
+        response = self.client.get(url, {'page_size': 100000})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 4)
+
+    def test_action_list_is_paginated(self):
+        """
+        Test that custom list actions support the same pagination.
+        """
+        url = reverse('user-answer-attempts-by-quest')
+        response = self.client.get(url, {'quest_id': self.quest1.id, 'page_size': 1})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([attempt['id'] for attempt in response.data['results']], [self.answer_attempt2.id])
+
+        response = self.client.get(response.data['next'])
+        self.assertEqual([attempt['id'] for attempt in response.data['results']], [self.answer_attempt1.id])
+        self.assertIsNone(response.data['next'])
+
+    def test_action_list_without_pagination_params_is_unchanged(self):
+        """
+        Test that custom list actions still return a plain list without a cursor.
+        """
+        url = reverse('user-answer-attempts-by-quest')
+        response = self.client.get(url, {'quest_id': self.quest1.id})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 2)
+
+
+class QuestListQueryCountTest(BaseViewTest):
+
+    def count_queries(self, url, params=None):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(context.captured_queries), response
+
+    def test_quest_list_query_count_does_not_grow_with_quests(self):
+        """
+        Test that listing quests runs the same number of queries for 4 quests as for 24 quests.
+        """
+        url = reverse('quests-list')
+        baseline_count, _ = self.count_queries(url)
+        for i in range(20):
+            quest = QuestFactory(name=f'Extra Quest {i}', course_group=self.course_group2, organiser=self.staff_user2)
+            QuestionFactory(quest=quest, number=1, max_score=2)
+            QuestionFactory(quest=quest, number=2, max_score=3)
+        count, response = self.count_queries(url)
+        self.assertEqual(len(response.data), 24)
+        self.assertEqual(count, baseline_count)
+
+    def test_action_query_count_does_not_grow_with_quests(self):
+        """
+        Test that the by_enrolled_user action runs a constant number of queries.
+        """
+        url = reverse('quests-by-enrolled-user')
+        baseline_count, _ = self.count_queries(url, {'user_id': self.student1.id})
+        for i in range(10):
+            QuestFactory(name=f'Extra Quest {i}', course_group=self.course_group1, organiser=self.staff_user1)
+        count, response = self.count_queries(url, {'user_id': self.student1.id})
+        self.assertEqual(len(response.data), 12)
+        self.assertEqual(count, baseline_count)
+
+    def test_quest_totals_match_model_methods(self):
+        """
+        Test that the annotated totals match Quest.total_max_score() and Quest.total_questions().
+        """
+        QuestionFactory(quest=self.quest1, number=2, max_score=2.5)
+        url = reverse('quests-list')
+        response = self.client.get(url)
+        for data in response.data:
+            quest = Quest.objects.get(id=data['id'])
+            self.assertEqual(data['total_max_score'], quest.total_max_score())
+            # A quest without questions has a total of int 0, not 0.0
+            self.assertIs(type(data['total_max_score']), type(quest.total_max_score()))
+            self.assertEqual(data['total_questions'], quest.total_questions())
+            self.assertEqual(
+                data['course_group']['total_students_enrolled'],
+                quest.course_group.total_students_enrolled()
+            )
@@ -0,0 +1,80 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+
+class VerifiedTokenCache:
+    """
+    Bounded LRU cache of validated token claims, keyed by a SHA-256 hash of the raw token.
+    An entry is only served until the token's 'exp' claim, tokens without 'exp' are never cached.
+    Only tokens whose signature was verified are added, at most AZURE_TOKEN_CACHE_SIZE of them.
+    The raw token itself is not kept in memory.
+    """
+
+    def __init__(self):
+        self._entries = OrderedDict()  # token hash -> (exp, claims)
+        self._lock = threading.Lock()
+        self._counters = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    @property
+    def maxsize(self):
+        return getattr(settings, 'AZURE_TOKEN_CACHE_SIZE', 2048)
+
+    @staticmethod
+    def _hash(raw_token):
+        if isinstance(raw_token, str):
+            raw_token = raw_token.encode()
+        return hashlib.sha256(raw_token).hexdigest()
+
+    def get(self, raw_token):
+        """
+        Return the cached claims for the raw token, or None if it has not been validated or has expired
+        """
+        token_hash = self._hash(raw_token)
+        with self._lock:
+            entry = self._entries.get(token_hash)
+            if entry is None:
+                self._counters['misses'] += 1
+                return None
+            exp, claims = entry
+            if time.time() >= exp:
+                del self._entries[token_hash]
+                self._counters['misses'] += 1
+                return None
+            self._entries.move_to_end(token_hash)
+            self._counters['hits'] += 1
+            return claims
+
+    def set(self, raw_token, claims):
+        exp = claims.get('exp')
+        if not exp or self.maxsize <= 0:
+            return
+        token_hash = self._hash(raw_token)
+        with self._lock:
+            self._entries[token_hash] = (exp, claims)
+            self._entries.move_to_end(token_hash)
+            if len(self._entries) > self.maxsize:
+                # Expired tokens go first, so that they never push out tokens that can still be served
+                now = time.time()
+                for expired_hash in [key for key, (entry_exp, _) in self._entries.items() if entry_exp <= now]:
+                    del self._entries[expired_hash]
+                    self._counters['evictions'] += 1
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self._counters['evictions'] += 1
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters, size=len(self._entries))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            for name in self._counters:
+                self._counters[name] = 0
+
+
+verified_token_cache = VerifiedTokenCache()
@@ -16,3 +16,81 @@ def split_full_name(full_name):
         last_name = ""
 
     return first_name, last_name
+
+
+def update_returning_pks(queryset, **values):
+    """
+    Run 'UPDATE ... SET <values> WHERE pk IN (<queryset>) RETURNING pk' and return the updated pks.
+    Unlike QuerySet.update(), this tells which rows were changed, in the same statement.
+    Lock the rows in the queryset with select_for_update() to make the update safe against
+    concurrent callers: the WHERE clause is then checked again on rows that changed meanwhile.
+    """
+    from django.db import connections
+
+    model = queryset.model
+    connection = connections[queryset.db]
+    quote_name = connection.ops.quote_name
+    assignments = []
+    params = []
+    for name, value in values.items():
+        field = model._meta.get_field(name)
+        assignments.append(f"{quote_name(field.column)} = %s")
+        params.append(field.get_db_prep_save(value, connection=connection))
+    pk_column = quote_name(model._meta.pk.column)
+    subquery, subquery_params = queryset.order_by().values('pk').query.sql_with_params()
+    sql = (
+        f"UPDATE {quote_name(model._meta.db_table)} SET {', '.join(assignments)} "
+        f"WHERE {pk_column} IN ({subquery}) RETURNING {pk_column}"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params + list(subquery_params))
+        return [row[0] for row in cursor.fetchall()]
+
+
+def insert_columns(model, columns):
+    """
+    Insert rows given column by column, {field name: [values]}, with one
+    'INSERT ... SELECT * FROM unnest(<array per column>)' statement.
+    Unlike QuerySet.bulk_create(), no model instance is built and the statement has one parameter
+    per column instead of one per value, which makes inserting tens of thousands of rows much cheaper.
+    Fields left out get no value from their Django default, so every non-null column must be given.
+    Returns the number of rows inserted.
+    """
+    from django.db import connections, router
+
+    connection = connections[router.db_for_write(model)]
+    quote_name = connection.ops.quote_name
+    names = []
+    arrays = []
+    params = []
+    for name, values in columns.items():
+        field = model._meta.get_field(name)
+        names.append(quote_name(field.column))
+        arrays.append(f"%s::{field.db_type(connection)}[]")
+        params.append([field.get_db_prep_save(value, connection=connection) for value in values])
+    sql = (
+        f"INSERT INTO {quote_name(model._meta.db_table)} ({', '.join(names)}) "
+        f"SELECT * FROM unnest({', '.join(arrays)})"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.rowcount
+
+
+def insert_from_select(model, field_names, queryset):
+    """
+    Run 'INSERT INTO <model> (<fields>) SELECT ...' with the SQL of queryset, so the rows are copied
+    in the database without being loaded in Python.
+    queryset must select one column per field, in the same order, e.g. a values_list() of annotations.
+    Returns the number of rows inserted.
+    """
+    from django.db import connections, router
+
+    connection = connections[router.db_for_write(model)]
+    quote_name = connection.ops.quote_name
+    columns = [quote_name(model._meta.get_field(name).column) for name in field_names]
+    select, params = queryset.query.sql_with_params()
+    sql = f"INSERT INTO {quote_name(model._meta.db_table)} ({', '.join(columns)}) {select}"
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.rowcount
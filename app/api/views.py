@@ -4,13 +4,15 @@ from django.views.decorators.csrf import csrf_exempt
 from django.db import transaction
 from rest_framework import viewsets
 from rest_framework.decorators import action
-from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import IsAuthenticated
 from django.contrib.auth import get_user_model
 from rest_framework.views import APIView
 from datetime import timedelta
 from django.db.models import Count, Q, Max, Avg, Prefetch
-from .excel import Excel
+from .badges import badge_catalogue
+from .importer import can_read_import_job, record_import_job_owner, stage_import_file
+from .tasks import import_quest_file, rescore_quests
+from celery.result import AsyncResult
 from rest_framework import status
 from django.utils import timezone
 from django.db.models import Sum, F, ExpressionWrapper, DurationField
@@ -45,6 +47,7 @@ from .serializers import (
     AnswerSerializer,
     UserQuestAttemptSerializer,
     UserAnswerAttemptSerializer,
+    UserAnswerAttemptBulkItemSerializer,
     BadgeSerializer,
     UserQuestBadgeSerializer,
     UserCourseBadgeSerializer,
@@ -77,7 +80,25 @@ def status_view(request):
     })
 
 
-class EduquestUserViewSet(viewsets.ModelViewSet):
+class PaginatedListMixin:
+    """
+    Apply the viewset's pagination to the custom @action list endpoints.
+    Without a 'cursor' or 'page_size' query parameter the full list is returned as before.
+    """
+
+    def list_response(self, queryset, serializer_class=None):
+        page = self.paginate_queryset(queryset)
+        data = page if page is not None else queryset
+        if serializer_class is None:
+            serializer = self.get_serializer(data, many=True)
+        else:
+            serializer = serializer_class(data, many=True)
+        if page is not None:
+            return self.get_paginated_response(serializer.data)
+        return Response(serializer.data)
+
+
+class EduquestUserViewSet(PaginatedListMixin, viewsets.ModelViewSet):
     queryset = EduquestUser.objects.all().order_by('-id')
     serializer_class = EduquestUserSerializer
     permission_classes = [IsAuthenticated]
@@ -92,11 +113,10 @@ class EduquestUserViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'])
     def by_admin(self, request):
         queryset = EduquestUser.objects.filter(is_staff=True).order_by('-id')
-        serializer = EduquestUserSerializer(queryset, many=True)
-        return Response(serializer.data)
+        return self.list_response(queryset, EduquestUserSerializer)
 
 
-class AcademicYearViewSet(viewsets.ModelViewSet):
+class AcademicYearViewSet(PaginatedListMixin, viewsets.ModelViewSet):
     queryset = AcademicYear.objects.all().order_by('-id')
     serializer_class = AcademicYearSerializer
     permission_classes = [IsAuthenticated]
@@ -104,11 +124,10 @@ class AcademicYearViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'])
     def non_private(self, request):
         queryset = AcademicYear.objects.exclude(start_year=0).order_by('-id')
-        serializer = AcademicYearSerializer(queryset, many=True)
-        return Response(serializer.data)
+        return self.list_response(queryset, AcademicYearSerializer)
 
 
-class TermViewSet(viewsets.ModelViewSet):
+class TermViewSet(PaginatedListMixin, viewsets.ModelViewSet):
     queryset = Term.objects.all().order_by('-id')
     serializer_class = TermSerializer
     permission_classes = [IsAuthenticated]
@@ -116,17 +135,16 @@ class TermViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'])
     def non_private(self, request):
         queryset = Term.objects.exclude(name='Private Term').order_by('-id')
-        serializer = TermSerializer(queryset, many=True)
-        return Response(serializer.data)
+        return self.list_response(queryset, TermSerializer)
 
 
-class ImageViewSet(viewsets.ModelViewSet):
+class ImageViewSet(PaginatedListMixin, viewsets.ModelViewSet):
     queryset = Image.objects.all().order_by('-id')
     serializer_class = ImageSerializer
     permission_classes = [IsAuthenticated]
 
 
-class CourseViewSet(viewsets.ModelViewSet):
+class CourseViewSet(PaginatedListMixin, viewsets.ModelViewSet):
     queryset = Course.objects.all().order_by('-id')
     serializer_class = CourseSerializer
     permission_classes = [IsAuthenticated]
@@ -134,8 +152,7 @@ class CourseViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'])
     def non_private(self, request):
         queryset = Course.objects.exclude(type='Private').order_by('-id')
-        serializer = CourseSerializer(queryset, many=True)
-        return Response(serializer.data)
+        return self.list_response(queryset, CourseSerializer)
 
     @action(detail=False, methods=['get'])
     def by_enrolled_user(self, request):
@@ -150,11 +167,10 @@ class CourseViewSet(viewsets.ModelViewSet):
         queryset = Course.objects.exclude(type='Private').filter(id__in=course_ids).order_by('-id')
 
         # Serialize the results
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+        return self.list_response(queryset)
 
 
-class CourseGroupViewSet(viewsets.ModelViewSet):
+class CourseGroupViewSet(PaginatedListMixin, viewsets.ModelViewSet):
     queryset = CourseGroup.objects.all().order_by('-id')
     serializer_class = CourseGroupSerializer
     permission_classes = [IsAuthenticated]
@@ -163,23 +179,20 @@ class CourseGroupViewSet(viewsets.ModelViewSet):
     def by_course(self, request):
         course_id = request.query_params.get('course_id')
         queryset = CourseGroup.objects.filter(course=course_id).order_by('-id')
-        serializer = CourseGroupSerializer(queryset, many=True)
-        return Response(serializer.data)
+        return self.list_response(queryset, CourseGroupSerializer)
 
     @action(detail=False, methods=['get'])
     def by_private_course(self, request):
         queryset = CourseGroup.objects.filter(course__type='Private').order_by('-id')
-        serializer = CourseGroupSerializer(queryset, many=True)
-        return Response(serializer.data)
+        return self.list_response(queryset, CourseGroupSerializer)
 
     @action(detail=False, methods=['get'])
     def non_private(self, request):
         queryset = CourseGroup.objects.exclude(course__type='Private').order_by('-id')
-        serializer = CourseGroupSerializer(queryset, many=True)
-        return Response(serializer.data)
+        return self.list_response(queryset, CourseGroupSerializer)
 
 
-class UserCourseGroupEnrollmentViewSet(viewsets.ModelViewSet):
+class UserCourseGroupEnrollmentViewSet(PaginatedListMixin, viewsets.ModelViewSet):
     queryset = UserCourseGroupEnrollment.objects.all().order_by('-id')
     serializer_class = UserCourseGroupEnrollmentSerializer
     permission_classes = [IsAuthenticated]
@@ -190,8 +203,7 @@ class UserCourseGroupEnrollmentViewSet(viewsets.ModelViewSet):
         user_id = request.query_params.get('user_id')
         queryset = UserCourseGroupEnrollment.objects.filter(course_group=course_group_id, student=user_id).order_by(
             '-id')
-        serializer = UserCourseGroupEnrollmentSerializer(queryset, many=True)
-        return Response(serializer.data)
+        return self.list_response(queryset, UserCourseGroupEnrollmentSerializer)
 
     @action(detail=False, methods=['get'])
     def by_course_and_user(self, request):
@@ -199,27 +211,30 @@ class UserCourseGroupEnrollmentViewSet(viewsets.ModelViewSet):
         user_id = request.query_params.get('user_id')
         queryset = UserCourseGroupEnrollment.objects.filter(course_group__course=course_id, student=user_id).order_by(
             '-id')
-        serializer = UserCourseGroupEnrollmentSerializer(queryset, many=True)
-        return Response(serializer.data)
+        return self.list_response(queryset, UserCourseGroupEnrollmentSerializer)
 
 
-class QuestViewSet(viewsets.ModelViewSet):
+class QuestViewSet(PaginatedListMixin, viewsets.ModelViewSet):
     queryset = Quest.objects.all().order_by('-id')
     serializer_class = QuestSerializer
     permission_classes = [IsAuthenticated]
 
+    def get_queryset(self):
+        # Load everything QuestSerializer reads in a fixed number of queries, whatever the number of quests
+        return super().get_queryset().with_totals().select_related('organiser', 'image').prefetch_related(
+            Prefetch('course_group', queryset=CourseGroup.objects.select_related('course', 'instructor'))
+        )
+
     @action(detail=False, methods=['get'])
     def non_private(self, request):
-        queryset = Quest.objects.exclude(type='Private').order_by('-id')
-        serializer = QuestSerializer(queryset, many=True)
-        return Response(serializer.data)
+        queryset = self.get_queryset().exclude(type='Private')
+        return self.list_response(queryset, QuestSerializer)
 
     @action(detail=False, methods=['get'])
     def private_by_user(self, request):
         user = request.user
-        queryset = Quest.objects.filter(organiser=user, type='Private').order_by('-id')
-        serializer = QuestSerializer(queryset, many=True)
-        return Response(serializer.data)
+        queryset = self.get_queryset().filter(organiser=user, type='Private')
+        return self.list_response(queryset, QuestSerializer)
 
     @action(detail=False, methods=['get'])
     def by_enrolled_user(self, request):
@@ -227,21 +242,23 @@ class QuestViewSet(viewsets.ModelViewSet):
         # Get all course group enrollments for the user
         course_group_enrollments = UserCourseGroupEnrollment.objects.filter(student=user_id)
         # Get all quests for the course groups
-        queryset = Quest.objects.filter(
+        queryset = self.get_queryset().filter(
             course_group__in=course_group_enrollments.values('course_group')
-        ).exclude(type='Private').order_by('-id')
-        serializer = QuestSerializer(queryset, many=True)
-        return Response(serializer.data)
+        ).exclude(type='Private')
+        return self.list_response(queryset, QuestSerializer)
 
     @action(detail=False, methods=['get'])
     def by_course_group(self, request):
         course_group_id = request.query_params.get('course_group_id')
-        queryset = Quest.objects.filter(course_group=course_group_id).order_by('-id')
-        serializer = QuestSerializer(queryset, many=True)
-        return Response(serializer.data)
+        queryset = self.get_queryset().filter(course_group=course_group_id)
+        return self.list_response(queryset, QuestSerializer)
 
     @action(detail=False, methods=['post'])
     def import_quest(self, request):
+        """
+        Queue the import of a quest from a Wooclap Excel file and return the id of the import job,
+        the progress and outcome of the job are read with import_status.
+        """
         try:
             excel_file = request.FILES.get('file')
         except Exception as e:
@@ -256,17 +273,6 @@ class QuestViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        try:
-            excel = Excel()
-            excel.read_excel_sheets(excel_file)
-            questions_data = excel.get_questions()
-            users_data = excel.get_users()
-        except Exception as e:
-            return Response(
-                {"Error processing excel file": str(e)},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-
         try:
             # Extract other form data
             quest_data = {
@@ -286,99 +292,43 @@ class QuestViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        # Use atomic transaction to ensure data integrity
-        with transaction.atomic():
-            try:
-                try:
-                    # Create a Quest object
-                    quest_serializer = QuestSerializer(data=quest_data)
-                    quest_serializer.is_valid(raise_exception=True)
-                    quest = quest_serializer.save()
-                    new_quest_id = quest.id
-                except Exception as e:
-                    raise ValidationError({"Error creating quest": str(e)})
-
-                try:
-                    questions_serializer = []
-                    # Process each question in the questions_data list
-                    for question_data in questions_data:
-                        question_data['quest_id'] = new_quest_id
-                        question_serializer = QuestionSerializer(data=question_data)
-                        question_serializer.is_valid(raise_exception=True)
-                        question = question_serializer.save()
-                        questions_serializer.append(question_serializer.data)
-                except Exception as e:
-                    raise ValidationError({"Error creating questions": str(e)})
-
-                # Enroll users and create UserQuestAttempt and UserAnswerAttempt objects
-                for user_data in users_data:
-                    try:
-                        print(f"Processing user: {user_data['email']}")
-                        user, created = EduquestUser.objects.get_or_create(
-                            email=user_data['email'],
-                            defaults={
-                                'email': user_data['email'],
-                                'username': user_data['username'],
-                                'nickname': user_data['username'],
-                            }
-                        )
-                    except Exception as e:
-                        raise ValidationError({"Error creating user": str(e)})
-
-                    try:
-                        # Enroll the user in the course group
-                        enrollment, enrolled = UserCourseGroupEnrollment.objects.get_or_create(
-                            student=user,
-                            course_group_id=quest_data['course_group_id'],
-                        )
-                    except Exception as e:
-                        raise ValidationError({"Error enrolling new user": str(e)})
-
-                    try:
-                        # Create a UserQuestAttempt object
-                        user_quest_attempt_data = {
-                            'student_id': user.id,
-                            'quest_id': new_quest_id
-                        }
-                        user_quest_attempt_serializer = UserQuestAttemptSerializer(data=user_quest_attempt_data)
-                        user_quest_attempt_serializer.is_valid(raise_exception=True)
-                        user_quest_attempt = user_quest_attempt_serializer.save()
-                        new_user_quest_attempt_id = user_quest_attempt.id
-
-                        # Get the generated empty-prefilled UserAnswerAttempt objects for the UserQuestAttempt
-                        user_answer_attempts = UserAnswerAttempt.objects.filter(
-                            user_quest_attempt=new_user_quest_attempt_id
-                        )
-                    except Exception as e:
-                        raise ValidationError({"Error creating user quest attempt": str(e)})
-
-                    # Update selected answers based on Excel data
-                    try:
-                        selected_answers = excel.get_user_answer_attempts(user.email)
-                        for user_answer_attempt in user_answer_attempts:
-                            for selected_answer in selected_answers:
-                                if selected_answer['number'] == user_answer_attempt.question.number:
-                                    if user_answer_attempt.answer.text in selected_answer['selected_answers']:
-                                        user_answer_attempt.is_selected = True
-                                        user_answer_attempt.save()
-                    except Exception as e:
-                        raise ValidationError({"Error updating selected answers": str(e)})
-
-            except ValidationError as ve:
-                return Response(
-                    {"Validation Error": ve.detail},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-            except Exception as e:
-                return Response(
-                    {"Error importing quest": str(e)},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-
-        return Response(questions_serializer, status=status.HTTP_201_CREATED)
+        # Report invalid form data right away instead of through the job
+        quest_serializer = QuestSerializer(data=quest_data)
+        if not quest_serializer.is_valid():
+            return Response(
+                {"Validation Error": {"Error creating quest": quest_serializer.errors}},
+                status=status.HTTP_400_BAD_REQUEST
+            )
 
+        file_name = stage_import_file(excel_file)
+        job = import_quest_file.delay(file_name, quest_data)
+        record_import_job_owner(job.id, request.user)
+        return Response({"job_id": job.id}, status=status.HTTP_202_ACCEPTED)
 
-class QuestionViewSet(viewsets.ModelViewSet):
+    @action(detail=False, methods=['get'])
+    def import_status(self, request):
+        """
+        Return the status of an import job: pending, running with its stage and row counts,
+        completed with the quest, its questions and row counts, or failed with its errors.
+        Only the user who queued the job and staff users can read it, it is not found for anyone else.
+        """
+        job_id = request.query_params.get('job_id')
+        if not job_id:
+            return Response({"job_id": "This query parameter is required."}, status=status.HTTP_400_BAD_REQUEST)
+        if not can_read_import_job(job_id, request.user):
+            return Response({"error": f"Import job {job_id} does not exist."}, status=status.HTTP_404_NOT_FOUND)
+        job = AsyncResult(job_id, app=import_quest_file.app)
+        if job.state == 'PENDING':
+            # Also the state of unknown jobs, and of jobs whose result has expired
+            return Response({"job_id": job_id, "status": "pending"})
+        if job.state == 'FAILURE':
+            return Response({"job_id": job_id, "status": "failed", "errors": {"Error importing quest": str(job.result)}})
+        if isinstance(job.info, dict):
+            return Response({"job_id": job_id, **job.info})
+        return Response({"job_id": job_id, "status": job.state.lower()})
+
+
+class QuestionViewSet(PaginatedListMixin, viewsets.ModelViewSet):
     queryset = Question.objects.all().order_by('-id')
     serializer_class = QuestionSerializer
     permission_classes = [IsAuthenticated]
@@ -396,7 +346,7 @@ class QuestionViewSet(viewsets.ModelViewSet):
         serializer.save()
 
 
-class AnswerViewSet(viewsets.ModelViewSet):
+class AnswerViewSet(PaginatedListMixin, viewsets.ModelViewSet):
     queryset = Answer.objects.all().order_by('-id')
     serializer_class = AnswerSerializer
     permission_classes = [IsAuthenticated]
@@ -415,34 +365,47 @@ class AnswerViewSet(viewsets.ModelViewSet):
         validated_data = serializer.validated_data
 
         # Collect the IDs of the answers to update
-        answer_ids = [item['id'] for item in validated_data]
+        answer_ids = [item.get('id') for item in validated_data]
 
-        # Retrieve the existing answers from the database
-        answers = Answer.objects.filter(id__in=answer_ids)
-
-        # Map existing answers by ID for easy lookup
-        answer_dict = {answer.id: answer for answer in answers}
+        # Retrieve the existing answers, with the quest they belong to, and check they all exist before writing
+        answer_dict = {
+            answer.id: answer
+            for answer in Answer.objects.filter(id__in=answer_ids).annotate(quest_id=F('question__quest_id'))
+        }
+        for answer_id in answer_ids:
+            if answer_id not in answer_dict:
+                return Response({"error": f"Answer with id {answer_id} does not exist."},
+                                status=status.HTTP_404_NOT_FOUND)
 
-        updated_answers = []
+        # Only the answers and fields that changed are written, in one UPDATE
+        changed_answers = {}
+        changed_fields = set()
+        rescored_quest_ids = set()
         for item in validated_data:
-            answer_id = item.get('id')
-            if answer_id in answer_dict:
-                answer_instance = answer_dict[answer_id]
-                # Update the fields
-                for attr, value in item.items():
+            answer_instance = answer_dict[item['id']]
+            for attr, value in item.items():
+                if attr != 'id' and getattr(answer_instance, attr) != value:
                     setattr(answer_instance, attr, value)
-                answer_instance.save()
-                updated_answers.append(answer_instance)
-            else:
-                return Response({"error": f"Answer with id {answer_id} does not exist."},
-                                status=status.HTTP_404_NOT_FOUND)
+                    changed_answers[answer_instance.id] = answer_instance
+                    changed_fields.add(attr)
+                    if attr == 'is_correct':
+                        rescored_quest_ids.add(answer_instance.quest_id)
+
+        with transaction.atomic():
+            if changed_answers:
+                Answer.objects.bulk_update(list(changed_answers.values()), sorted(changed_fields))
+            # Changing which answers are correct changes the score of the attempts already submitted
+            if rescored_quest_ids and request.query_params.get('rescore', '').lower() == 'true':
+                quest_ids = sorted(rescored_quest_ids)
+                transaction.on_commit(lambda: rescore_quests.delay(quest_ids))
 
         # Serialize the updated answers to return in the response
+        updated_answers = [answer_dict[answer_id] for answer_id in answer_ids]
         output_serializer = self.get_serializer(updated_answers, many=True)
         return Response(output_serializer.data, status=status.HTTP_200_OK)
 
 
-class UserQuestAttemptViewSet(viewsets.ModelViewSet):
+class UserQuestAttemptViewSet(PaginatedListMixin, viewsets.ModelViewSet):
     queryset = UserQuestAttempt.objects.all().order_by('-id')
     serializer_class = UserQuestAttemptSerializer
     permission_classes = [IsAuthenticated]
@@ -452,24 +415,25 @@ class UserQuestAttemptViewSet(viewsets.ModelViewSet):
         quest_id = request.query_params.get('quest_id')
         user_id = request.query_params.get('user_id')
         queryset = UserQuestAttempt.objects.filter(student=user_id, quest=quest_id).order_by('-id')
-        serializer = UserQuestAttemptSerializer(queryset, many=True)
-        return Response(serializer.data)
+        return self.list_response(queryset, UserQuestAttemptSerializer)
 
     @action(detail=False, methods=['get'])
     def by_quest(self, request):
         quest_id = request.query_params.get('quest_id')
         queryset = UserQuestAttempt.objects.filter(quest=quest_id).order_by('-id')
-        serializer = UserQuestAttemptSerializer(queryset, many=True)
-        return Response(serializer.data)
+        return self.list_response(queryset, UserQuestAttemptSerializer)
 
     @action(detail=False, methods=['post'])
     def set_all_attempts_submitted_by_quest(self, request):
         quest_id = request.query_params.get('quest_id')
         queryset = UserQuestAttempt.objects.filter(quest=quest_id)
-        for instance in queryset:
-            instance.submitted = True
-            instance.save()
-        return Response({"message": f"All attempts for quest {quest_id} have been marked as submitted."})
+        # Only the attempts that were not submitted yet are updated and processed
+        submitted_ids = queryset.submit()
+        return Response({
+            "message": f"All attempts for quest {quest_id} have been marked as submitted.",
+            "submitted": len(submitted_ids),
+            "already_submitted": queryset.filter(submitted=True).count() - len(submitted_ids),
+        })
 
     # @action(detail=False, methods=['patch'], url_path='bulk-update')
     # def bulk_update(self, request, *args, **kwargs):
@@ -503,7 +467,7 @@ class UserQuestAttemptViewSet(viewsets.ModelViewSet):
     #     return Response({"error": "Expected a list of data."}, status=status.HTTP_400_BAD_REQUEST)
 
 
-class UserAnswerAttemptViewSet(viewsets.ModelViewSet):
+class UserAnswerAttemptViewSet(PaginatedListMixin, viewsets.ModelViewSet):
     queryset = UserAnswerAttempt.objects.all().order_by('-id')
     serializer_class = UserAnswerAttemptSerializer
     permission_classes = [IsAuthenticated]
@@ -512,55 +476,75 @@ class UserAnswerAttemptViewSet(viewsets.ModelViewSet):
     def by_user_quest_attempt(self, request):
         user_quest_attempt_id = request.query_params.get('user_quest_attempt_id')
         queryset = UserAnswerAttempt.objects.filter(user_quest_attempt=user_quest_attempt_id).order_by('-id')
-        serializer = UserAnswerAttemptSerializer(queryset, many=True)
-        return Response(serializer.data)
+        return self.list_response(queryset, UserAnswerAttemptSerializer)
 
     @action(detail=False, methods=['get'])
     def by_quest(self, request):
         quest_id = request.query_params.get('quest_id')
         queryset = UserAnswerAttempt.objects.filter(user_quest_attempt__quest=quest_id).order_by('-id')
-        serializer = UserAnswerAttemptSerializer(queryset, many=True)
-        return Response(serializer.data)
+        return self.list_response(queryset, UserAnswerAttemptSerializer)
 
     @action(detail=False, methods=['patch'], url_path='bulk-update')
     def bulk_update(self, request, *args, **kwargs):
         """
-        Bulk update UserAnswerAttempt
+        Bulk update the is_selected and score_achieved of UserAnswerAttempts, e.g. when the quest player autosaves.
+        The attempts are loaded with one query and written with one UPDATE, whatever their number.
+        Students can only update their own attempts.
+        Validation errors are a list with one dict per item, unknown keys and changed foreign keys are rejected.
         """
-        if isinstance(request.data, list):
-            updated_attempts = []
-            for attempt_data in request.data:
-                attempt_id = attempt_data.get('id')
-                if not attempt_id:
-                    return Response({"error": "ID is required for each attempt."}, status=status.HTTP_400_BAD_REQUEST)
-
-                try:
-                    # Retrieve the instance to update
-                    attempt_instance = UserAnswerAttempt.objects.get(id=attempt_id)
-                except UserAnswerAttempt.DoesNotExist:
-                    return Response({"error": f"UserAnswerAttempt with id {attempt_id} not found."},
-                                    status=status.HTTP_404_NOT_FOUND)
-
-                # Use the existing serializer for each update
-                serializer = self.get_serializer(instance=attempt_instance, data=attempt_data, partial=True)
-                if serializer.is_valid():
-                    serializer.save()
-                    updated_attempts.append(serializer.data)
-                else:
-                    return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        if not isinstance(request.data, list):
+            return Response({"error": "Expected a list of data."}, status=status.HTTP_400_BAD_REQUEST)
+        for attempt_data in request.data:
+            if not isinstance(attempt_data, dict) or not attempt_data.get('id'):
+                return Response({"error": "ID is required for each attempt."}, status=status.HTTP_400_BAD_REQUEST)
+
+        serializer = UserAnswerAttemptBulkItemSerializer(data=request.data, many=True)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        validated_data = serializer.validated_data
+
+        attempt_ids = [item['id'] for item in validated_data]
+        attempts = {
+            attempt.id: attempt
+            for attempt in UserAnswerAttempt.objects.filter(id__in=attempt_ids).select_related(
+                'user_quest_attempt', 'question', 'answer'
+            ).prefetch_related('question__answers')
+        }
+        for attempt_id in attempt_ids:
+            if attempt_id not in attempts:
+                return Response({"error": f"UserAnswerAttempt with id {attempt_id} not found."},
+                                status=status.HTTP_404_NOT_FOUND)
+            if not request.user.is_staff and attempts[attempt_id].user_quest_attempt.student_id != request.user.id:
+                return Response({"error": f"UserAnswerAttempt with id {attempt_id} does not belong to you."},
+                                status=status.HTTP_403_FORBIDDEN)
 
-            return Response({"updated_attempts": updated_attempts}, status=status.HTTP_200_OK)
+        changed_attempts = {}
+        for item in validated_data:
+            attempt_instance = attempts[item['id']]
+            for attr in ('user_quest_attempt_id', 'question_id', 'answer_id'):
+                if attr in item and getattr(attempt_instance, attr) != item[attr]:
+                    return Response(
+                        {"error": f"The {attr} of UserAnswerAttempt with id {item['id']} cannot be changed."},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
+            for attr in ('is_selected', 'score_achieved'):
+                if attr in item and getattr(attempt_instance, attr) != item[attr]:
+                    setattr(attempt_instance, attr, item[attr])
+                    changed_attempts[attempt_instance.id] = attempt_instance
+        if changed_attempts:
+            UserAnswerAttempt.objects.bulk_update(list(changed_attempts.values()), ['is_selected', 'score_achieved'])
 
-        return Response({"error": "Expected a list of data."}, status=status.HTTP_400_BAD_REQUEST)
+        updated_attempts = self.get_serializer([attempts[attempt_id] for attempt_id in attempt_ids], many=True).data
+        return Response({"updated_attempts": updated_attempts}, status=status.HTTP_200_OK)
 
 
-class BadgeViewSet(viewsets.ModelViewSet):
+class BadgeViewSet(PaginatedListMixin, viewsets.ModelViewSet):
     queryset = Badge.objects.all().order_by('-id')
     serializer_class = BadgeSerializer
     permission_classes = [IsAuthenticated]
 
 
-class UserQuestBadgeViewSet(viewsets.ModelViewSet):
+class UserQuestBadgeViewSet(PaginatedListMixin, viewsets.ModelViewSet):
     queryset = UserQuestBadge.objects.all().order_by('-id')
     serializer_class = UserQuestBadgeSerializer
     permission_classes = [IsAuthenticated]
@@ -569,11 +553,10 @@ class UserQuestBadgeViewSet(viewsets.ModelViewSet):
     def by_user(self, request):
         user_id = request.query_params.get('user_id')
         queryset = UserQuestBadge.objects.filter(user_quest_attempt__student=user_id).order_by('-id')
-        serializer = UserQuestBadgeSerializer(queryset, many=True)
-        return Response(serializer.data)
+        return self.list_response(queryset, UserQuestBadgeSerializer)
 
 
-class UserCourseBadgeViewSet(viewsets.ModelViewSet):
+class UserCourseBadgeViewSet(PaginatedListMixin, viewsets.ModelViewSet):
     queryset = UserCourseBadge.objects.all().order_by('-id')
     serializer_class = UserCourseBadgeSerializer
     permission_classes = [IsAuthenticated]
@@ -582,11 +565,10 @@ class UserCourseBadgeViewSet(viewsets.ModelViewSet):
     def by_user(self, request):
         user_id = request.query_params.get('user_id')
         queryset = UserCourseBadge.objects.filter(user_course_group_enrollment__student=user_id).order_by('-id')
-        serializer = UserCourseBadgeSerializer(queryset, many=True)
-        return Response(serializer.data)
+        return self.list_response(queryset, UserCourseBadgeSerializer)
 
 
-class DocumentViewSet(viewsets.ModelViewSet):
+class DocumentViewSet(PaginatedListMixin, viewsets.ModelViewSet):
     queryset = Document.objects.all().order_by('-id')
     serializer_class = DocumentSerializer
     permission_classes = [IsAuthenticated]
@@ -595,8 +577,7 @@ class DocumentViewSet(viewsets.ModelViewSet):
     def by_user(self, request):
         user_id = request.query_params.get('user_id')
         queryset = Document.objects.filter(uploaded_by=user_id).order_by('-id')
-        serializer = DocumentSerializer(queryset, many=True)
-        return Response(serializer.data)
+        return self.list_response(queryset, DocumentSerializer)
 
     @action(detail=False, methods=['post'])
     def upload(self, request):
@@ -776,36 +757,31 @@ class AnalyticsPartTwoView(APIView):
         return Response({'user_course_progression': course_quest_completion})
 
     def get_badge_progression(self, user_id):
-        all_badges = Badge.objects.all()
         # Fetch all quest badges and course badges earned by the user
         user_quest_badges = UserQuestBadge.objects.filter(
             user_quest_attempt__student_id=user_id
-        ).select_related('badge')
+        ).values_list('badge_id', flat=True)
         # Fetch all course badges earned by the user
         user_course_badges = UserCourseBadge.objects.filter(
             user_course_group_enrollment__student_id=user_id
-        ).select_related('badge')
-        # Aggregate the badge data
-        badge_aggregation = {
-            badge.id: {
-                'badge_id': badge.id,
-                'badge_name': badge.name,
-                'badge_filename': badge.image.filename if badge.image else None,
-                'count': 0
-            } for badge in all_badges
-        }
-
-        # Increment the count for each badge earned by the user
-        for badge in user_quest_badges:
-            badge_aggregation[badge.badge.id]['count'] += 1
-
-        # Increment the count for each course badge earned by the user
-        for badge in user_course_badges:
-            badge_aggregation[badge.badge.id]['count'] += 1
+        ).values_list('badge_id', flat=True)
+
+        # Count each badge earned by the user, the badges and their images come from the in-process catalogue,
+        # which reloads itself for a badge created by another process since it was loaded
+        badge_aggregation = {}
+        for badge_id in list(user_quest_badges) + list(user_course_badges):
+            if badge_id not in badge_aggregation:
+                badge = badge_catalogue.get_by_id(badge_id)
+                badge_aggregation[badge_id] = {
+                    'badge_id': badge.id,
+                    'badge_name': badge.name,
+                    'badge_filename': badge.image.filename if badge.image else None,
+                    'count': 0
+                }
+            badge_aggregation[badge_id]['count'] += 1
 
-        # Filter out badges with zero count and sort by count in descending order
-        badge_aggregation = [v for v in badge_aggregation.values() if v['count'] > 0]
-        sorted_badge_aggregation = sorted(badge_aggregation, key=lambda x: x['count'], reverse=True)
+        # Sort by count in descending order
+        sorted_badge_aggregation = sorted(badge_aggregation.values(), key=lambda x: (-x['count'], x['badge_id']))
 
         return Response({'user_badge_progression': sorted_badge_aggregation})
 
@@ -827,9 +803,9 @@ class AnalyticsPartThreeView(APIView):
             total_badge_count=F('quest_badge_count') + F('course_badge_count')
         ).order_by('-total_badge_count')[:5]
 
-        # Prefetch related badges to reduce database hits
-        quest_badges = UserQuestBadge.objects.select_related('badge', 'user_quest_attempt__student').all()
-        course_badges = UserCourseBadge.objects.select_related('badge', 'user_course_group_enrollment__student').all()
+        # Prefetch related students to reduce database hits, badges and their images come from the catalogue
+        quest_badges = UserQuestBadge.objects.select_related('user_quest_attempt__student').all()
+        course_badges = UserCourseBadge.objects.select_related('user_course_group_enrollment__student').all()
 
         user_badge_details = []
         for user in top_users:
@@ -837,12 +813,13 @@ class AnalyticsPartThreeView(APIView):
             quest_badges_dict = {}
             for badge in quest_badges:
                 if badge.user_quest_attempt.student == user:
-                    badge_id = badge.badge.id
+                    badge_id = badge.badge_id
                     if badge_id not in quest_badges_dict:
+                        catalogue_badge = badge_catalogue.get_by_id(badge_id)
                         quest_badges_dict[badge_id] = {
                             "badge_id": badge_id,
-                            "badge_name": badge.badge.name,
-                            "badge_filename": badge.badge.image.filename,
+                            "badge_name": catalogue_badge.name,
+                            "badge_filename": catalogue_badge.image.filename,
                             "count": 1
                         }
                     else:
@@ -855,12 +832,13 @@ class AnalyticsPartThreeView(APIView):
             course_badges_dict = {}
             for badge in course_badges:
                 if badge.user_course_group_enrollment.student == user:
-                    badge_id = badge.badge.id
+                    badge_id = badge.badge_id
                     if badge_id not in course_badges_dict:
+                        catalogue_badge = badge_catalogue.get_by_id(badge_id)
                         course_badges_dict[badge_id] = {
                             "badge_id": badge_id,
-                            "badge_name": badge.badge.name,
-                            "badge_filename": badge.badge.image.filename,
+                            "badge_name": catalogue_badge.name,
+                            "badge_filename": catalogue_badge.image.filename,
                             "count": 1
                         }
                     else:
@@ -893,7 +871,7 @@ class AnalyticsPartThreeView(APIView):
         recent_badges_data = []
         record_id = 0
         for badge in recent_badges:
-            badge_name = badge.badge.name
+            badge_name = badge_catalogue.get_by_id(badge.badge_id).name
             awarded_date = badge.awarded_date
             quest_id = None
             quest_name = None
@@ -951,9 +929,7 @@ class AnalyticsPartFourView(APIView):
         ).prefetch_related(
             Prefetch(
                 'groups',
-                queryset=CourseGroup.objects.annotate(
-                    enrolled_students_count=Count('enrolled_students')  # Annotate enrolled students count
-                ).prefetch_related(
+                queryset=CourseGroup.objects.prefetch_related(
                     Prefetch(
                         'quests',
                         queryset=Quest.objects.annotate(
@@ -1017,7 +993,7 @@ class AnalyticsPartFourView(APIView):
             course_groups_data = []
             for group in course.groups.all():
                 group_id = group.id
-                enrolled_students_count = group.enrolled_students_count
+                enrolled_students_count = group.students_enrolled_count
                 enrolled_student_ids = group_to_students.get(group_id, set())
 
                 # Build a list of enrolled students with their usernames
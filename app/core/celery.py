@@ -24,9 +24,11 @@ app.conf.broker_connection_retry_on_startup = True
 
 # Configure Celery beat schedule
 app.conf.beat_schedule = {
-    'check-expired-dates-every-second': {
+    # Quests are expired on time by the ETA tasks scheduled when they are saved,
+    # this sweep schedules quests coming within range and expires any quest that was missed
+    'check-expired-quests-every-hour': {
         'task': 'api.tasks.check_expired_quest',
-        'schedule': timedelta(seconds=10),
+        'schedule': timedelta(hours=1),
     },
 }
 
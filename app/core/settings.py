@@ -64,13 +64,31 @@ REST_FRAMEWORK = {
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
-    )
+    ),
+    # Opt-in, only used when the client sends 'cursor' or 'page_size', see api/pagination.py
+    'DEFAULT_PAGINATION_CLASS': 'api.pagination.KeysetPagination',
+    'PAGE_SIZE': 100,
 }
 
 AZURE_CLIENT_ID = os.environ.get('AZURE_AD_CLIENT_ID')
 AZURE_TENANT_ID = 'common'
 AZURE_AUTHORITY = f'https://login.microsoftonline.com/{AZURE_TENANT_ID}'
 
+# Azure AD signing keys (JWKS) cache, see api/jwks.py
+AZURE_JWKS_URL = os.environ.get('AZURE_JWKS_URL', 'https://login.microsoftonline.com/{tenant_id}/discovery/v2.0/keys')
+AZURE_JWKS_FETCH_TIMEOUT = int(os.environ.get('AZURE_JWKS_FETCH_TIMEOUT', 5))
+AZURE_JWKS_CACHE_TTL = int(os.environ.get('AZURE_JWKS_CACHE_TTL', 60 * 60 * 24))
+AZURE_JWKS_STALE_TTL = int(os.environ.get('AZURE_JWKS_STALE_TTL', 60 * 60 * 24 * 7))
+AZURE_JWKS_MIN_REFRESH_INTERVAL = int(os.environ.get('AZURE_JWKS_MIN_REFRESH_INTERVAL', 60))
+# Tenants whose keys are kept in memory, tenant ids come from unverified tokens so they must be bounded
+AZURE_JWKS_MAX_TENANTS = int(os.environ.get('AZURE_JWKS_MAX_TENANTS', 100))
+# Set to e.g. redis://redis:6379/1 to share the keys across gunicorn workers
+AZURE_JWKS_REDIS_URL = os.environ.get('AZURE_JWKS_REDIS_URL')
+# Number of validated tokens kept in memory per worker, 0 to disable, see api/token_cache.py
+AZURE_TOKEN_CACHE_SIZE = int(os.environ.get('AZURE_TOKEN_CACHE_SIZE', 2048))
+# Seconds an authenticated user is cached for before the users table is read again
+AUTH_USER_CACHE_TTL = int(os.environ.get('AUTH_USER_CACHE_TTL', 60))
+
 
 AUTH_USER_MODEL = 'api.EduquestUser'
 
@@ -227,5 +245,39 @@ CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'Asia/Singapore'
 
+# Cache shared by the web and Celery worker processes, so that a cached user dropped by any of them
+# (see api/signals.py and api/scoring.py) is dropped for all of them.
+# Set CACHE_REDIS_URL to an empty value to run without Redis, each process then has a memory cache of its own
+# and the other processes keep serving a changed user for up to AUTH_USER_CACHE_TTL seconds.
+CACHE_REDIS_URL = os.getenv('CACHE_REDIS_URL', f'redis://{REDIS_HOST}:6379/1')
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': CACHE_REDIS_URL,
+        'KEY_PREFIX': 'eduquest',
+    } if CACHE_REDIS_URL else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+
+
+
+# Quests expiring within this many seconds get an ETA task that expires them on time.
+# The hourly check_expired_quest sweep schedules the rest as they come within range, and expires any quest it finds overdue.
+QUEST_EXPIRY_SCHEDULE_HORIZON = int(os.getenv('QUEST_EXPIRY_SCHEDULE_HORIZON', 60 * 65))
+# Redis redelivers tasks that are not acknowledged within the visibility timeout, including ETA tasks waiting on a worker,
+# so it must be longer than the expiry horizon
+CELERY_BROKER_TRANSPORT_OPTIONS = {'visibility_timeout': 60 * 60 * 2}
+
+# Seconds a process keeps its badge catalogue before reloading it, see api/badges.py.
+# Badge changes clear the catalogue of the process that made them right away, other processes pick them up after this.
+BADGE_CATALOGUE_TTL = int(os.getenv('BADGE_CATALOGUE_TTL', 300))
 
+# Attempts submitted within this many seconds of each other are scored and awarded badges by a single task,
+# see api/submissions.py. Set to 0 to process every submission with a task of its own.
+SUBMISSION_BATCH_WINDOW = int(os.getenv('SUBMISSION_BATCH_WINDOW', 2))
 
+# Seconds the user who queued a quest import job is remembered for, only they and staff users can read its status.
+# Celery keeps the result of the job for a day by default.
+IMPORT_JOB_OWNER_TTL = int(os.getenv('IMPORT_JOB_OWNER_TTL', 60 * 60 * 24))